@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from gpx import *
+import xml_backend
+
+SIZES = [10000, 100000, 1000000]
+
+HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx creator="StravaGPX" version="1.1" xmlns="http://www.topografix.com/GPX/1/1"'
+    ' xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+    ' xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd">\n'
+    ' <metadata>\n'
+    '  <time>{time}</time>\n'
+    ' </metadata>\n'
+    ' <trk>\n'
+    '  <name>Ride</name>\n'
+    '  <type>1</type>\n'
+    '  <trkseg>\n'
+)
+FOOTER = (
+    '  </trkseg>\n'
+    ' </trk>\n'
+    '</gpx>\n'
+)
+TRKPT = (
+    '   <trkpt lat="{:.7f}" lon="{:.7f}">\n'
+    '    <ele>{:.1f}</ele>\n'
+    '    <time>{}</time>\n'
+)
+EXTENSIONS = (
+    '    <extensions>\n'
+    '     <gpxtpx:TrackPointExtension>\n'
+    '      <gpxtpx:atemp>{}</gpxtpx:atemp>\n'
+    '      <gpxtpx:hr>{}</gpxtpx:hr>\n'
+    '      <gpxtpx:cad>{}</gpxtpx:cad>\n'
+    '     </gpxtpx:TrackPointExtension>\n'
+    '    </extensions>\n'
+)
+START = datetime.datetime(2021, 3, 7, 0, 29, 9)
+
+
+################################################################################
+# Synthetic tracks
+#
+# A random walk laid out like the Strava exports of fixtures/, one point
+# every 1 to 3 seconds. The same seed always gives the same file.
+###
+
+def generate_gpx(file_name, n, ms=False, extensions=True, seed=0, chunk_size=65536):
+    rng = np.random.default_rng(seed)
+    lat = 22.349095 + np.cumsum(rng.normal(0, 3e-5, n))
+    lon = 114.194624 + np.cumsum(rng.normal(1e-5, 3e-5, n))
+    ele = 122.9 + np.cumsum(rng.normal(0, 0.4, n))
+    steps = rng.choice([1, 1, 1, 2, 3], n) * timestamp.SECOND
+    time = timestamp.epoch_of(START) + np.cumsum(steps) - steps[0]
+    if ms:
+        time += rng.integers(0, 1000, n) * 1000
+    atemp = rng.integers(20, 31, n)
+    hr = rng.integers(90, 171, n)
+    cad = rng.integers(0, 91, n)
+
+    layout = TRKPT + (EXTENSIONS if extensions else '') + '   </trkpt>\n'
+    with open(file_name, 'w', encoding='utf-8') as out:
+        out.write(HEADER.format(time=timestamp.format_time(time[0] if n else epoch_of(START), ms)))
+        for start in range(0, n, chunk_size):
+            rows = slice(start, start + chunk_size)
+            texts = timestamp.format_times(time[rows], ms)
+            out.write(''.join(
+                layout.format(*values)
+                for values in zip(
+                    lat[rows].tolist(), lon[rows].tolist(), ele[rows].tolist(), texts,
+                    atemp[rows].tolist(), hr[rows].tolist(), cad[rows].tolist()
+                )
+            ))
+        out.write(FOOTER)
+
+
+# file of the given shape in data_dir, generated on first use
+def synthetic_gpx(data_dir, n, ms, extensions):
+    name = f'synthetic_{n}{"_ms" if ms else ""}{"_ext" if extensions else ""}.gpx'
+    file_name = os.path.join(data_dir, name)
+    if not os.path.exists(file_name):
+        generate_gpx(file_name, n, ms=ms, extensions=extensions)
+    return file_name
+
+
+################################################################################
+# Cases
+#
+# Every case is (name, setup, run): setup(file_name) is not timed, its
+# result is given to run.
+###
+
+def load(file_name):
+    return GPX(file_name)
+
+
+def trkpts_of(file_name):
+    return GPX(file_name).trkpts
+
+
+def middle_third(gpx):
+    first = gpx.trkpts[len(gpx.trkpts) // 3].time()
+    last = gpx.trkpts[2 * len(gpx.trkpts) // 3].time()
+    return first, last
+
+
+def bench_trkpts_between(gpx):
+    first, last = middle_third(gpx)
+    return gpx.trkpts_between(first, last)
+
+
+def bench_set_new_datetime(gpx):
+    gpx.set_new_datetime(gpx.get_meta_datetime() + datetime.timedelta(days=1))
+
+
+def bench_set_by_speed(gpx):
+    first, last = middle_third(gpx)
+    set_by_speed(gpx, 11, first, last, rng=0)
+
+
+# a hundred lookups along the track, the first one builds the index
+def bench_nearest_trkpts(gpx):
+    store = gpx.store
+    for row in range(0, len(store), max(len(store) // 100, 1)):
+        gpx.nearest_trkpts(store.lat[row] + 0.0001, store.lon[row], 5)
+
+
+def bench_write(gpx):
+    with tempfile.TemporaryDirectory() as directory:
+        gpx.write(os.path.join(directory, 'out.gpx'))
+
+
+CASES = [
+    ('parse', lambda file_name: file_name, load),
+    ('load_trkpts', load, lambda gpx: gpx.load_trkpts()),
+    ('distance_of', trkpts_of, distance_of),
+    ('elevation_of', trkpts_of, elevation_of),
+    ('descent_of', trkpts_of, descent_of),
+    ('time_spent_of', trkpts_of, time_spent_of),
+    ('effort_points_of', trkpts_of, effort_points_of),
+    ('eph_of', trkpts_of, eph_of),
+    ('speed_of', trkpts_of, speed_of),
+    ('pace_of', trkpts_of, pace_of),
+    ('summary_of', trkpts_of, summary_of),
+    ('trkpts_between', load, bench_trkpts_between),
+    ('set_new_datetime', load, bench_set_new_datetime),
+    ('set_by_speed', load, bench_set_by_speed),
+    ('write', load, bench_write),
+    ('extensions', load, lambda gpx: gpx.extensions()),
+    ('remove_extension', load, lambda gpx: gpx.remove_extension()),
+    ('simplify', load, lambda gpx: gpx.simplify(2)),
+    ('nearest_trkpts', load, bench_nearest_trkpts),
+]
+
+
+################################################################################
+# Runs
+###
+
+# best wall time of `repeat` runs, each on a fresh setup
+def time_case(setup, run, file_name, repeat):
+    best = None
+    for _ in range(repeat):
+        value = setup(file_name)
+        started = time.perf_counter()
+        run(value)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmarks(data_dir, sizes=SIZES, repeat=3, cases=None, out=sys.stderr):
+    results = []
+    for n in sizes:
+        for ms in (False, True):
+            for extensions in (False, True):
+                file_name = synthetic_gpx(data_dir, n, ms, extensions)
+                for name, setup, run in CASES:
+                    if cases and name not in cases:
+                        continue
+                    seconds = time_case(setup, run, file_name, repeat)
+                    results.append({
+                        'case': name,
+                        'points': n,
+                        'ms': ms,
+                        'extensions': extensions,
+                        'seconds': seconds,
+                    })
+                    print(f'{key_of(results[-1]):<45} {seconds * 1000:>10.2f} ms', file=out)
+    return results
+
+
+def key_of(result):
+    return f"{result['case']}/{result['points']}{'/ms' if result['ms'] else ''}{'/ext' if result['extensions'] else ''}"
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'backend': xml_backend.get_backend().name,
+        'machine': platform.machine(),
+    }
+
+
+# cases of `current` slower than in `baseline` by more than `threshold`
+# (0.2 = 20%): List[(key, baseline seconds, current seconds)]
+def regressions(baseline, current, threshold=0.2):
+    before = {key_of(result): result['seconds'] for result in baseline['results']}
+    slower = []
+    for result in current['results']:
+        key = key_of(result)
+        if key in before and result['seconds'] > before[key] * (1 + threshold):
+            slower.append((key, before[key], result['seconds']))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the GPX operations on synthetic tracks.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cases', nargs='+', choices=[name for name, _, _ in CASES])
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'gpx_benchmark'))
+    parser.add_argument('--output', help='JSON results, stdout by default')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        'environment': environment(),
+        'repeat': args.repeat,
+        'results': run_benchmarks(args.data_dir, args.sizes, args.repeat, args.cases),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+
+    if args.compare:
+        with open(args.compare) as previous:
+            slower = regressions(json.load(previous), report, args.threshold)
+        for key, before, after in slower:
+            print(f'REGRESSION {key}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms', file=sys.stderr)
+        return 1 if slower else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
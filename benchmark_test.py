@@ -0,0 +1,43 @@
+import io
+from benchmark import *
+
+
+def test_generate_gpx(tmp_path):
+    file_name = str(tmp_path / 'track.gpx')
+    generate_gpx(file_name, 50, ms=True, extensions=True, seed=3)
+    gpx = GPX(file_name)
+
+    assert len(gpx.trkpts) == 50
+    assert gpx.ms
+    assert gpx.get_meta_datetime() == gpx.trkpts[0].time()
+    assert gpx.trkpts[0].xml_element.find(f'{gpx.namespace}extensions') is not None
+
+    generate_gpx(str(tmp_path / 'again.gpx'), 50, ms=True, extensions=True, seed=3)
+    assert (tmp_path / 'again.gpx').read_bytes() == (tmp_path / 'track.gpx').read_bytes()
+
+    generate_gpx(file_name, 50, ms=False, extensions=False)
+    gpx = GPX(file_name)
+    assert not gpx.ms
+    assert gpx.trkpts[0].xml_element.find(f'{gpx.namespace}extensions') is None
+
+
+def test_run_benchmarks(tmp_path):
+    results = run_benchmarks(str(tmp_path), sizes=[60], repeat=1, out=io.StringIO())
+
+    assert len(results) == 4 * len(CASES)
+    assert {result['case'] for result in results} == {name for name, _, _ in CASES}
+    assert all(result['seconds'] >= 0 for result in results)
+
+
+def test_regressions():
+    baseline = {'results': [
+        {'case': 'parse', 'points': 10, 'ms': False, 'extensions': False, 'seconds': 1.0},
+        {'case': 'write', 'points': 10, 'ms': False, 'extensions': False, 'seconds': 1.0},
+    ]}
+    current = {'results': [
+        {'case': 'parse', 'points': 10, 'ms': False, 'extensions': False, 'seconds': 1.1},
+        {'case': 'write', 'points': 10, 'ms': False, 'extensions': False, 'seconds': 1.5},
+        {'case': 'write', 'points': 20, 'ms': False, 'extensions': False, 'seconds': 9.0},
+    ]}
+
+    assert regressions(baseline, current) == [('write/10', 1.0, 1.5)]
@@ -0,0 +1,214 @@
+import collections
+import concurrent.futures
+import glob
+import os
+import sqlite3
+import numpy as np
+
+import scanner
+import timestamp
+from track_store import NO_TIME
+
+# of the table layout, a catalog of another version is indexed again
+VERSION = 1
+
+# path: absolute; size, mtime_ns: of the file when it was indexed
+# meta_time, start_time, end_time: datetime of the metadata, the earliest
+#   and the latest trkpt, None when there is no such time
+# min_lat, min_lon, max_lat, max_lon: bounding box of the trkpts, None
+#   without trkpt
+# points: number of trkpts
+# distance, elevation, descent, time_spent, eph: see metrics.Summary
+Record = collections.namedtuple('Record', [
+    'path',
+    'size',
+    'mtime_ns',
+    'meta_time',
+    'start_time',
+    'end_time',
+    'min_lat',
+    'min_lon',
+    'max_lat',
+    'max_lon',
+    'points',
+    'distance',
+    'elevation',
+    'descent',
+    'time_spent',
+    'eph',
+])
+
+# times are stored as microsecond since epoch
+TIMES = ('meta_time', 'start_time', 'end_time')
+TYPES = {'path': 'TEXT PRIMARY KEY', 'min_lat': 'REAL', 'min_lon': 'REAL', 'max_lat': 'REAL', 'max_lon': 'REAL',
+         'distance': 'REAL', 'elevation': 'REAL', 'descent': 'REAL', 'time_spent': 'REAL', 'eph': 'REAL'}
+# columns of the min_ and max_ filters of Catalog.query
+RANGES = ('size', 'points', 'distance', 'elevation', 'descent', 'time_spent', 'eph')
+
+# indexed, unchanged, removed: numbers of files
+# failed: List[(path, error)], files that could not be read, left out
+IndexReport = collections.namedtuple('IndexReport', ['indexed', 'unchanged', 'removed', 'failed'])
+
+
+################################################################################
+# Catalog
+#
+# Summaries of every GPX file under a directory in a SQLite database, so
+# that questions over a whole library ("rides of last month with more than
+# 1000 m of ascent") are answered from the database, without reading the
+# files.
+#
+# Indexing again only reads the files whose size or mtime changed since
+# they were indexed, and forgets the ones which are gone. Files are read
+# by the scanner (GPX when they are laid out otherwise), on `workers`
+# processes.
+###
+
+class Catalog:
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.create()
+
+    def create(self):
+        version, = self.connection.execute('PRAGMA user_version').fetchone()
+        if version == VERSION:
+            return
+
+        columns = ', '.join(f"{name} {TYPES.get(name, 'INTEGER')}" for name in Record._fields)
+        with self.connection:
+            self.connection.execute('DROP TABLE IF EXISTS files')
+            self.connection.execute(f'CREATE TABLE files ({columns})')
+            for name in ('start_time', 'distance', 'elevation'):
+                self.connection.execute(f'CREATE INDEX files_{name} ON files ({name})')
+            self.connection.execute(f'PRAGMA user_version = {VERSION}')
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        count, = self.connection.execute('SELECT COUNT(*) FROM files').fetchone()
+        return count
+
+    # index the .gpx files under directory, see IndexReport
+    # workers: processes, 1 to run inline
+    def index(self, directory, workers=None):
+        directory = os.path.abspath(directory)
+        files = sorted(glob.glob(os.path.join(directory, '**', '*.gpx'), recursive=True))
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self.connection.execute('SELECT path, size, mtime_ns FROM files')
+            if path.startswith(directory + os.sep)
+        }
+
+        changed = []
+        for path in files:
+            status = os.stat(path)
+            if known.get(path) != (status.st_size, status.st_mtime_ns):
+                changed.append(path)
+        removed = sorted(set(known) - set(files))
+
+        workers = workers or os.cpu_count()
+        if workers <= 1 or len(changed) <= 1:
+            results = [read_row(path) for path in changed]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(read_row, changed, chunksize=8))
+
+        records = [record for record, _ in results if record is not None]
+        failed = [(path, error) for path, (record, error) in zip(changed, results) if record is None]
+        placeholders = ', '.join('?' * len(Record._fields))
+        with self.connection:
+            self.connection.executemany(f'INSERT OR REPLACE INTO files VALUES ({placeholders})', records)
+            # a file which cannot be read any more is not kept with its old summary
+            gone = removed + [path for path, _ in failed]
+            self.connection.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in gone])
+
+        return IndexReport(len(records), len(files) - len(changed), len(removed), failed)
+
+    # Record of file_name, None when it is not indexed
+    def get(self, file_name):
+        row = self.connection.execute(
+            'SELECT * FROM files WHERE path = ?', (os.path.abspath(file_name),)
+        ).fetchone()
+        return None if row is None else record_of(row)
+
+    # List[Record] matching every filter given, ordered by order_by
+    # start, end: datetime, start_time in [start, end)
+    # bbox: (min_lat, min_lon, max_lat, max_lon), files with a trkpt box
+    #   overlapping it
+    # ranges: min_<column>=value and max_<column>=value, bounds included,
+    #   for the columns of RANGES: query(min_elevation=1000)
+    def query(self, start=None, end=None, bbox=None, order_by='start_time', **ranges):
+        if order_by not in Record._fields:
+            raise ValueError(f'unknown column {order_by!r}')
+
+        conditions = []
+        values = []
+        if start is not None:
+            conditions.append('start_time >= ?')
+            values.append(timestamp.epoch_of(start))
+        if end is not None:
+            conditions.append('start_time < ?')
+            values.append(timestamp.epoch_of(end))
+        if bbox is not None:
+            conditions.append('min_lat <= ? AND max_lat >= ? AND min_lon <= ? AND max_lon >= ?')
+            min_lat, min_lon, max_lat, max_lon = bbox
+            values += [max_lat, min_lat, max_lon, min_lon]
+        for name, value in ranges.items():
+            bound, _, column = name.partition('_')
+            if bound not in ('min', 'max') or column not in RANGES:
+                raise ValueError(f'unknown filter {name!r}, expected min_ or max_ of {RANGES}')
+            conditions.append(f"{column} {'>=' if bound == 'min' else '<='} ?")
+            values.append(value)
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self.connection.execute(f'SELECT * FROM files{where} ORDER BY {order_by}, path', values)
+        return [record_of(row) for row in rows]
+
+
+# (row of file_name as stored, None) or (None, error message), in a
+# worker process
+def read_row(file_name):
+    try:
+        return row_of(file_name), None
+    except Exception as error:
+        return None, f'{type(error).__name__}: {error}'
+
+
+def row_of(file_name):
+    status = os.stat(file_name)
+    meta_time, segments = scanner.read_file(file_name)
+    summary = scanner.summary_of_segments(segments)
+
+    lat = np.concatenate([columns[0] for columns in segments]) if segments else np.zeros(0)
+    lon = np.concatenate([columns[1] for columns in segments]) if segments else np.zeros(0)
+    time = np.concatenate([columns[3] for columns in segments]) if segments else np.zeros(0, dtype=np.int64)
+    time = time[time != NO_TIME]
+    box = (None,) * 4 if len(lat) == 0 else (
+        float(np.min(lat)), float(np.min(lon)), float(np.max(lat)), float(np.max(lon))
+    )
+
+    return (
+        os.path.abspath(file_name),
+        status.st_size,
+        status.st_mtime_ns,
+        None if meta_time is None else timestamp.parse_time(meta_time),
+        int(time.min()) if len(time) else None,
+        int(time.max()) if len(time) else None,
+        *box,
+        len(lat),
+        summary.distance,
+        summary.elevation,
+        summary.descent,
+        summary.time_spent,
+        summary.eph,
+    )
+
+
+def record_of(row):
+    record = Record(*row)
+    return record._replace(**{
+        name: None if getattr(record, name) is None else timestamp.datetime_of(getattr(record, name))
+        for name in TIMES
+    })
@@ -0,0 +1,109 @@
+import datetime
+import io
+import os
+import shutil
+import pytest
+from gpx import *
+from catalog import Catalog
+from main import index, parse_args
+
+
+@pytest.fixture
+def library(tmp_path):
+    directory = tmp_path / 'library'
+    (directory / '2021').mkdir(parents=True)
+    shutil.copy('fixtures/short_track.gpx', directory / '2021' / 'short_track.gpx')
+    shutil.copy('fixtures/multi_track.gpx', directory / 'multi_track.gpx')
+    return directory
+
+
+def test_without_meta_time(tmp_path, library):
+    shutil.copy('fixtures/no_meta_time.gpx', library / 'no_meta_time.gpx')
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    report = catalog.index(str(library), workers=1)
+    assert (report.indexed, report.failed) == (3, [])
+
+    record = catalog.get(str(library / 'no_meta_time.gpx'))
+    assert record.meta_time is None
+    assert record.points == 30
+    assert record.start_time == GPX('fixtures/no_meta_time.gpx').trkpts[0].time()
+    catalog.close()
+
+
+def test_index(tmp_path, library):
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    report = catalog.index(str(library), workers=1)
+    assert (report.indexed, report.unchanged, report.removed, report.failed) == (2, 0, 0, [])
+
+    file_name = str(library / '2021' / 'short_track.gpx')
+    gpx = GPX(file_name)
+    record = catalog.get(file_name)
+    summary = gpx.summary()
+    assert record.points == 30
+    assert record.distance == pytest.approx(summary.distance)
+    assert record.elevation == pytest.approx(summary.elevation)
+    assert record.descent == pytest.approx(summary.descent)
+    assert record.time_spent == summary.time_spent
+    assert record.eph == pytest.approx(summary.eph)
+    assert record.meta_time == gpx.get_meta_datetime()
+    assert record.start_time == gpx.trkpts[0].time()
+    assert record.end_time == gpx.trkpts[-1].time()
+    assert record.min_lat == min(trkpt.lat() for trkpt in gpx.trkpts)
+    assert record.max_lon == max(trkpt.lon() for trkpt in gpx.trkpts)
+
+    multi = GPX(str(library / 'multi_track.gpx'))
+    assert catalog.get(str(library / 'multi_track.gpx')).distance == pytest.approx(multi.summary().distance)
+    catalog.close()
+
+
+def test_index_again(tmp_path, library):
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    catalog.index(str(library), workers=1)
+    assert catalog.index(str(library), workers=1)[:3] == (0, 2, 0)
+
+    file_name = library / '2021' / 'short_track.gpx'
+    gpx = GPX(str(file_name))
+    gpx.remove_trkpts(gpx.trkpts[10:])
+    gpx.write(str(file_name))
+    os.unlink(library / 'multi_track.gpx')
+    (library / 'broken.gpx').write_text('<gpx')
+
+    report = catalog.index(str(library), workers=1)
+    assert report[:3] == (1, 0, 1)
+    assert [path for path, _ in report.failed] == [str(library / 'broken.gpx')]
+    assert catalog.get(str(file_name)).points == 10
+    assert len(catalog) == 1
+    catalog.close()
+
+    # the database keeps the summaries
+    assert Catalog(str(tmp_path / 'catalog.db')).get(str(file_name)).points == 10
+
+
+def test_query(tmp_path, library):
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    catalog.index(str(library), workers=1)
+    short = str(library / '2021' / 'short_track.gpx')
+    multi = str(library / 'multi_track.gpx')
+
+    everything = [record.path for record in catalog.query(order_by='path')]
+    assert everything == sorted([short, multi])
+    assert [record.path for record in catalog.query(min_points=30, max_distance=130)] == [multi]
+    assert [record.path for record in catalog.query(min_distance=130, max_eph=100)] == [short]
+    assert catalog.query(min_points=31) == []
+    assert catalog.query(start=datetime.datetime(2021, 3, 8)) == []
+    assert len(catalog.query(start=datetime.datetime(2021, 3, 1), end=datetime.datetime(2021, 4, 1))) == 2
+    assert catalog.query(bbox=(0, 0, 1, 1)) == []
+    assert len(catalog.query(bbox=(22.349, 114.194, 22.35, 114.195))) >= 1
+
+    with pytest.raises(ValueError):
+        catalog.query(min_power=100)
+    with pytest.raises(ValueError):
+        catalog.query(order_by='path; DROP TABLE files')
+
+
+def test_main_index(tmp_path, library):
+    args = parse_args(['index', str(library), '--catalog', str(tmp_path / 'catalog.db'), '-w', '1'])
+    assert index(args, io.StringIO()) == 0
+    out = io.StringIO()
+    assert index(args, out) == 0
+    assert out.getvalue().startswith('0 indexed, 2 unchanged, 0 removed, 2 files')
@@ -1,10 +1,20 @@
 import xml.etree.ElementTree as ET
 from haversine import haversine
 import datetime
+import concurrent.futures
 import copy
+import contextlib
+import numpy as np
 import random
-from time import sleep
 from obfuscation import *
+from track_store import TrackStore, TimeIndex, NO_TIME, epoch_of, datetime_of, columns_of
+import metrics
+import profiling
+import serializer
+import simplify
+import spatial_index
+import timestamp
+import xml_backend
 
 ET.register_namespace('', "http://www.topografix.com/GPX/1/0")
 ET.register_namespace('', "http://www.topografix.com/GPX/1/1")
@@ -13,6 +23,13 @@ ET.register_namespace('gte', "http://www.gpstrackeditor.com/xmlschemas/General/1
 
 SAMPLE_RATE = 1
 
+# in degree, see GPX.randomize_lat_and_lon
+LOCATION_OFFSET = 0.000001
+
+# Garmin TrackPointExtension, the children read by GPX.extensions
+TRACK_POINT_EXTENSION = '{http://www.garmin.com/xmlschemas/TrackPointExtension/v1}'
+EXTENSIONS = ('hr', 'atemp', 'cad')
+
 
 ################################################################################
 # Aggregation method
@@ -27,12 +44,10 @@ def distance_between(trkpt1, trkpt2):
 
 
 # in meter
+@profiling.timed
 def distance_of(trkpts):
-    total = 0
-
-    for i in range(0, len(trkpts)-SAMPLE_RATE, SAMPLE_RATE):
-        total += distance_between(trkpts[i], trkpts[i+SAMPLE_RATE])
-    return total
+    lat, lon, _, _ = columns_of(trkpts)
+    return metrics.total(metrics.distances(lat, lon, SAMPLE_RATE))
 
 
 # in meter
@@ -41,54 +56,58 @@ def elevation_diff(trkpt1, trkpt2):
 
 
 # in meter
+@profiling.timed
 def elevation_of(trkpts):
-    total = 0
-    for i in range(0, len(trkpts)-SAMPLE_RATE, SAMPLE_RATE):
-        diff = elevation_diff(trkpts[i], trkpts[i+SAMPLE_RATE])
-        if diff > 0:
-            total += diff
-    return total
+    _, _, ele, _ = columns_of(trkpts)
+    return metrics.ascent_of_diffs(metrics.elevation_diffs(ele, SAMPLE_RATE))
 
 # in meter
+@profiling.timed
 def descent_of(trkpts):
-    total = 0
-    for i in range(0, len(trkpts)-SAMPLE_RATE, SAMPLE_RATE):
-        diff = elevation_diff(trkpts[i], trkpts[i+SAMPLE_RATE])
-        if diff < 0:
-            total += abs(diff)
-    return total
+    _, _, ele, _ = columns_of(trkpts)
+    return metrics.descent_of_diffs(metrics.elevation_diffs(ele, SAMPLE_RATE))
 
 
 # in second
+@profiling.timed
 def time_spent_of(trkpts):
-    return trkpts[-1].time().timestamp() - trkpts[0].time().timestamp()
+    _, _, _, time = columns_of(trkpts)
+    return metrics.time_span(time)
+
 
+# all the metrics below in one pass, see metrics.Summary
+@profiling.timed
+def summary_of(trkpts):
+    return metrics.summarize(*columns_of(trkpts), sample_rate=SAMPLE_RATE)
+
+
+@profiling.timed
 def effort_points_of(trkpts):
-    distance = distance_of(trkpts)
-    elevation = elevation_of(trkpts)
-    return (distance / 1000) + (elevation / 100)
+    return summary_of(trkpts).effort_points
 
 
+@profiling.timed
 def eph_of(trkpts):
-    ep = effort_points_of(trkpts)
-    time_spent = time_spent_of(trkpts)
-
-    return ep / (time_spent / 60 / 60)
+    summary = summary_of(trkpts)
+    return summary.effort_points / (summary.time_spent / 60 / 60)
 
 
+@profiling.timed
 def speed_of(trkpts):
-    distance = distance_of(trkpts)
-    time_spent = time_spent_of(trkpts)
-    return (distance / 1000) / (time_spent / 60 / 60)
+    summary = summary_of(trkpts)
+    return (summary.distance / 1000) / (summary.time_spent / 60 / 60)
 
 
+@profiling.timed
 def pace_of(trkpts):
-    time_spent = time_spent_of(trkpts)
-    distance = distance_of(trkpts)
-    return (time_spent / (distance / 1000)/ 60)
+    summary = summary_of(trkpts)
+    return (summary.time_spent / (summary.distance / 1000)/ 60)
 
 
-def set_by_speed(gpx, speed, time_start, time_end=None):
+# rng: numpy.random.Generator or seed
+@profiling.timed
+def set_by_speed(gpx, speed, time_start, time_end=None, rng=None):
+    rng = np.random.default_rng(rng)
     h, t = gpx.trkpts_between_idx(time_start, time_end)
 
     former_trkpts = gpx.trkpts[0:h]
@@ -96,18 +115,19 @@ def set_by_speed(gpx, speed, time_start, time_end=None):
     latter_trkpts = gpx.trkpts[t+1:]
 
     # generate new section
-    new_target_trkpts = new_trkpts_by_speed(target_trkpts, speed)
-    random_points_delete(new_target_trkpts)
+    new_target_trkpts = new_trkpts_by_speed(target_trkpts, speed, rng=rng)
+    random_points_delete(new_target_trkpts, rng=rng)
 
     # calculate the time_diff
     time_diff_in_seconds = 0
 
     shift_trkpts_time(latter_trkpts, time_diff_in_seconds)
 
-    gpx.remove_all()
-    gpx.append_trkpts(former_trkpts)
-    gpx.append_trkpts(new_target_trkpts)
-    gpx.append_trkpts(latter_trkpts)
+    with gpx.batch():
+        gpx.remove_all()
+        gpx.append_trkpts(former_trkpts)
+        gpx.append_trkpts(new_target_trkpts)
+        gpx.append_trkpts(latter_trkpts)
 
 
 def find_mid_point(ax, ay, bx, by, percentile):
@@ -116,301 +136,773 @@ def find_mid_point(ax, ay, bx, by, percentile):
     return (x, y)
 
 
-def random_points_delete(trkpts):
-    pt_to_remove = 0
-    for trkpt in list(trkpts):
-        if pt_to_remove > 0:
-            trkpts.remove(trkpt)
-            pt_to_remove -= 1
-            continue
-
-        lottery = random.randint(1, 1200)
-
-        if lottery == 1:
-            pt_to_remove += random.randint(6, 10)
-        elif lottery <= 10:
-            pt_to_remove += random.randint(2, 5)
-        elif lottery <= 100:
-            pt_to_remove += 1
-
-
-def new_trkpts_by_speed(track, target_speed):
-    def trkpt_factory(lat=0, lon=0, ele=0, time=datetime.datetime.now()):
-        model = track[0].deep_copy()
-        model.set_lat(lat)
-        model.set_lon(lon)
-        model.set_ele(ele)
-        model.set_time(time)
-
-        return model
-
-    def get_point(a, b, current_distance, target_distance):
-        ab = distance_between(a, b)
-        ac = current_distance - target_distance
-        percentile = (ac / ab)
-        lon, lat = find_mid_point(a.lon(), a.lat(), b.lon(), b.lat(), percentile)
-        return trkpt_factory(
-            lat=lat,
-            lon=lon,
-            ele=a.ele()
-        )
+# in place, see obfuscation.thinning_mask
+@profiling.timed
+def random_points_delete(trkpts, rng=None):
+    trkpts[:] = thin(trkpts, rng=rng)
 
-    def get_target_distances():
-        actual_speed = speed_of(track)
-        ratio = actual_speed / target_speed
-        n = len(track) * ((actual_speed / target_speed) + 1.2)
 
-        target_speeds = random_target_speeds(int(n), base=target_speed, height_scale=1.5)
-        return list(map(lambda x: x / 3.6, target_speeds))
+# Resample the track at the distances walked each second at random speeds
+# around target_speed; new points are one second apart from track[0].
+@profiling.timed
+def new_trkpts_by_speed(track, target_speed, rng=None):
+    lat, lon, ele, time = columns_of(track)
 
-    target_distances = get_target_distances()
+    actual_speed = speed_of(track)
+    n = len(track) * ((actual_speed / target_speed) + 1.2)
+    target_speeds = random_target_speeds(int(n), base=target_speed, height_scale=1.5, rng=rng)
+    steps = np.maximum(target_speeds / 3.6, 0)
 
-    new_trkpts = []
-    new_trkpts.append(track[0].deep_copy())
+    new_lat, new_lon, new_ele = metrics.positions_at(lat, lon, ele, np.cumsum(steps))
+    new_time = time[0] + timestamp.SECOND * np.arange(1, len(new_lat) + 1, dtype=np.int64)
 
-    distance_idx = 0
-    track_idx = 1
-    points_to_cross = [new_trkpts[-1]]
+    first = track[0].deep_copy()
+    return [first] + new_trkpts(first, new_lat, new_lon, new_ele, new_time)
 
-    while(track_idx < len(track)):
-        points_to_cross.append(track[track_idx])
 
-        current_distance = distance_of(points_to_cross)
+# TrackPoints over a new store, the XML elements are laid out like template.
+# Children other than ele and time (extensions) are copies of those of the
+# template, an edit of one trkpt stays its own.
+@profiling.timed
+def new_trkpts(template, lat, lon, ele, time):
+    model = template.xml_element
+    ele_tag = f'{template.namespace}ele'
+    time_tag = f'{template.namespace}time'
+    model_ele = model.find(ele_tag)
+    model_time = model.find(time_tag)
+    others = [child for child in model if child.tag not in (ele_tag, time_tag)]
 
-        if current_distance == target_distances[distance_idx]: # alright, just accept the next_pt
-            new_trkpts.append(track[track_idx].deep_copy())
-            track_idx += 1
-            points_to_cross = [new_trkpts[-1]]
+    elements = []
+    for lat_value, lon_value, ele_value, time_text in zip(
+        lat.tolist(), lon.tolist(), ele.tolist(), timestamp.format_times(time, template.ms)
+    ):
+        element = xml_backend.make_element(model, model.tag, {'lat': str(lat_value), 'lon': str(lon_value)})
+        element.text = model.text
+        element.tail = model.tail
+        ele_element = xml_backend.make_element(model, ele_tag)
+        ele_element.text = str(ele_value)
+        ele_element.tail = model_ele.tail
+        time_element = xml_backend.make_element(model, time_tag)
+        time_element.text = time_text
+        time_element.tail = model_time.tail
+        element.extend([ele_element, time_element, *xml_backend.copied_children(others)])
+        elements.append(element)
+
+    store = TrackStore(
+        np.array(lat, dtype=np.float64),
+        np.array(lon, dtype=np.float64),
+        np.array(ele, dtype=np.float64),
+        np.array(time, dtype=np.int64),
+        elements
+    )
+    return [
+        TrackPoint(element, template.ms, template.lat_p, template.lon_p, store=store, row=row)
+        for row, element in enumerate(elements)
+    ]
+
+
+@profiling.timed
+def shift_trkpts_time(trkpts, time_in_second):
+    shift_trkpts_epoch(trkpts, round(time_in_second * timestamp.SECOND))
 
-        elif current_distance < target_distances[distance_idx]:
-            track_idx += 1
 
-        elif current_distance > target_distances[distance_idx]:
-            new_trkpt = get_point(
-                points_to_cross[-1],
-                points_to_cross[-2],
-                current_distance,
-                target_distances[distance_idx]
-            )
-            new_trkpt.set_time(new_trkpts[-1].time() + datetime.timedelta(seconds=1))
-            new_trkpts.append(new_trkpt)
-            points_to_cross = [new_trkpts[-1]]
-            distance_idx += 1
-        else:
-            raise 'DISASTER!'
+# shift by an int number of microsecond, in bulk when the trkpts share a store
+@profiling.timed
+def shift_trkpts_epoch(trkpts, delta):
+    if not trkpts:
+        return
 
-    return new_trkpts
+    store = trkpts[0].store
+    if not all(trkpt.store is store for trkpt in trkpts):
+        for trkpt in trkpts:
+            trkpt.shift_epoch(delta)
+        return
 
+    ms = trkpts[0].ms
+    rows = np.array([trkpt.row for trkpt in trkpts if store.time[trkpt.row] != NO_TIME], dtype=np.intp)
+    epochs = store.time[rows] + delta
+    if not ms:
+        epochs -= epochs % timestamp.SECOND
+    store.time[rows] = epochs
+    store.changed(int(rows.min()) if len(rows) else 0)
 
-def shift_trkpts_time(trkpts, time_in_second):
-    for trkpt in trkpts:
-        trkpt.shift_time(time_in_second)
+    time_tag = f'{trkpts[0].namespace}time'
+    for row, text in zip(rows, timestamp.format_times(epochs, ms)):
+        store.elements[row].find(time_tag).text = text
 
 
 class GPX:
+    @profiling.timed
     def __init__(
         self,
         file_name,
         lat_p=-1,
         lon_p=-1,
         ele_p=-1,
-        ms=False
+        ms=None,
+        backend=None,
+        cache=None
     ):
-        self.tree = ET.parse(file_name)
-        self.ms = ms
-        self.root = self.tree.getroot()
+        # see xml_backend.get_backend
+        self.backend = xml_backend.get_backend(backend)
+        self.file_name = file_name
         self.namespace = '{http://www.topografix.com/GPX/1/1}'
-        self.trkseg = self.root.find(f'{self.namespace}trk').find(f'{self.namespace}trkseg')
-        self.meta_datetime = self.root.find(f'{self.namespace}metadata').find(f'{self.namespace}time')
+        self._tree = None
+        self.tracks = []
+
+        # cache: track_cache.TrackCache, the XML is only parsed on a miss
+        entry = cache.get(file_name) if cache is not None else None
+        if entry is None:
+            self.parse()
+            # None when the metadata has no time
+            element = self.meta_datetime
+            self.meta_time = None if element is None else element.text
+        else:
+            self.meta_time = entry.meta_time
+
+        # None: same layout as the metadata time, with or without millisecond,
+        # without when there is no metadata time; the trkpts of a segment with
+        # fractions of a second keep them, see TrackSegment.ms
+        self.fixed_ms = ms is not None
+        if ms is None:
+            ms = self.meta_time is not None and timestamp.has_ms(self.meta_time)
+        self.ms = ms
         self.lat_p = lat_p
         self.lon_p = lon_p
         self.ele_p = ele_p
-        self.trkpts = self.load_trkpts()
-
+        self.prefix_index = None
+        self.time_index = None
+        self.spatial_index = None
+        self.batch_depth = 0
+
+        # tracks[i][j]: the j-th trkseg of the i-th trk, loaded on first access
+        if entry is None:
+            self.tracks = [
+                [
+                    TrackSegment(self, trkseg, track_idx, segment_idx)
+                    for segment_idx, trkseg in enumerate(trksegs)
+                ]
+                for track_idx, trksegs in enumerate(self.trksegs())
+            ]
+        else:
+            self.tracks = [
+                [
+                    TrackSegment.from_columns(self, columns, track_idx, segment_idx)
+                    for segment_idx, columns in enumerate(track)
+                ]
+                for track_idx, track in enumerate(entry.tracks)
+            ]
+        self.segments = [segment for track in self.tracks for segment in track]
+
+        if cache is not None and entry is None:
+            cache.put(
+                file_name,
+                self.meta_time,
+                [[segment.store for segment in track] for track in self.tracks]
+            )
 
+    ############################################################################
+    # XML tree, parsed on first access when the track comes from a cache
+    ###
+    def parse(self):
+        with profiling.stage('parse'):
+            self._tree = self.backend.parse(self.file_name)
+
+        # segments read from a cache get their elements
+        for track, trksegs in zip(self.tracks, self.trksegs()):
+            for segment, trkseg in zip(track, trksegs):
+                segment.element = trkseg
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self.parse()
+        return self._tree
+
+    @property
+    def root(self):
+        return self.tree.getroot()
+
+    # the time element of the metadata, None when there is none
+    @property
+    def meta_datetime(self):
+        metadata = self.root.find(f'{self.namespace}metadata')
+        return None if metadata is None else metadata.find(f'{self.namespace}time')
+
+    # List[List[trkseg element]], per trk
+    def trksegs(self):
+        return [
+            trk.findall(f'{self.namespace}trkseg')
+            for trk in self.root.findall(f'{self.namespace}trk')
+        ]
+
+    ############################################################################
+    # The track of the methods below is the first trkseg of the first trk
+    ###
+    @property
+    def trkseg(self):
+        return self.segments[0].element
+
+    @property
+    def trkpts(self):
+        return self.segments[0].trkpts
+
+    @trkpts.setter
+    def trkpts(self, trkpts):
+        self.segments[0].trkpts = trkpts
+
+    @property
+    def store(self):
+        return self.segments[0].store
+
+    @store.setter
+    def store(self, store):
+        self.segments[0].store = store
+
+    # (re)build the columnar store from the XML tree, return views over it
+    @profiling.timed
     def load_trkpts(self):
-        return list(map(
-            lambda p: TrackPoint(p, lat_p=self.lat_p, lon_p=self.lon_p, ms=self.ms),
-            list(self.trkseg))
+        return self.segments[0].load()
+
+    # point the TrackPoints from idx onward at their rows in self.store
+    def bind_trkpts(self, idx=0):
+        for row in range(idx, len(self.trkpts)):
+            self.trkpts[row].store = self.store
+            self.trkpts[row].row = row
+
+    # lat, lon, ele are written rounded to lat_p, lon_p, ele_p digits, the
+    # track itself is left as it is; see serializer.write_gpx
+    # compress: gzip the file, by default when file_path ends with .gz
+    @profiling.timed
+    def write(self, file_path, compress=None):
+        self.backend.write(
+            file_path,
+            self.root,
+            [(segment.element, segment.store) for segment in self.segments],
+            self.lat_p,
+            self.lon_p,
+            self.ele_p,
+            compress=compress
         )
 
-    def write(self, file_path):
-        self.load_trkpts()
-        for trkpt in self.trkpts:
-            trkpt.set_lat(format(round(trkpt.lat(), self.lat_p), '.7f'))
-            trkpt.set_lon(format(round(trkpt.lon(), self.lon_p), '.7f'))
-            trkpt.set_ele(format(round(trkpt.ele(), self.ele_p), '.1f'))
-
-        self.load_trkpts()
-        self.tree.write(file_path, encoding='utf-8', xml_declaration=True)
-
+    # Every time moves so that the metadata time lands on new_datetime, the
+    # time of the first trkpt does when there is no metadata time.
+    @profiling.timed
     def set_new_datetime(self, new_datetime):
-        time_delta_in_second = (new_datetime - self.get_meta_datetime()).total_seconds()
-        self.set_meta_datetime(new_datetime)
-
-        for trkpt in self.trkpts:
-            trkpt.shift_time(time_delta_in_second)
-        self.load_trkpts()
-
-    def get_meta_datetime(self):
-        if self.ms:
-          return datetime.datetime.strptime(self.meta_datetime.text, '%Y-%m-%dT%H:%M:%S.%fZ' )
+        if self.meta_time is not None:
+            reference = timestamp.parse_time(self.meta_time)
+            self.set_meta_datetime(new_datetime)
         else:
-          return datetime.datetime.strptime(self.meta_datetime.text, '%Y-%m-%dT%H:%M:%SZ' )
+            times = [segment.store.time[segment.store.time != NO_TIME] for segment in self.segments]
+            times = [time for time in times if len(time)]
+            if not times:
+                raise ValueError(f'{self.file_name}: no metadata or trkpt time to move from')
+            reference = int(times[0][0])
+        delta = epoch_of(new_datetime) - reference
+
+        # every segment moves along with the metadata time
+        for segment in self.segments:
+            shift_trkpts_epoch(segment.trkpts, delta)
+
+    # None when the metadata has no time
+    def get_meta_datetime(self):
+        if self.meta_time is None:
+            return None
+        return datetime_of(timestamp.parse_time(self.meta_time))
 
+    # the time element is added when the metadata has none
     def set_meta_datetime(self, datetime):
-        if self.ms:
-            rfc_3339_timestamp = datetime.strftime('%Y-%m-%dT%H:%M:%S.%fZ').replace('000000Z', '000Z')
-        else:
-            rfc_3339_timestamp = datetime.strftime('%Y-%m-%dT%H:%M:%SZ')
-        self.meta_datetime.text = rfc_3339_timestamp
+        self.meta_time = timestamp.format_time(epoch_of(datetime), self.ms)
+        element = self.meta_datetime
+        if element is None:
+            element = self.add_meta_datetime()
+        element.text = self.meta_time
+
+    # new time element of the metadata, after the children the GPX schema
+    # puts before it; the metadata is added too when there is none
+    def add_meta_datetime(self):
+        root = self.root
+        metadata = root.find(f'{self.namespace}metadata')
+        if metadata is None:
+            metadata = xml_backend.make_element(root, f'{self.namespace}metadata')
+            root.insert(0, metadata)
+
+        before = {f'{self.namespace}{name}' for name in ('name', 'desc', 'author', 'copyright', 'link')}
+        index = sum(1 for child in metadata if child.tag in before)
+        element = xml_backend.make_element(root, f'{self.namespace}time')
+        metadata.insert(index, element)
+        return element
+
+    ############################################################################
+    # Batched edits
+    #
+    # Within `with gpx.batch():` the modifiers below only edit self.trkpts,
+    # the XML tree and the store are reconciled once when the block exits.
+    # Lookups by time, place or summary raise RuntimeError inside the block:
+    # their indexes are over the store, which is behind self.trkpts until then.
+    ###
+    @contextlib.contextmanager
+    def batch(self):
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0:
+                self.reconcile()
+
+    # rebuild the trkseg children and the store from self.trkpts
+    @profiling.timed
+    def reconcile(self):
+        self.trkseg[:] = [trkpt.xml_element for trkpt in self.trkpts]
+        self.store = TrackStore.gather(self.trkpts)
+        self.bind_trkpts()
 
     # trkpts: List[Trackpoints]
+    # removed TrackPoints keep their values in a detached store
+    @profiling.timed
     def remove_trkpts(self, trkpts):
+        if self.batch_depth:
+            removing = set(map(id, trkpts))
+            self.trkpts = [trkpt for trkpt in self.trkpts if id(trkpt) not in removing]
+            return
+
         for trkpt in trkpts:
             self.trkseg.remove(trkpt.xml_element)
 
-        self.trkpts = self.load_trkpts()
+        removing = sorted(
+            (trkpt for trkpt in trkpts if trkpt.store is self.store),
+            key=lambda trkpt: trkpt.row
+        )
+        if not removing:
+            return
 
+        first_row = removing[0].row
+        removed = self.store.delete([trkpt.row for trkpt in removing])
+        for row, trkpt in enumerate(removing):
+            trkpt.store = removed
+            trkpt.row = row
+
+        self.trkpts = [trkpt for trkpt in self.trkpts if trkpt.store is self.store]
+        self.bind_trkpts(first_row)
+
+    @profiling.timed
     def remove_all(self):
+        if self.batch_depth:
+            self.trkpts = []
+            return
+
         for child in list(self.trkseg):
             self.trkseg.remove(child)
 
-        self.trkpts = self.load_trkpts()
+        # the old store stays with the removed TrackPoints
+        self.store = TrackStore.empty()
+        self.trkpts = []
 
     # trkpts: List[Trackpoints]
+    @profiling.timed
     def insert_trkpts(self, idx, trkpts):
+        if self.batch_depth:
+            self.trkpts[idx:idx] = trkpts
+            return
+
         next_idx = idx
         for trkpt in trkpts:
             self.trkseg.insert(next_idx, trkpt.xml_element)
             next_idx += 1
 
-        self.trkpts = self.load_trkpts()
+        self.store.insert(idx, TrackStore.gather(trkpts))
+        self.trkpts[idx:idx] = trkpts
+        self.bind_trkpts(idx)
 
+    @profiling.timed
     def append_trkpts(self, trkpts):
-        for trkpt in trkpts:
-            self.trkseg.append(trkpt.xml_element)
-
-        self.trkpts = self.load_trkpts()
-
-    def randomize_lat_and_lon(self):
-        self.trkpts = self.load_trkpts()
-        for point in self.each_trk_point():
-            point.attrib['lat'] = str(round(float(point.attrib['lat']) + GPX.location_offset(), self.lat_p))
-            point.attrib['lon'] = str(round(float(point.attrib['lon']) + GPX.location_offset(), self.lon_p))
-
-    def remove_extension(self):
-        self.trkpts = self.load_trkpts()
-        for point in self.each_trk_point():
-            print('point 1: ' + point)
-            extensions = point[2]
-            track_point_extension = extensions[0]
-            for extension in track_point_extension:
-                if extension.tag == '{http://www.garmin.com/xmlschemas/TrackPointExtension/v1}hr':
-                    track_point_extension.remove(extension)
-
-                if extension.tag == '{http://www.garmin.com/xmlschemas/TrackPointExtension/v1}atemp':
-                    track_point_extension.remove(extension)
-
+        self.insert_trkpts(len(self.trkpts), trkpts)
+
+    # Moves every trkpt of every segment by up to LOCATION_OFFSET degrees,
+    # rounded to lat_p and lon_p digits, in the store and in the lat and lon
+    # attributes of the tree like set_lat and set_lon. The attributes are set
+    # trkpt by trkpt, most of the time of the call: load_trkpts and the
+    # elements of moved or copied trkpts read the tree, write() does not.
+    # rng: numpy.random.Generator or seed
+    @profiling.timed
+    def randomize_lat_and_lon(self, rng=None):
+        rng = np.random.default_rng(rng)
+        for segment in self.segments:
+            store = segment.store
+            n = len(store)
+            store.lat = serializer.round_column(store.lat + rng.uniform(-LOCATION_OFFSET, LOCATION_OFFSET, n), self.lat_p)
+            store.lon = serializer.round_column(store.lon + rng.uniform(-LOCATION_OFFSET, LOCATION_OFFSET, n), self.lon_p)
+            store.changed(0)
+
+            for element, lat, lon in zip(store.elements, store.lat.tolist(), store.lon.tolist()):
+                element.set('lat', str(lat))
+                element.set('lon', str(lon))
+
+    # names: TrackPointExtension children, removed from the trkpts of every
+    # segment
+    @profiling.timed
+    def remove_extension(self, names=('hr', 'atemp')):
+        tags = {f'{TRACK_POINT_EXTENSION}{name}' for name in names}
+        for segment in self.segments:
+            self.backend.strip_extensions(segment.element, f'{TRACK_POINT_EXTENSION}TrackPointExtension', tags)
+
+    # {name: float64 column}, aligned with self.store, NaN where a trkpt has
+    # no such TrackPointExtension child
+    def extensions(self, names=EXTENSIONS):
+        return self.segments[0].extensions(names)
+
+    @profiling.timed
     def trkpts_between(self, earliest_datetime, latest_datetime):
         earliest_idx, latest_idx = self.trkpts_between_idx(earliest_datetime, latest_datetime)
         return self.trkpts[earliest_idx:latest_idx+1]
 
-    # NOW: sequecntial search
-    # TODO: binary search to improve performance
+    # the index kept in the attribute `kind`, built again by factory(self.store)
+    # when there is none yet, it belongs to a replaced store or fresh(index) is
+    # False; the one it replaces stops listening to its store
+    def cached_index(self, kind, factory, fresh=lambda index: True):
+        if self.batch_depth:
+            raise RuntimeError('lookups are not available inside gpx.batch(), the store is reconciled on exit')
+
+        index = getattr(self, kind)
+        if index is None or index.store is not self.store or not fresh(index):
+            if index is not None and index.invalidate in index.store.listeners:
+                index.store.listeners.remove(index.invalidate)
+            index = factory(self.store)
+            setattr(self, kind, index)
+        return index
+
+    def get_time_index(self):
+        return self.cached_index('time_index', TimeIndex)
+
+    # earliest_idx: first trkpt at or after earliest_datetime, None if none
+    # latest_idx: first trkpt at or after latest_datetime, the last one if none
     def trkpts_between_idx(self, earliest_datetime, latest_datetime):
-        earliest_idx = None
-        latest_idx = None
-
-        for idx, trkpt in enumerate(self.trkpts):
-            if earliest_idx is None:
-                if trkpt.time() >= earliest_datetime:
-                    earliest_idx = idx
-
-            if latest_idx is None:
-                if trkpt.time() >= latest_datetime:
-                    latest_idx = idx
+        (earliest_idx, latest_idx), = self.trkpts_between_idx_many([(earliest_datetime, latest_datetime)])
+        return earliest_idx, latest_idx
 
-            if not (earliest_idx is None or latest_idx is None):
-                break
+    # ranges: List[(earliest_datetime, latest_datetime)]
+    # trkpts_between_idx of every range, in one pass over the time index
+    @profiling.timed
+    def trkpts_between_idx_many(self, ranges):
+        if not ranges:
+            return []
 
-        if latest_idx is None:
-            latest_idx = len(self.trkpts) - 1
+        n = len(self.store)
+        epochs = np.array([[epoch_of(earliest), epoch_of(latest)] for earliest, latest in ranges], dtype=np.int64)
+        found = self.get_time_index().first_at_or_after_many(epochs.ravel()).reshape(-1, 2)
 
-        return earliest_idx, latest_idx
+        return [
+            (None if earliest_idx == n else int(earliest_idx), n - 1 if latest_idx == n else int(latest_idx))
+            for earliest_idx, latest_idx in found
+        ]
 
-    # inclusive
-    # NOW: sequecntial search
-    # TODO: binary search to improve performance
+    # inclusive, starts from the last trkpt before earliest_datetime
+    @profiling.timed
     def trkpts_after(self, earliest_datetime):
-        for idx, trkpt in reversed(list(enumerate(self.trkpts))):
-            if trkpt.time() >= earliest_datetime:
-                continue
+        idx = self.get_time_index().last_before(epoch_of(earliest_datetime))
+        if idx < 0:
+            return None
+
+        return self.trkpts[idx:]
+
+    ############################################################################
+    # Lookups by place, see spatial_index
+    ###
+    def get_spatial_index(self):
+        return self.cached_index('spatial_index', spatial_index.SpatialIndex)
+
+    # the k trkpts nearest to lat, lon, nearest first
+    @profiling.timed
+    def nearest_trkpts(self, lat, lon, k=1):
+        rows, _ = self.get_spatial_index().nearest(lat, lon, k)
+        return [self.trkpts[row] for row in rows]
+
+    # trkpts within meters of lat, lon, in track order
+    @profiling.timed
+    def trkpts_within(self, lat, lon, meters):
+        rows, _ = self.get_spatial_index().within(lat, lon, meters)
+        return [self.trkpts[row] for row in rows]
+
+    # trkpts in the box, bounds included, in track order
+    @profiling.timed
+    def trkpts_in_box(self, min_lat, min_lon, max_lat, max_lon):
+        rows = self.get_spatial_index().in_box(min_lat, min_lon, max_lat, max_lon)
+        return [self.trkpts[row] for row in rows]
+
+    ############################################################################
+    # Window metrics in constant time, from prefix sums over the store
+    ###
+    def get_prefix_index(self):
+        return self.cached_index(
+            'prefix_index',
+            lambda store: metrics.PrefixIndex(store, SAMPLE_RATE),
+            lambda index: index.sample_rate == SAMPLE_RATE
+        )
 
-            return self.trkpts[idx:]
+    # same as summary_of(self.trkpts[start_idx:end_idx+1])
+    @profiling.timed
+    def summary_between_idx(self, start_idx, end_idx):
+        return self.get_prefix_index().summary(start_idx, end_idx)
 
+    # same as summary_of(self.trkpts_between(earliest_datetime, latest_datetime))
+    def summary_between(self, earliest_datetime, latest_datetime):
+        earliest_idx, latest_idx = self.trkpts_between_idx(earliest_datetime, latest_datetime)
+        return self.summary_between_idx(earliest_idx or 0, latest_idx)
+
+
+    ############################################################################
+    # Every track and segment
+    #
+    # Segments are summarized on their own, in parallel, and the total adds
+    # them up: no distance nor time is counted across the gap between two
+    # segments. Segments are loaded in the worker threads as needed.
+    ###
+    # List[metrics.Summary], one per segment in self.segments
+    @profiling.timed
+    def segment_summaries(self, workers=None):
+        if len(self.segments) <= 1 or workers == 1:
+            return [segment.summary() for segment in self.segments]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(TrackSegment.summary, self.segments))
+
+    # metrics.Summary of all the segments together
+    def summary(self, workers=None):
+        return metrics.combine(self.segment_summaries(workers))
+
+    # drop the trkpts of every segment within tolerance meters of the line
+    # through the kept ones, see simplify.douglas_peucker
+    # returns the simplify.Report, nothing is dropped with dry_run=True
+    @profiling.timed
+    def simplify(self, tolerance, ele_tolerance=None, dry_run=False):
+        segments = []
+        for segment in self.segments:
+            store = segment.store
+            keep = simplify.douglas_peucker(store.lat, store.lon, tolerance, store.ele, ele_tolerance)
+            segments.append((store.lat, store.lon, store.ele, keep))
+
+        report = simplify.report_of(segments, SAMPLE_RATE)
+        if not dry_run:
+            for segment, (_, _, _, keep) in zip(self.segments, segments):
+                segment.remove_rows(np.flatnonzero(~keep))
+        return report
 
     @staticmethod
     def location_offset():
-        return random.uniform(-0.000001, 0.000001)
+        return random.uniform(-LOCATION_OFFSET, LOCATION_OFFSET)
+
+
+# One trkseg of a GPX, its store is built from the XML element on first
+# access and its TrackPoints on first access to trkpts
+class TrackSegment:
+    def __init__(self, gpx, element, track_idx=0, segment_idx=0):
+        self.gpx = gpx
+        self._element = element
+        self.track_idx = track_idx
+        self.segment_idx = segment_idx
+        self._store = None
+        self._trkpts = None
+
+    # segment of a track_cache entry, its XML is parsed on first access to
+    # the elements
+    @classmethod
+    def from_columns(cls, gpx, columns, track_idx=0, segment_idx=0):
+        segment = cls(gpx, None, track_idx, segment_idx)
+        segment.store = TrackStore(*columns, None, load_elements=lambda: list(segment.element))
+        return segment
+
+    @property
+    def element(self):
+        if self._element is None:
+            self.gpx.parse()
+        return self._element
+
+    @element.setter
+    def element(self, element):
+        self._element = element
+
+    def is_loaded(self):
+        return self._store is not None
+
+    # (re)build the store from the XML element, return views over it
+    def load(self):
+        self.load_store()
+        self._trkpts = None
+        return self.trkpts
+
+    @profiling.timed
+    def load_store(self):
+        self._store = self.gpx.backend.load_store(self.element, self.gpx.namespace)
+
+    @property
+    def store(self):
+        if self._store is None:
+            self.load_store()
+        return self._store
+
+    @store.setter
+    def store(self, store):
+        self._store = store
+
+    # layout of the trkpt times: that of GPX.ms, with millisecond too when a
+    # time of the segment has a fraction of a second and ms was not given
+    @property
+    def ms(self):
+        if self.gpx.ms or self.gpx.fixed_ms:
+            return self.gpx.ms
+        time = self.store.time
+        return bool(np.any(time[time != NO_TIME] % timestamp.SECOND))
+
+    @property
+    def trkpts(self):
+        if self._trkpts is None:
+            gpx = self.gpx
+            ms = self.ms
+            self._trkpts = [
+                TrackPoint(None, lat_p=gpx.lat_p, lon_p=gpx.lon_p, ms=ms, store=self.store, row=row)
+                for row in range(len(self.store))
+            ]
+        return self._trkpts
+
+    @trkpts.setter
+    def trkpts(self, trkpts):
+        self._trkpts = trkpts
+
+    # see GPX.extensions
+    @profiling.timed
+    def extensions(self, names=EXTENSIONS):
+        columns = self.gpx.backend.load_extensions(
+            self.element,
+            self.gpx.namespace,
+            [f'{TRACK_POINT_EXTENSION}{name}' for name in names]
+        )
+        return dict(zip(names, columns))
+
+    # remove the rows from the store and the XML, removed TrackPoints keep
+    # their values in a detached store
+    def remove_rows(self, rows):
+        if not len(rows):
+            return
+
+        trkpts = self._trkpts
+        removed = self.store.delete(rows)
+        self.element[:] = self.store.elements
+        if trkpts is None:
+            return
+
+        gone = np.zeros(len(trkpts), dtype=bool)
+        gone[rows] = True
+        for row, trkpt in enumerate(trkpt for trkpt, is_gone in zip(trkpts, gone) if is_gone):
+            trkpt.store = removed
+            trkpt.row = row
+        self._trkpts = [trkpt for trkpt, is_gone in zip(trkpts, gone) if not is_gone]
+        for row, trkpt in enumerate(self._trkpts):
+            trkpt.row = row
+
+    # metrics.Summary from the store, without making TrackPoints
+    def summary(self):
+        if len(self.store) == 0:
+            return metrics.summary_from(0, 0, 0, 0)
+        return metrics.summarize(*self.store.columns(), sample_rate=SAMPLE_RATE)
+
+
+# View of one row of a TrackStore, backed by the XML element trkpt
+# getters read the store, setters write to both the store and the XML element
+#
+# Views are made per point, hence the slots. The ele and time children are
+# looked up on first use and kept: replacing them in the XML afterwards
+# is not seen by the view.
+class TrackPoint:
+    __slots__ = ('store', 'row', 'ms', 'lat_p', 'lon_p', '_ele_element', '_time_element')
 
+    namespace = '{http://www.topografix.com/GPX/1/1}'
 
-# Wrapper of the XML element trkpt
-class TrackPoint:
-    def __init__(self, trk_point, ms, lat_p, lon_p):
-        self.xml_element = trk_point
+    # trk_point: only read without a store, the element is the one of the row
+    def __init__(self, trk_point, ms, lat_p, lon_p, store=None, row=0):
         self.lat_p = lat_p
         self.lon_p = lon_p
         self.ms = ms
-        self.namespace = '{http://www.topografix.com/GPX/1/1}'
+        self._ele_element = None
+        self._time_element = None
+
+        if store is None:
+            store = TrackStore.from_elements([trk_point], self.namespace)
+        self.store = store
+        self.row = row
+
+    @property
+    def xml_element(self):
+        return self.store.elements[self.row]
+
+    def ele_element(self):
+        if self._ele_element is None:
+            self._ele_element = self.xml_element.find(f'{self.namespace}ele')
+        return self._ele_element
+
+    def time_element(self):
+        if self._time_element is None:
+            self._time_element = self.xml_element.find(f'{self.namespace}time')
+        return self._time_element
 
     def lat(self):
-        return float(self.xml_element.attrib['lat'])
+        return self.store.lat.item(self.row)
 
     def set_lat(self, value):
+        self.store.lat[self.row] = float(value)
+        self.store.changed(self.row)
         self.xml_element.attrib['lat'] = str(value)
 
     def lon(self):
-        return float(self.xml_element.attrib['lon'])
+        return self.store.lon.item(self.row)
 
     def set_lon(self, value):
+        self.store.lon[self.row] = float(value)
+        self.store.changed(self.row)
         self.xml_element.attrib['lon'] = str(value)
 
     def ele(self):
-        return float(self.xml_element.find(f'{self.namespace}ele').text)
+        return self.store.ele.item(self.row)
 
     def set_ele(self, value):
-        self.xml_element.find(f'{self.namespace}ele').text = str(value)
+        self.store.ele[self.row] = float(value)
+        self.store.changed(self.row)
+        self.ele_element().text = str(value)
 
     # return datetime
     def time(self):
-        rfc_3339_timestamp = self.raw_time()
+        epoch = self.store.time.item(self.row)
+        if epoch == NO_TIME:
+            return None
 
-        # print(self.ms)
-        if self.ms:
-          return datetime.datetime.strptime(rfc_3339_timestamp, '%Y-%m-%dT%H:%M:%S.%fZ' )
-        else:
-          return datetime.datetime.strptime(rfc_3339_timestamp, '%Y-%m-%dT%H:%M:%SZ' )
+        return datetime_of(epoch)
 
     def raw_time(self):
-        return self.xml_element.find(f'{self.namespace}time').text
+        return self.time_element().text
 
     # set by datetime
     def set_time(self, value):
-        if self.ms:
-            rfc_3339_timestamp = value.strftime('%Y-%m-%dT%H:%M:%S.%fZ').replace('000000Z', '000Z')
-        else:
-            rfc_3339_timestamp = value.strftime('%Y-%m-%dT%H:%M:%SZ')
-        self.xml_element.find(f'{self.namespace}time').text = rfc_3339_timestamp
+        self.set_epoch(epoch_of(value))
+
+    # set by microsecond since epoch, truncated to second without ms
+    def set_epoch(self, epoch):
+        if not self.ms:
+            epoch -= epoch % timestamp.SECOND
+        self.store.time[self.row] = epoch
+        self.store.changed(self.row)
+        self.time_element().text = timestamp.format_time(epoch, self.ms)
 
     def shift_time(self, seconds):
-        new_time = self.time() + datetime.timedelta(seconds=seconds)
-        self.set_time(new_time)
+        self.shift_epoch(round(seconds * timestamp.SECOND))
+
+    def shift_epoch(self, delta):
+        self.set_epoch(self.store.time.item(self.row) + delta)
 
 
     def deep_copy(self):
         new_trkpt = copy.deepcopy(self.xml_element)
-        return TrackPoint(new_trkpt, self.ms, self.lat_p, self.lon_p)
+        store = self.store.take([self.row], elements=[new_trkpt])
+        return TrackPoint(new_trkpt, self.ms, self.lat_p, self.lon_p, store=store)
 
     def __str__(self):
         return f'{round(self.lat(), 7)}, {round(self.lon(), 7)}, {self.time()}, {round(self.ele(), 2)}'
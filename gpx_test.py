@@ -1,5 +1,9 @@
 from gpx import *
 import datetime
+import pytest
+
+BACKENDS = ['etree', 'lxml']
+
 
 class TestGPX:
     def test_trk_points(self):
@@ -140,6 +144,42 @@ class TestGPX:
         assert gpx.get_meta_datetime() == datetime.datetime(2021, 4, 10, 23, 45, 26)
 
 
+def test_without_meta_time(tmp_path):
+    gpx = GPX('fixtures/no_meta_time.gpx', lat_p=7, lon_p=7, ele_p=1)
+    assert gpx.meta_time is None
+    assert gpx.ms is False
+    assert gpx.get_meta_datetime() is None
+    assert len(gpx.trkpts) == 30
+
+    # the first trkpt lands on the new datetime
+    gpx.set_new_datetime(datetime.datetime(2022, 1, 1, 10, 0, 0))
+    assert gpx.trkpts[0].time() == datetime.datetime(2022, 1, 1, 10, 0, 0)
+    assert gpx.get_meta_datetime() is None
+
+    gpx.write(str(tmp_path / 'moved.gpx'))
+    moved = GPX(str(tmp_path / 'moved.gpx'))
+    assert moved.trkpts[-1].time() == gpx.trkpts[-1].time()
+
+
+def test_mixed_precision(tmp_path):
+    # the metadata time without millisecond, a trkpt of the first segment with
+    text = open('fixtures/multi_track.gpx').read()
+    assert text.count('<time>2021-03-07T00:29:12Z</time>') == 1
+    file_name = tmp_path / 'mixed.gpx'
+    file_name.write_text(text.replace('<time>2021-03-07T00:29:12Z</time>', '<time>2021-03-07T00:29:12.250Z</time>'))
+
+    gpx = GPX(str(file_name))
+    assert gpx.ms is False
+    assert [segment.ms for segment in gpx.segments] == [True, False, False, False]
+
+    gpx.set_new_datetime(datetime.datetime(2022, 1, 1, 10, 0, 0))
+    gpx.write(str(tmp_path / 'moved.gpx'))
+    moved = GPX(str(tmp_path / 'moved.gpx'))
+    assert moved.meta_time == '2022-01-01T10:00:00Z'
+    assert moved.trkpts[1].raw_time() == '2022-01-01T10:00:03.250000Z'
+    assert moved.segments[2].trkpts[0].raw_time() == gpx.segments[2].trkpts[0].raw_time()
+
+
 def test_distance_between():
     gpx = GPX('fixtures/track3.gpx', lat_p=7, lon_p=7, ele_p=1, ms=True)
     trkpts = gpx.trkpts_between(
@@ -327,3 +367,277 @@ def test_find_mid_point():
     assert (8.2, 8.2) == find_mid_point(9, 9, 1, 1, 0.1)
     assert (2.5, 2) == find_mid_point(-3, 5, 8, -1, 0.5)
     assert (2.5, 2) == find_mid_point(8, -1, -3, 5, 0.5)
+
+
+def test_randomize_lat_and_lon(tmp_path):
+    original = GPX('fixtures/multi_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    gpx = GPX('fixtures/multi_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    gpx.randomize_lat_and_lon(rng=1)
+
+    for segment, expected in zip(gpx.segments, original.segments):
+        assert np.all(np.abs(segment.store.lat - expected.store.lat) <= LOCATION_OFFSET + 1e-7)
+        assert np.array_equal(segment.store.lon, np.round(segment.store.lon, 7))
+    assert not np.array_equal(gpx.store.lat, original.store.lat)
+
+    again = GPX('fixtures/multi_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    again.randomize_lat_and_lon(rng=1)
+    assert np.array_equal(again.segments[2].store.lon, gpx.segments[2].store.lon)
+
+    gpx.write(str(tmp_path / 'randomized.gpx'))
+    written = GPX(str(tmp_path / 'randomized.gpx'))
+    assert np.array_equal(written.segments[1].store.lat, gpx.segments[1].store.lat)
+
+    # the tree moved along, reloading keeps the jitter
+    lat = gpx.store.lat.copy()
+    gpx.load_trkpts()
+    assert np.array_equal(gpx.store.lat, lat)
+    assert gpx.trkpts[3].xml_element.get('lon') == str(gpx.trkpts[3].lon())
+
+
+def test_trkpts_are_views_of_store():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+
+    assert gpx.store.lat[3] == gpx.trkpts[3].lat()
+    gpx.trkpts[3].set_ele(150)
+    assert gpx.store.ele[3] == 150
+    assert gpx.trkpts[3].xml_element.find(f'{gpx.namespace}ele').text == '150'
+
+
+def test_trkpt_children_are_cached():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    trkpt = gpx.trkpts[3]
+    assert not hasattr(trkpt, '__dict__')
+
+    time_element = trkpt.xml_element.find(f'{gpx.namespace}time')
+    assert trkpt.time_element() is time_element
+    trkpt.shift_time(60)
+    assert time_element.text == trkpt.raw_time() == '2021-03-07T00:30:17Z'
+    assert trkpt.time() == datetime.datetime(2021, 3, 7, 0, 30, 17)
+
+    # a removed TrackPoint keeps its children
+    gpx.remove_trkpts(gpx.trkpts[:5])
+    trkpt.set_ele(150)
+    assert trkpt.ele_element().text == '150'
+    assert trkpt.ele() == 150
+
+
+def test_store_in_sync_after_modifier():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    removed = gpx.trkpts[10:15]
+    removed_lat = [trkpt.lat() for trkpt in removed]
+
+    gpx.remove_trkpts(removed)
+    assert len(gpx.store) == 25
+    assert [trkpt.lat() for trkpt in removed] == removed_lat
+
+    gpx.insert_trkpts(2, removed)
+    assert len(gpx.store) == 30
+    assert list(gpx.store.lat[2:7]) == removed_lat
+    assert [trkpt.row for trkpt in gpx.trkpts] == list(range(30))
+    assert gpx.store.elements == list(gpx.trkseg)
+
+
+def test_summary_of():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    trkpts = gpx.trkpts[3:20]
+    summary = summary_of(trkpts)
+
+    assert summary.distance == distance_of(trkpts)
+    assert summary.elevation == elevation_of(trkpts)
+    assert summary.descent == descent_of(trkpts)
+    assert summary.time_spent == time_spent_of(trkpts)
+    assert summary.eph == eph_of(trkpts)
+    assert summary.speed == speed_of(trkpts)
+    assert summary.pace == pace_of(trkpts)
+
+
+def test_summary_between_idx():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+
+    got = gpx.summary_between_idx(3, 20)
+    assert got.distance == pytest.approx(distance_of(gpx.trkpts[3:21]))
+    assert got.eph == pytest.approx(eph_of(gpx.trkpts[3:21]))
+
+    gpx.remove_trkpts(gpx.trkpts[5:8])
+    gpx.append_trkpts([gpx.trkpts[0].deep_copy()])
+    got = gpx.summary_between_idx(3, 27)
+    assert got.elevation == pytest.approx(elevation_of(gpx.trkpts[3:28]))
+    assert got.descent == pytest.approx(descent_of(gpx.trkpts[3:28]))
+
+
+def test_trkpts_between_idx_many():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    ranges = [
+        (datetime.datetime(2021, 3, 7, 0, 29, 12), datetime.datetime(2021, 3, 7, 0, 29, 20)),
+        (datetime.datetime(2021, 3, 7, 0, 0, 0), datetime.datetime(2021, 3, 7, 0, 29, 9)),
+        (datetime.datetime(2021, 3, 8, 0, 0, 0), datetime.datetime(2021, 3, 9, 0, 0, 0)),
+    ]
+
+    got = gpx.trkpts_between_idx_many(ranges)
+    assert got == [gpx.trkpts_between_idx(earliest, latest) for earliest, latest in ranges]
+    assert got[1] == (0, 0)
+    assert got[2] == (None, 29)
+
+
+def test_ms_is_detected():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    assert gpx.ms is False
+
+    gpx.trkpts[0].set_time(datetime.datetime(2021, 3, 29, 23, 6, 10, 500))
+    assert gpx.trkpts[0].raw_time() == '2021-03-29T23:06:10Z'
+    assert gpx.trkpts[0].time() == datetime.datetime(2021, 3, 29, 23, 6, 10)
+
+
+def test_batch():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    former = gpx.trkpts[:10]
+    latter = gpx.trkpts[20:]
+    store = gpx.store
+
+    with gpx.batch():
+        gpx.remove_all()
+        gpx.append_trkpts(latter)
+        gpx.insert_trkpts(0, former)
+        gpx.remove_trkpts(former[:2])
+
+        # reconciled on exit only
+        assert gpx.store is store
+        assert len(gpx.trkseg) == 30
+
+    assert len(gpx.trkpts) == 18
+    assert list(gpx.trkseg) == [trkpt.xml_element for trkpt in former[2:] + latter]
+    assert list(gpx.store.lat) == [trkpt.lat() for trkpt in former[2:] + latter]
+    assert [trkpt.row for trkpt in gpx.trkpts] == list(range(18))
+
+
+def test_lookups_inside_batch():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    start = datetime.datetime(2021, 3, 7, 0, 29, 12)
+    end = datetime.datetime(2021, 3, 7, 0, 29, 20)
+    lat, lon = gpx.trkpts[5].lat(), gpx.trkpts[5].lon()
+    removed = gpx.trkpts[:2]
+    expected = [trkpt for trkpt in gpx.trkpts_between(start, end) if trkpt not in removed]
+
+    with gpx.batch():
+        gpx.remove_trkpts(removed)
+        with pytest.raises(RuntimeError):
+            gpx.trkpts_between(start, end)
+        with pytest.raises(RuntimeError):
+            gpx.trkpts_between_idx(start, end)
+        with pytest.raises(RuntimeError):
+            gpx.trkpts_after(start)
+        with pytest.raises(RuntimeError):
+            gpx.nearest_trkpts(lat, lon)
+        with pytest.raises(RuntimeError):
+            gpx.trkpts_within(lat, lon, 10)
+        with pytest.raises(RuntimeError):
+            gpx.summary_between_idx(0, 10)
+
+    assert gpx.trkpts_between(start, end) == expected
+    assert gpx.nearest_trkpts(lat, lon)[0] is gpx.trkpts[3]
+
+
+def test_indexes_leave_the_former_store():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    start = datetime.datetime(2021, 3, 7, 0, 29, 12)
+    end = datetime.datetime(2021, 3, 7, 0, 29, 20)
+    gpx.trkpts_between_idx(start, end)
+    gpx.summary_between_idx(0, 10)
+    gpx.nearest_trkpts(gpx.trkpts[0].lat(), gpx.trkpts[0].lon())
+    store = gpx.store
+    assert len(store.listeners) == 3
+
+    with gpx.batch():
+        gpx.remove_trkpts(gpx.trkpts[:2])
+    gpx.trkpts_between_idx(start, end)
+    gpx.summary_between_idx(0, 10)
+    gpx.nearest_trkpts(gpx.trkpts[0].lat(), gpx.trkpts[0].lon())
+    assert store.listeners == []
+    assert len(gpx.store.listeners) == 3
+
+
+def test_new_trkpts_by_speed_layout():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+
+    new_trkpts = new_trkpts_by_speed(gpx.trkpts, 10, rng=1)
+
+    assert str(new_trkpts[0]) == str(gpx.trkpts[0])
+    assert new_trkpts[1].time() - new_trkpts[0].time() == datetime.timedelta(seconds=1)
+    assert new_trkpts[-1].time() - new_trkpts[0].time() == datetime.timedelta(seconds=len(new_trkpts) - 1)
+    assert distance_of(new_trkpts) <= distance_of(gpx.trkpts)
+    assert new_trkpts[5].raw_time() == new_trkpts[5].xml_element.find(f'{gpx.namespace}time').text
+    assert float(new_trkpts[5].xml_element.attrib['lat']) == new_trkpts[5].lat()
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_new_trkpts_have_their_own_extensions(backend):
+    if backend == 'lxml':
+        pytest.importorskip('lxml')
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1, backend=backend)
+    template = gpx.trkpts[0]
+    trkpts = new_trkpts(template, np.array([22.3, 22.4]), np.array([114.1, 114.2]), np.array([1.0, 2.0]),
+                        np.array([0, timestamp.SECOND]))
+    gpx.append_trkpts(trkpts)
+    hr = f'{TRACK_POINT_EXTENSION}hr'
+
+    first, second = (trkpt.xml_element.find(f'.//{hr}') for trkpt in trkpts)
+    assert first is not second and first.text == second.text
+    first.text = '200'
+    assert second.text != '200'
+    assert template.xml_element.find(f'.//{hr}').text != '200'
+
+    gpx.remove_extension(['hr'])
+    assert all(trkpt.xml_element.find(f'.//{hr}') is None for trkpt in gpx.trkpts)
+    assert template.xml_element.find(f'.//{TRACK_POINT_EXTENSION}atemp') is not None
+
+
+def test_segments():
+    gpx = GPX('fixtures/multi_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    short = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+
+    assert [len(track) for track in gpx.tracks] == [2, 2]
+    assert [(segment.track_idx, segment.segment_idx) for segment in gpx.segments] == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert not any(segment.is_loaded() for segment in gpx.segments)
+
+    # the first segment is the track of the GPX methods
+    assert [str(trkpt) for trkpt in gpx.trkpts] == [str(trkpt) for trkpt in short.trkpts[:10]]
+    assert [segment.is_loaded() for segment in gpx.segments] == [True, False, False, False]
+    assert [str(trkpt) for trkpt in gpx.segments[2].trkpts] == [str(trkpt) for trkpt in short.trkpts[20:]]
+    assert gpx.segments[3].trkpts == []
+
+
+def test_segment_summaries():
+    gpx = GPX('fixtures/multi_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    short = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    parts = [short.trkpts[:10], short.trkpts[10:20], short.trkpts[20:]]
+
+    summaries = gpx.segment_summaries(workers=4)
+    assert summaries == gpx.segment_summaries(workers=1)
+    assert summaries[:3] == [summary_of(part) for part in parts]
+    assert summaries[3].distance == 0
+
+    # nothing counted between segments
+    total = gpx.summary()
+    assert total.distance == pytest.approx(sum(distance_of(part) for part in parts))
+    assert total.distance < distance_of(short.trkpts)
+    assert total.time_spent == sum(time_spent_of(part) for part in parts)
+    assert total.time_spent < time_spent_of(short.trkpts)
+
+
+def test_write_segments(tmp_path):
+    gpx = GPX('fixtures/multi_track.gpx', lat_p=5, lon_p=5, ele_p=0)
+    gpx.segments[2].trkpts[0].set_ele(300)
+    gpx.write(str(tmp_path / 'written.gpx'))
+
+    written = GPX(str(tmp_path / 'written.gpx'))
+    assert [len(segment.trkpts) for segment in written.segments] == [10, 10, 10, 0]
+    assert written.segments[2].trkpts[0].ele() == 300
+    assert written.segments[1].trkpts[0].lat() == round(gpx.segments[1].trkpts[0].lat(), 5)
+
+
+def test_set_new_datetime_of_segments():
+    gpx = GPX('fixtures/multi_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    gpx.set_new_datetime(datetime.datetime(2021, 3, 8, 0, 29, 9))
+
+    assert gpx.segments[0].trkpts[0].raw_time() == '2021-03-08T00:29:09Z'
+    assert gpx.segments[2].trkpts[0].raw_time() == '2021-03-08T00:29:44Z'
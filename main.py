@@ -1,20 +1,262 @@
-import random
+import argparse
+import concurrent.futures
+import glob
+import os
+import sys
+import time
 from gpx import *
+import profiling
+import scanner
+from catalog import Catalog
+from track_cache import TrackCache
 
-INPUT_FILE=f'path_to_input_file'
-OUTPUT_FILE=f'path_to_output_file'
+OPERATIONS = ['set_by_speed', 'set_new_datetime', 'randomize_lat_and_lon', 'simplify', 'summary', 'index']
 
 
-def main():
-    gpx = GPX(INPUT_FILE, lat_p=6, lon_p=6, ele_p=1, ms=False)
-    set_by_speed(
-        gpx,
-        11,
-        datetime.datetime(2021, 3, 1, 0, 0, 0),
-        datetime.datetime(2021, 3, 1, 0, 0, 0)
+################################################################################
+# Command line
+###
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Edit or summarize GPX files in batch.')
+    parser.add_argument('operation', choices=OPERATIONS)
+    parser.add_argument('inputs', nargs='+', help='GPX files, directories or glob patterns')
+    parser.add_argument('-o', '--output-dir', help='where edited files are written, required unless summary')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='processes, 1 to run inline')
+    parser.add_argument('--lat-p', type=int, default=6)
+    parser.add_argument('--lon-p', type=int, default=6)
+    parser.add_argument('--ele-p', type=int, default=1)
+    parser.add_argument('--profile', action='store_true', help='report the time spent in every stage')
+    parser.add_argument('--cache-dir', help='keep the parsed tracks there, see track_cache')
+    parser.add_argument('--cache-size', type=int, default=1 << 30, help='bytes of cache kept')
+
+    # set_by_speed
+    parser.add_argument('--speed', type=float, help='target speed in km/h')
+    parser.add_argument('--start', type=datetime.datetime.fromisoformat)
+    parser.add_argument('--end', type=datetime.datetime.fromisoformat, help='defaults to --start')
+    parser.add_argument('--seed', type=int, help='of set_by_speed and randomize_lat_and_lon')
+
+    # set_new_datetime
+    parser.add_argument('--datetime', type=datetime.datetime.fromisoformat)
+
+    # simplify
+    parser.add_argument('--tolerance', type=float, help='in meter, see simplify.douglas_peucker')
+    parser.add_argument('--ele-tolerance', type=float, help='in meter, elevation is ignored without it')
+
+    # index
+    parser.add_argument('--catalog', help='SQLite database of the summaries, see catalog')
+
+    args = parser.parse_args(argv)
+    if args.operation not in ('summary', 'index') and args.output_dir is None:
+        parser.error(f'{args.operation} needs --output-dir')
+    if args.operation == 'set_by_speed' and (args.speed is None or args.start is None):
+        parser.error('set_by_speed needs --speed and --start')
+    if args.end is None:
+        args.end = args.start
+    if args.operation == 'set_new_datetime' and args.datetime is None:
+        parser.error('set_new_datetime needs --datetime')
+    if args.operation == 'simplify' and args.tolerance is None:
+        parser.error('simplify needs --tolerance')
+    if args.operation == 'index' and (args.catalog is None or not all(map(os.path.isdir, args.inputs))):
+        parser.error('index needs --catalog and directories')
+    return args
+
+
+# every .gpx file under the given files, directories and glob patterns
+def find_files(inputs):
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files += sorted(glob.glob(os.path.join(item, '**', '*.gpx'), recursive=True))
+        elif os.path.isfile(item):
+            files.append(item)
+        else:
+            files += sorted(glob.glob(item, recursive=True))
+
+    return list(dict.fromkeys(files))
+
+
+# path of every file under --output-dir: the same as under its input
+# directory, the file name alone for files and glob patterns
+def output_names(files, inputs):
+    directories = [item for item in inputs if os.path.isdir(item)]
+    names = {}
+    for file_name in files:
+        names[file_name] = os.path.basename(file_name)
+        for directory in directories:
+            relative = os.path.relpath(file_name, directory)
+            if not relative.startswith(os.pardir + os.sep):
+                names[file_name] = relative
+                break
+    return names
+
+
+# (file, file) pairs which output_names would write to the same path
+def same_outputs(names):
+    first_of = {}
+    pairs = []
+    for file_name, name in names.items():
+        key = os.path.normcase(os.path.normpath(name))
+        if key in first_of:
+            pairs.append((first_of[key], file_name))
+        else:
+            first_of[key] = file_name
+    return pairs
+
+
+################################################################################
+# One file, in a worker process
+###
+
+# errors are reported in the result instead of raised, so one bad file
+# does not stop the batch
+# output_name: path under args.output_dir, see output_names
+def process_file(file_name, args, output_name=None):
+    started = time.perf_counter()
+    result = {
+        'file': file_name,
+        'ok': False,
+        'error': None,
+        'points': 0,
+        'bytes': os.path.getsize(file_name) if os.path.exists(file_name) else 0,
+        'summary': None,
+        'stats': None,
+        'simplified': None,
+    }
+
+    if args.profile:
+        profiling.enable()
+    try:
+        cache = TrackCache(args.cache_dir, args.cache_size) if args.cache_dir else None
+
+        if args.operation == 'summary' and cache is None:
+            # read-only, the file is scanned rather than parsed when it can be
+            segments = scanner.read_segments(file_name)
+            result['summary'] = scanner.summary_of_segments(segments)._asdict()
+            result['points'] = sum(len(columns[0]) for columns in segments)
+        elif args.operation == 'summary':
+            # every track and segment of the file, one worker process already runs per file
+            gpx = GPX(file_name, lat_p=args.lat_p, lon_p=args.lon_p, ele_p=args.ele_p, cache=cache)
+            result['summary'] = gpx.summary(workers=1)._asdict()
+            result['points'] = sum(len(segment.store) for segment in gpx.segments)
+        else:
+            gpx = GPX(file_name, lat_p=args.lat_p, lon_p=args.lon_p, ele_p=args.ele_p, cache=cache)
+            if args.operation == 'set_by_speed':
+                set_by_speed(gpx, args.speed, args.start, args.end, rng=args.seed)
+            elif args.operation == 'set_new_datetime':
+                gpx.set_new_datetime(args.datetime)
+            elif args.operation == 'randomize_lat_and_lon':
+                gpx.randomize_lat_and_lon(rng=args.seed)
+            elif args.operation == 'simplify':
+                result['simplified'] = gpx.simplify(args.tolerance, args.ele_tolerance)._asdict()
+
+            result['points'] = sum(len(segment.store) for segment in gpx.segments)
+            output_path = os.path.join(args.output_dir, output_name or os.path.basename(file_name))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            gpx.write(output_path)
+
+        result['ok'] = True
+    except Exception as error:
+        result['error'] = f'{type(error).__name__}: {error}'
+    finally:
+        if args.profile:
+            result['stats'] = profiling.disable().as_dict()
+
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def process_files(files, args):
+    names = output_names(files, args.inputs)
+    if args.workers <= 1:
+        return [process_file(file_name, args, names[file_name]) for file_name in files]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(process_file, file_name, args, names[file_name]) for file_name in files]
+        return [future.result() for future in futures]
+
+
+################################################################################
+# Report
+###
+
+def report(results, elapsed, out=sys.stdout):
+    for result in results:
+        if not result['ok']:
+            print(f"FAILED {result['file']}: {result['error']}", file=out)
+        elif result['summary'] is not None:
+            summary = result['summary']
+            print(
+                f"{result['file']}: {result['points']} points, "
+                f"{summary['distance'] / 1000:.2f} km, "
+                f"+{summary['elevation']:.0f} m / -{summary['descent']:.0f} m, "
+                f"{summary['time_spent'] / 3600:.2f} h",
+                file=out
+            )
+        elif result['simplified'] is not None:
+            simplified = result['simplified']
+            print(
+                f"{result['file']}: {simplified['kept']}/{simplified['points']} points kept, "
+                f"distance {simplified['distance_error']:+.0f} m, "
+                f"elevation {simplified['elevation_error']:+.0f} m",
+                file=out
+            )
+
+    ok = [result for result in results if result['ok']]
+    points = sum(result['points'] for result in ok)
+    megabytes = sum(result['bytes'] for result in ok) / 1024 / 1024
+    print(
+        f'{len(ok)}/{len(results)} files, {points} points, {megabytes:.1f} MB in {elapsed:.2f} s '
+        f'({len(ok) / elapsed:.1f} files/s, {points / elapsed:.0f} points/s, {megabytes / elapsed:.1f} MB/s)',
+        file=out
     )
-    gpx.write(OUTPUT_FILE)
+
+    if any(result['stats'] for result in results):
+        stats = profiling.Stats()
+        for result in results:
+            stats.merge(result['stats'] or {})
+        print(stats, file=out)
+
+
+# catalog every input directory, files which did not change are skipped
+def index(args, out=sys.stdout):
+    catalog = Catalog(args.catalog)
+    try:
+        reports = [catalog.index(directory, workers=args.workers) for directory in args.inputs]
+        for path, error in [failed for report in reports for failed in report.failed]:
+            print(f'FAILED {path}: {error}', file=out)
+        print(
+            f'{sum(report.indexed for report in reports)} indexed, '
+            f'{sum(report.unchanged for report in reports)} unchanged, '
+            f'{sum(report.removed for report in reports)} removed, '
+            f'{len(catalog)} files in {args.catalog}',
+            file=out
+        )
+    finally:
+        catalog.close()
+
+    return 0 if not any(report.failed for report in reports) else 1
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.operation == 'index':
+        return index(args)
+    files = find_files(args.inputs)
+    if args.operation != 'summary':
+        # two workers must not write the same file
+        pairs = same_outputs(output_names(files, args.inputs))
+        for first, second in pairs:
+            print(f'error: {first} and {second} would both be written to the same file', file=sys.stderr)
+        if pairs:
+            return 2
+
+    started = time.perf_counter()
+    results = process_files(files, args)
+    report(results, max(time.perf_counter() - started, 1e-9))
+
+    return 0 if all(result['ok'] for result in results) else 1
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import io
+import shutil
+from main import *
+
+
+def test_find_files(tmp_path):
+    (tmp_path / 'a.gpx').write_text('')
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'b.gpx').write_text('')
+    (tmp_path / 'c.txt').write_text('')
+
+    files = find_files([str(tmp_path), str(tmp_path / '*.gpx')])
+    assert files == [str(tmp_path / 'a.gpx'), str(tmp_path / 'sub' / 'b.gpx')]
+
+
+def test_summary_isolates_errors(tmp_path):
+    shutil.copy('fixtures/short_track.gpx', tmp_path / 'a.gpx')
+    (tmp_path / 'broken.gpx').write_text('<gpx')
+
+    for workers in (1, 2):
+        args = parse_args(['summary', str(tmp_path), '--workers', str(workers)])
+        results = process_files(find_files(args.inputs), args)
+
+        assert [result['ok'] for result in results] == [True, False]
+        assert results[0]['points'] == 30
+        assert results[0]['summary'] == summary_of(GPX('fixtures/short_track.gpx').trkpts)._asdict()
+        assert results[1]['error']
+
+        out = io.StringIO()
+        report(results, 1.0, out=out)
+        assert 'FAILED' in out.getvalue()
+        assert '1/2 files, 30 points' in out.getvalue()
+
+
+def test_set_new_datetime(tmp_path):
+    main(['set_new_datetime', 'fixtures/short_track.gpx', '-o', str(tmp_path), '-w', '1',
+          '--datetime', '2022-01-01T10:00:00'])
+
+    gpx = GPX(str(tmp_path / 'short_track.gpx'))
+    assert gpx.get_meta_datetime() == datetime.datetime(2022, 1, 1, 10, 0, 0)
+    assert len(gpx.trkpts) == 30
+
+
+def test_points_of_every_segment(tmp_path):
+    args = parse_args(['set_new_datetime', 'fixtures/multi_track.gpx', '-o', str(tmp_path), '-w', '1',
+                       '--datetime', '2022-01-01T10:00:00'])
+    results = process_files(find_files(args.inputs), args)
+    assert results[0]['points'] == 30
+
+
+def test_simplify(tmp_path):
+    main(['simplify', 'fixtures/short_track.gpx', '-o', str(tmp_path), '-w', '1', '--tolerance', '2'])
+
+    gpx = GPX(str(tmp_path / 'short_track.gpx'))
+    assert 2 <= len(gpx.trkpts) < 30
+
+
+def test_output_paths(tmp_path, capsys):
+    for sub in ('a', 'b'):
+        (tmp_path / 'in' / sub).mkdir(parents=True)
+        shutil.copy('fixtures/short_track.gpx', tmp_path / 'in' / sub / 'x.gpx')
+
+    out = tmp_path / 'out'
+    assert main(['set_new_datetime', str(tmp_path / 'in'), '-o', str(out), '-w', '2',
+                 '--datetime', '2022-01-01T10:00:00']) == 0
+    assert sorted(path.relative_to(out).as_posix() for path in out.rglob('*.gpx')) == ['a/x.gpx', 'b/x.gpx']
+
+    # the same file name from two glob patterns
+    assert main(['set_new_datetime', str(tmp_path / 'in' / 'a' / '*.gpx'), str(tmp_path / 'in' / 'b' / '*.gpx'),
+                 '-o', str(tmp_path / 'flat'), '-w', '1', '--datetime', '2022-01-01T10:00:00']) == 2
+    assert 'would both be written' in capsys.readouterr().err
+    assert not (tmp_path / 'flat').exists()
+
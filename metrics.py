@@ -0,0 +1,219 @@
+import collections
+import numpy as np
+
+import profiling
+
+# in km, same as haversine
+AVG_EARTH_RADIUS = 6371.0088
+
+# distance, elevation, descent: in meter
+# time_spent: in second
+# eph, speed, pace: None when the track has no time span / no distance
+Summary = collections.namedtuple('Summary', [
+    'distance',
+    'elevation',
+    'descent',
+    'time_spent',
+    'effort_points',
+    'eph',
+    'speed',
+    'pace',
+])
+
+
+################################################################################
+# Pairwise kernels
+#
+# Points are compared every `sample_rate` rows, the pairs being
+# (0, s), (s, 2s), ... exactly as the loops in gpx.py walk a track.
+###
+
+# in meter, element-wise haversine
+@profiling.timed
+def haversine_of(lat1, lon1, lat2, lon2):
+    lat1 = np.radians(lat1)
+    lon1 = np.radians(lon1)
+    lat2 = np.radians(lat2)
+    lon2 = np.radians(lon2)
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    # float_power calls pow() like the ** of the haversine package,
+    # squaring with a multiplication drifts by one ulp now and then
+    two = np.full(np.shape(dlat), 2.0)
+    d = (
+        np.float_power(np.sin(dlat * 0.5), two)
+        + np.cos(lat1) * np.cos(lat2) * np.float_power(np.sin(dlon * 0.5), two)
+    )
+    return 2 * AVG_EARTH_RADIUS * np.arcsin(np.sqrt(d)) * 1000
+
+
+# in meter, one value per sampled pair
+def distances(lat, lon, sample_rate=1):
+    lat = lat[::sample_rate]
+    lon = lon[::sample_rate]
+    return haversine_of(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+
+# in meter, one value per sampled pair
+def elevation_diffs(ele, sample_rate=1):
+    ele = ele[::sample_rate]
+    return ele[1:] - ele[:-1]
+
+
+# left to right like `total += x`, np.sum would add pairwise
+def total(values):
+    if len(values) == 0:
+        return 0
+    return float(np.cumsum(values)[-1])
+
+
+def ascent_of_diffs(diffs):
+    return total(np.where(diffs > 0, diffs, 0))
+
+
+def descent_of_diffs(diffs):
+    return total(np.where(diffs < 0, -diffs, 0))
+
+
+# in second, time in microsecond since epoch
+def time_span(time):
+    return float(time[-1] - time[0]) / 1000000
+
+
+################################################################################
+# Aggregation over whole columns
+###
+
+def summarize(lat, lon, ele, time, sample_rate=1):
+    distance = total(distances(lat, lon, sample_rate))
+    diffs = elevation_diffs(ele, sample_rate)
+    elevation = ascent_of_diffs(diffs)
+    descent = descent_of_diffs(diffs)
+    time_spent = time_span(time)
+    return summary_from(distance, elevation, descent, time_spent)
+
+
+def summary_from(distance, elevation, descent, time_spent):
+    effort_points = (distance / 1000) + (elevation / 100)
+    eph = speed = pace = None
+    if time_spent != 0:
+        eph = effort_points / (time_spent / 60 / 60)
+        speed = (distance / 1000) / (time_spent / 60 / 60)
+    if distance != 0:
+        pace = (time_spent / (distance / 1000) / 60)
+
+    return Summary(distance, elevation, descent, time_spent, effort_points, eph, speed, pace)
+
+
+# Summary of several tracks walked one after the other, without what is
+# between them
+def combine(summaries):
+    return summary_from(
+        sum(summary.distance for summary in summaries),
+        sum(summary.elevation for summary in summaries),
+        sum(summary.descent for summary in summaries),
+        sum(summary.time_spent for summary in summaries)
+    )
+
+
+################################################################################
+# Positions along a track
+###
+
+# in meter, distance walked from the first point at every point
+def cumulative_distances(lat, lon):
+    return np.concatenate(([0], np.cumsum(distances(lat, lon))))
+
+
+# lat, lon, ele of the points at the given walked distances (sorted),
+# interpolated linearly between the two surrounding points; ele is the one
+# of the point ahead. Distances past the end of the track are dropped.
+def positions_at(lat, lon, ele, targets):
+    walked = cumulative_distances(lat, lon)
+    targets = targets[(targets > 0) & (targets <= walked[-1])]
+
+    ahead = np.searchsorted(walked, targets, side='left')
+    behind = ahead - 1
+    percentile = (walked[ahead] - targets) / (walked[ahead] - walked[behind])
+
+    new_lat = lat[ahead] + (lat[behind] - lat[ahead]) * percentile
+    new_lon = lon[ahead] + (lon[behind] - lon[ahead]) * percentile
+    return new_lat, new_lon, ele[ahead]
+
+
+################################################################################
+# Prefix sums
+#
+# distance[i] is the distance walked from the first point of the chain
+# i % s, i % s + s, ..., i, for s the sample rate; ascent and descent
+# alike. A window (h, t) then samples the pairs h, h + s, ... up to
+# e = h + s * ((t - h) // s), and its distance is distance[e] - distance[h].
+#
+# Rows from `valid` onward are stale, they are recomputed on the next
+# query. Equal to the loops of gpx.py up to float rounding.
+###
+
+class PrefixIndex:
+    def __init__(self, store, sample_rate=1):
+        self.store = store
+        self.sample_rate = sample_rate
+        self.distance = np.zeros(0)
+        self.ascent = np.zeros(0)
+        self.descent = np.zeros(0)
+        self.valid = 0
+        store.listeners.append(self.invalidate)
+
+    def invalidate(self, row):
+        self.valid = min(self.valid, row)
+
+    def refresh(self):
+        n = len(self.store)
+        s = self.sample_rate
+        if self.valid == n and len(self.distance) == n:
+            return
+
+        start = max(self.valid, s)
+        lat, lon, ele = self.store.lat, self.store.lon, self.store.ele
+        step_distance = np.zeros(n)
+        step_ascent = np.zeros(n)
+        step_descent = np.zeros(n)
+        if start < n:
+            step_distance[start:] = haversine_of(lat[start-s:n-s], lon[start-s:n-s], lat[start:], lon[start:])
+            diffs = ele[start:] - ele[start-s:n-s]
+            step_ascent[start:] = np.where(diffs > 0, diffs, 0)
+            step_descent[start:] = np.where(diffs < 0, -diffs, 0)
+
+        self.distance = self.accumulate(self.distance, step_distance, start)
+        self.ascent = self.accumulate(self.ascent, step_ascent, start)
+        self.descent = self.accumulate(self.descent, step_descent, start)
+        self.valid = n
+
+    # keep cumulated[:start], chain the steps from start onward
+    def accumulate(self, cumulated, steps, start):
+        n = len(steps)
+        s = self.sample_rate
+        result = np.zeros(n)
+        kept = min(start, len(cumulated), n)
+        result[:kept] = cumulated[:kept]
+
+        for residue in range(s):
+            first = residue + s * max(0, -(-(kept - residue) // s))
+            if first >= n:
+                continue
+            base = result[first - s] if first >= s else 0
+            result[first::s] = base + np.cumsum(steps[first::s])
+
+        return result
+
+    # metrics.Summary of the rows start_idx..end_idx, inclusive
+    def summary(self, start_idx, end_idx):
+        self.refresh()
+        s = self.sample_rate
+        last = start_idx + s * ((end_idx - start_idx) // s)
+        distance = float(self.distance[last] - self.distance[start_idx])
+        elevation = float(self.ascent[last] - self.ascent[start_idx])
+        descent = float(self.descent[last] - self.descent[start_idx])
+        time = self.store.time
+        time_spent = float(time[end_idx] - time[start_idx]) / 1000000
+        return summary_from(distance, elevation, descent, time_spent)
@@ -0,0 +1,74 @@
+from metrics import *
+from haversine import haversine
+import numpy as np
+
+
+def test_distances():
+    lat = np.array([22.349095, 22.3491406, 22.3492, 22.35])
+    lon = np.array([114.194624, 114.1946828, 114.1948, 114.2])
+
+    got = distances(lat, lon)
+    assert len(got) == 3
+    for i in range(3):
+        assert got[i] == haversine((lat[i], lon[i]), (lat[i+1], lon[i+1])) * 1000
+
+    got = distances(lat, lon, sample_rate=2)
+    assert len(got) == 1
+    assert got[0] == haversine((lat[0], lon[0]), (lat[2], lon[2])) * 1000
+
+
+def test_ascent_and_descent_of_diffs():
+    diffs = elevation_diffs(np.array([10.0, 10.5, 10.2, 11.0, 9.0]))
+
+    assert ascent_of_diffs(diffs) == 0.5 + (11.0 - 10.2)
+    assert descent_of_diffs(diffs) == (10.5 - 10.2) + 2.0
+    assert ascent_of_diffs(diffs[:0]) == 0
+
+
+def test_summarize():
+    lat = np.array([22.349095, 22.3491406, 22.3492])
+    lon = np.array([114.194624, 114.1946828, 114.1948])
+    ele = np.array([122.9, 122.4, 123.0])
+    time = np.array([0, 3000000, 4000000])
+
+    summary = summarize(lat, lon, ele, time)
+    assert summary.time_spent == 4.0
+    assert summary.effort_points == summary.distance / 1000 + summary.elevation / 100
+    assert summary.speed == (summary.distance / 1000) / (4.0 / 60 / 60)
+
+    summary = summarize(lat[:1], lon[:1], ele[:1], time[:1])
+    assert summary.distance == 0
+    assert summary.eph is None
+    assert summary.pace is None
+
+
+def test_prefix_index():
+    from track_store import TrackStore
+    lat = np.array([22.349095, 22.3491406, 22.3492, 22.35, 22.351])
+    lon = np.array([114.194624, 114.1946828, 114.1948, 114.2, 114.21])
+    ele = np.array([122.9, 122.4, 123.0, 125.0, 121.0])
+    time = np.array([0, 3000000, 4000000, 6000000, 9000000])
+    store = TrackStore(lat, lon, ele, time, [None] * 5)
+
+    index = PrefixIndex(store)
+    got = index.summary(1, 3)
+    want = summarize(lat[1:4], lon[1:4], ele[1:4], time[1:4])
+    assert np.allclose(got[:5], want[:5])
+
+    store.ele[2] = 130.0
+    store.changed(2)
+    got = index.summary(1, 4)
+    assert np.isclose(got.elevation, 130.0 - 122.4)
+    assert np.isclose(got.descent, 130.0 - 121.0)
+
+
+def test_positions_at():
+    lat = np.array([0.0, 0.0, 0.0])
+    lon = np.array([0.0, 0.001, 0.002])
+    ele = np.array([1.0, 2.0, 3.0])
+    walked = cumulative_distances(lat, lon)
+
+    new_lat, new_lon, new_ele = positions_at(lat, lon, ele, np.array([walked[1] / 2, walked[1], walked[2] * 0.75, walked[2] + 1]))
+    assert np.allclose(new_lon, [0.0005, 0.001, 0.0015])
+    assert list(new_lat) == [0.0, 0.0, 0.0]
+    assert list(new_ele) == [2.0, 2.0, 3.0]
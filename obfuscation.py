@@ -1,59 +1,116 @@
+import functools
+import itertools
 import numpy as np
-import random
+
+# above this many multiply-adds, waves are laid out with an FFT convolution
+DIRECT_CONVOLUTION_LIMIT = 1 << 20
 
 
 # general a large array of target to be consumed
-def random_target_speeds(n, base=10, width_scale=1, height_scale=1):
-    results = [base] * n
+# rng: numpy.random.Generator or seed
+def random_target_speeds(n, base=10, width_scale=1, height_scale=1, rng=None):
+    rng = np.random.default_rng(rng)
+    results = np.full(n, base, dtype=np.float64)
 
     # smallest flustration
-    results = map(
-        lambda x, y: x + y,
-        results,
-        flustrate(n, int(n/100 * width_scale), 0.1 * height_scale, 1000)
-    )
+    results += flustrate(n, int(n/100 * width_scale), 0.1 * height_scale, 1000, rng=rng)
 
     # medium flustration
-    results = map(
-        lambda x, y: x + y,
-        results,
-        flustrate(n, int(n/20 * width_scale), 0.15 * height_scale, 100)
-    )
+    results += flustrate(n, int(n/20 * width_scale), 0.15 * height_scale, 100, rng=rng)
 
     # high flustration
-    results = map(
-        lambda x, y: x + y,
-        results,
-        flustrate(n, int(n/5 * width_scale), 0.2 * height_scale, 10)
+    results += flustrate(n, int(n/5 * width_scale), 0.2 * height_scale, 10, rng=rng)
+
+    return results
+
+
+# t upward and t downward waves of width w and height h at random positions
+def flustrate(n, w, h, t, rng=None):
+    rng = np.random.default_rng(rng)
+    if w == 0:
+        return np.zeros(n)
+
+    # a downward wave is an upward one upside down: count each start
+    # position once, +1 per upward wave and -1 per downward one
+    positions = n - w + 1
+    starts = (
+        np.bincount(rng.integers(0, positions, t), minlength=positions)
+        - np.bincount(rng.integers(0, positions, t), minlength=positions)
     )
+    return lay_waves(starts.astype(np.float64), w) * h
 
-    return list(results)
 
+# sum of unit upward waves of width w, weighted by the counts of their
+# start positions: the full convolution of counts with the wave shape
+def lay_waves(counts, w):
+    if len(counts) * w <= DIRECT_CONVOLUTION_LIMIT:
+        return np.convolve(counts, wave_shape(w))
 
-def flustrate(n, w, h, t):
-    results = [0] * n
+    # padded to a power of two, prime sizes are slow to transform
+    size = len(counts) + w - 1
+    padded = 1 << (size - 1).bit_length()
+    spectrum = np.fft.rfft(counts, padded) * wave_spectrum(w, padded)
+    return np.fft.irfft(spectrum, padded)[:size]
 
-    # upward wave
-    for i in range(t):
-        position = random.randint(0, n - w)
-        wave = upward_wave(w, h)
-        for j in range(len(wave)):
-            results[position + j] += wave[j]
 
-    # downward wave
-    for i in range(t):
-        position = random.randint(0, n - w)
-        wave = downward_wave(w, h)
-        for j in range(len(wave)):
-            results[position + j] += wave[j]
+@functools.lru_cache(maxsize=64)
+def wave_shape(w):
+    shape = np.sin(np.linspace(0, np.pi, w))
+    shape.flags.writeable = False
+    return shape
+
+
+@functools.lru_cache(maxsize=16)
+def wave_spectrum(w, padded):
+    spectrum = np.fft.rfft(wave_shape(w), padded)
+    spectrum.flags.writeable = False
+    return spectrum
 
-    return results
 
 # produce an upward wave wi
 def upward_wave(w, h):
-    x = np.linspace(0, np.pi, w)
-    return np.sin(x) * h
+    return wave_shape(w) * h
 
 def downward_wave(w, h):
-    x = np.linspace(np.pi, np.pi *2, w)
-    return np.sin(x) * h
+    return -wave_shape(w) * h
+
+
+# Points to keep after random deletions: every kept point draws a lottery
+#   1 in 1200: the next 6 to 10 points are deleted
+#   1 in 1200 to 10 in 1200: the next 2 to 5
+#   10 in 1200 to 100 in 1200: the next one
+# rng: numpy.random.Generator or seed
+def thinning_mask(n, rng=None):
+    rng = np.random.default_rng(rng)
+    lottery = rng.integers(1, 1201, n)
+
+    run = np.zeros(n, dtype=np.int64)
+    run[lottery <= 100] = 1
+    small = (lottery > 1) & (lottery <= 10)
+    run[small] = rng.integers(2, 6, np.count_nonzero(small))
+    large = lottery == 1
+    run[large] = rng.integers(6, 11, np.count_nonzero(large))
+
+    # a point deleted by an earlier draw does not draw itself
+    starts = []
+    ends = []
+    cursor = 0
+    for position in np.flatnonzero(run).tolist():
+        if position < cursor:
+            continue
+        cursor = position + 1 + int(run[position])
+        starts.append(position + 1)
+        ends.append(min(cursor, n))
+
+    deleted = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(deleted, np.array(starts, dtype=np.intp), 1)
+    np.add.at(deleted, np.array(ends, dtype=np.intp), -1)
+    return np.cumsum(deleted[:n]) == 0
+
+
+# thinned copy of a list, or of anything with a take(rows) like TrackStore
+def thin(points, rng=None):
+    mask = thinning_mask(len(points), rng=rng)
+    if isinstance(points, list):
+        return list(itertools.compress(points, mask))
+    return points.take(np.flatnonzero(mask))
@@ -0,0 +1,59 @@
+from obfuscation import *
+from track_store import TrackStore
+
+
+def test_thinning_mask():
+    mask = thinning_mask(100000, rng=1)
+
+    assert mask.dtype == bool
+    assert list(mask) == list(thinning_mask(100000, rng=1))
+    assert 0.85 < mask.mean() < 0.95
+
+    # deletions come in runs of at most 10 points
+    deleted = np.flatnonzero(~mask)
+    assert mask[0]
+    assert np.max(np.diff(np.flatnonzero(mask))) <= 11
+    assert len(deleted) > 0
+
+
+def test_thin():
+    points = list(range(5000))
+    thinned = thin(points, rng=np.random.default_rng(2))
+    assert thinned == [p for p, keep in zip(points, thinning_mask(5000, rng=2)) if keep]
+
+    store = TrackStore(
+        np.arange(5000, dtype=np.float64),
+        np.zeros(5000),
+        np.zeros(5000),
+        np.zeros(5000, dtype=np.int64),
+        points
+    )
+    thinned_store = thin(store, rng=2)
+    assert list(thinned_store.lat) == [float(p) for p in thinned]
+    assert thinned_store.elements == thinned
+
+
+def test_flustrate():
+    n, w, h = 5000, 250, 0.3
+    got = flustrate(n, w, h, 100, rng=1)
+
+    rng = np.random.default_rng(1)
+    upward = rng.integers(0, n - w + 1, 100)
+    downward = rng.integers(0, n - w + 1, 100)
+    want = np.zeros(n)
+    for position in upward:
+        want[position:position + w] += np.sin(np.linspace(0, np.pi, w)) * h
+    for position in downward:
+        want[position:position + w] += np.sin(np.linspace(np.pi, np.pi * 2, w)) * h
+
+    assert np.allclose(got, want)
+    assert np.all(flustrate(n, 0, h, 100, rng=1) == 0)
+
+
+def test_random_target_speeds():
+    speeds = random_target_speeds(300000, base=10, height_scale=1.5, rng=3)
+
+    assert isinstance(speeds, np.ndarray)
+    assert speeds.shape == (300000,)
+    assert np.array_equal(speeds, random_target_speeds(300000, base=10, height_scale=1.5, rng=3))
+    assert abs(speeds.mean() - 10) < 1
@@ -0,0 +1,119 @@
+import collections
+import contextlib
+import functools
+import time
+
+# Opt-in timing of the stages of GPX operations:
+#
+#   stats = profiling.enable(hook=lambda stage, seconds: ...)
+#   ...
+#   print(stats)
+#   profiling.disable()
+#
+# Times are wall times and inclusive, the time of a stage counts in the
+# stages around it too (`GPX.__init__` holds `ET.parse`). While disabled
+# a stage costs one attribute lookup, so instrumentation may stay in
+# place in hot paths (not per point though).
+
+
+class Stats:
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.seconds = collections.Counter()
+
+    def record(self, stage, seconds):
+        self.calls[stage] += 1
+        self.seconds[stage] += seconds
+
+    def reset(self):
+        self.calls.clear()
+        self.seconds.clear()
+
+    # add the stages of another Stats, or of its as_dict()
+    def merge(self, other):
+        if isinstance(other, Stats):
+            other = other.as_dict()
+        for stage, values in other.items():
+            self.calls[stage] += values['calls']
+            self.seconds[stage] += values['seconds']
+
+    def as_dict(self):
+        return {
+            stage: {'calls': self.calls[stage], 'seconds': self.seconds[stage]}
+            for stage in self.calls
+        }
+
+    # slowest first
+    def __str__(self):
+        lines = [f'{"stage":<40} {"calls":>8} {"seconds":>10}']
+        for stage, seconds in self.seconds.most_common():
+            lines.append(f'{stage:<40} {self.calls[stage]:>8} {seconds:>10.4f}')
+        return '\n'.join(lines)
+
+
+class State:
+    def __init__(self):
+        self.enabled = False
+        self.stats = Stats()
+        self.hook = None
+
+
+state = State()
+DISABLED = contextlib.nullcontext()
+
+
+# stats: Stats to record into, a new one by default
+# hook(stage, seconds): called after every stage
+def enable(stats=None, hook=None):
+    state.stats = Stats() if stats is None else stats
+    state.hook = hook
+    state.enabled = True
+    return state.stats
+
+
+def disable():
+    state.enabled = False
+    state.hook = None
+    return state.stats
+
+
+def stats():
+    return state.stats
+
+
+class Stage:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        seconds = time.perf_counter() - self.started
+        state.stats.record(self.name, seconds)
+        if state.hook is not None:
+            state.hook(self.name, seconds)
+
+
+# with stage('ET.parse'): ...
+def stage(name):
+    if not state.enabled:
+        return DISABLED
+    return Stage(name)
+
+
+# decorator, times every call as a stage named after the function
+def timed(function):
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not state.enabled:
+            return function(*args, **kwargs)
+        with Stage(name):
+            return function(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,50 @@
+from gpx import *
+import profiling
+
+
+def test_disabled_by_default():
+    assert not profiling.state.enabled
+    assert profiling.stage('ET.parse') is profiling.DISABLED
+
+    before = profiling.stats().as_dict()
+    summary_of(GPX('fixtures/short_track.gpx').trkpts)
+    assert profiling.stats().as_dict() == before
+
+
+def test_stages_and_hook():
+    calls = []
+    stats = profiling.enable(hook=lambda stage, seconds: calls.append(stage))
+    try:
+        gpx = GPX('fixtures/short_track.gpx')
+        summary_of(gpx.trkpts)
+        summary_of(gpx.trkpts)
+    finally:
+        profiling.disable()
+
+    assert stats.calls['GPX.__init__'] == 1
+    assert stats.calls['parse'] == 1
+    assert stats.calls['TrackSegment.load_store'] == 1
+    assert stats.calls['parse_times'] == 1
+    assert stats.calls['summary_of'] == 2
+    assert stats.calls['haversine_of'] == 2
+    assert stats.seconds['GPX.__init__'] >= stats.seconds['parse'] > 0
+
+    # inner stages end first, trkpts are loaded on first access
+    assert calls[:4] == ['parse', 'GPX.__init__', 'parse_times', 'TrackSegment.load_store']
+    assert sorted(calls) == sorted(stats.calls.elements())
+    assert 'summary_of' in str(stats)
+
+
+def test_merge():
+    stats = profiling.Stats()
+    stats.record('a', 1.0)
+    other = profiling.Stats()
+    other.record('a', 0.5)
+    other.record('b', 2.0)
+
+    stats.merge(other)
+    stats.merge(other.as_dict())
+    assert stats.as_dict() == {'a': {'calls': 3, 'seconds': 2.0}, 'b': {'calls': 2, 'seconds': 4.0}}
+
+    stats.reset()
+    assert stats.as_dict() == {}
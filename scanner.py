@@ -0,0 +1,165 @@
+import mmap
+import re
+import numpy as np
+
+import gpx
+import metrics
+import profiling
+import timestamp
+from track_store import NO_TIME
+
+NAMESPACE = b'xmlns="http://www.topografix.com/GPX/1/1"'
+
+TRKPT = re.compile(
+    rb'<trkpt\s+lat="([^"]*)"\s+lon="([^"]*)"\s*>\s*'
+    rb'(?:<ele>([^<]*)</ele>\s*)?'
+    rb'(?:<time>([^<]*)</time>)?'
+)
+
+# the metadata comes first, within the head of the file
+META_TIME = re.compile(rb'<time>([^<]*)</time>')
+HEAD_SIZE = 1 << 16
+
+# layouts the scanner does not read: prefixed GPX tags, comments, CDATA
+PREFIXED = re.compile(rb':(?:trk|trkseg|trkpt|ele|time)[\s/>]')
+UNSUPPORTED = [b'<!--', b'<![CDATA[']
+
+
+################################################################################
+# Scanner
+#
+# Read-only fast path for summaries: the trkpt attributes, ele and time of
+# a memory-mapped file are matched as bytes and converted in bulk, no tree
+# nor TrackPoint is built. Only the usual layout is read, the default GPX
+# 1.1 namespace with ele and time first in every trkpt as the schema
+# orders them; anything else raises ValueError and read_segments falls
+# back to GPX.
+###
+
+# List[(lat, lon, ele, time)], one per trkseg in document order
+@profiling.timed
+def scan_segments(file_name):
+    with open(file_name, 'rb') as source:
+        try:
+            data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(f'{file_name} is empty')
+
+    with data:
+        if (
+            data.find(NAMESPACE) == -1
+            or any(data.find(text) != -1 for text in UNSUPPORTED)
+            or PREFIXED.search(data)
+        ):
+            raise ValueError(f'{file_name} is not laid out for the scanner')
+
+        return [columns_of(body, file_name) for body in trkseg_bodies(data, file_name)]
+
+
+# content of every trkseg, b'' for <trkseg/>
+def trkseg_bodies(data, file_name):
+    bodies = []
+    start = data.find(b'<trkseg')
+    while start != -1:
+        tag_end = data.find(b'>', start)
+        following = data[start + 7:start + 8]
+        if tag_end == -1 or not (following.isspace() or following in (b'/', b'>')):
+            raise ValueError(f'{file_name} has a trkseg the scanner does not read')
+
+        if data[tag_end - 1:tag_end] == b'/':
+            bodies.append(b'')
+            end = tag_end + 1
+        else:
+            end = data.find(b'</trkseg>', tag_end)
+            if end == -1 or data.find(b'trkseg', tag_end, end) != -1:
+                raise ValueError(f'{file_name} has a trkseg the scanner does not read')
+            bodies.append(data[tag_end + 1:end])
+        start = data.find(b'<trkseg', end)
+
+    return bodies
+
+
+# every trkpt must have been matched, with all its ele and time
+def columns_of(body, file_name):
+    trkpts = TRKPT.findall(body)
+    if not trkpts:
+        if body.count(b'<trkpt'):
+            raise ValueError(f'{file_name} has a trkpt the scanner does not read')
+        return (
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.int64),
+        )
+
+    lat, lon, ele, time = (np.array(column, dtype=np.bytes_) for column in zip(*trkpts))
+    has_ele = ele != b''
+    has_time = time != b''
+    if (
+        len(trkpts) != body.count(b'<trkpt')
+        or np.count_nonzero(has_ele) != body.count(b'<ele')
+        or np.count_nonzero(has_time) != body.count(b'<time')
+    ):
+        raise ValueError(f'{file_name} has a trkpt the scanner does not read')
+
+    epochs = np.full(len(time), NO_TIME, dtype=np.int64)
+    with profiling.stage('parse_times'):
+        epochs[has_time] = timestamp.parse_times(time[has_time].astype(np.str_).tolist())
+
+    return (
+        lat.astype(np.float64),
+        lon.astype(np.float64),
+        np.where(has_ele, ele, b'nan').astype(np.float64),
+        epochs,
+    )
+
+
+# text of the metadata time, None when the metadata has no time or the
+# first trk comes without metadata
+def scan_meta_time(file_name):
+    with open(file_name, 'rb') as source:
+        head = source.read(HEAD_SIZE)
+
+    start = head.find(b'<metadata>')
+    trk = head.find(b'<trk>')
+    if trk != -1 and (start == -1 or trk < start):
+        return None
+    end = head.find(b'</metadata>', start)
+    if start == -1 or end == -1:
+        raise ValueError(f'{file_name} has no metadata in its head')
+    found = META_TIME.search(head, start, end)
+    return None if found is None else found.group(1).strip().decode('ascii')
+
+
+# scan_segments, or the columns of the GPX stores when the file cannot be
+# scanned
+def read_segments(file_name):
+    try:
+        return scan_segments(file_name)
+    except ValueError:
+        return [segment.store.columns() for segment in gpx.GPX(file_name).segments]
+
+
+# (metadata time text, read_segments), from the same GPX when it falls back
+def read_file(file_name):
+    try:
+        return scan_meta_time(file_name), scan_segments(file_name)
+    except ValueError:
+        parsed = gpx.GPX(file_name)
+        return parsed.meta_time, [segment.store.columns() for segment in parsed.segments]
+
+
+# same as GPX(file_name).summary()
+def read_summary(file_name):
+    return summary_of_segments(read_segments(file_name))
+
+
+# metrics.Summary of all the segments together, see GPX.summary
+def summary_of_segments(segments):
+    return metrics.combine([summary_of_columns(*columns) for columns in segments])
+
+
+def summary_of_columns(lat, lon, ele, time):
+    if len(lat) == 0:
+        return metrics.summary_from(0, 0, 0, 0)
+    return metrics.summarize(lat, lon, ele, time, sample_rate=gpx.SAMPLE_RATE)
@@ -0,0 +1,60 @@
+import pytest
+from gpx import *
+import scanner
+
+
+def assert_same_columns(segments, gpx):
+    assert len(segments) == len(gpx.segments)
+    for columns, segment in zip(segments, gpx.segments):
+        for got, want in zip(columns, segment.store.columns()):
+            assert got.dtype == want.dtype
+            assert np.array_equal(got, want, equal_nan=True)
+
+
+@pytest.mark.parametrize('file_name', ['fixtures/short_track.gpx', 'fixtures/multi_track.gpx', 'fixtures/no_meta_time.gpx'])
+def test_scan_segments(file_name):
+    assert_same_columns(scanner.scan_segments(file_name), GPX(file_name))
+    assert scanner.read_summary(file_name) == GPX(file_name).summary()
+    assert scanner.scan_meta_time(file_name) == GPX(file_name).meta_time
+
+
+def test_without_metadata(tmp_path):
+    text = open('fixtures/no_meta_time.gpx').read()
+    file_name = str(tmp_path / 'bare.gpx')
+    open(file_name, 'w').write(text.replace(' <metadata>\n </metadata>\n', ''))
+
+    assert scanner.scan_meta_time(file_name) is None
+    assert scanner.read_file(file_name)[0] is None
+
+
+def test_missing_ele_and_time(tmp_path):
+    text = open('fixtures/short_track.gpx').read()
+    text = text.replace('<ele>122.4</ele>', '', 1).replace('<time>2021-03-07T00:29:12Z</time>', '', 1)
+    file_name = str(tmp_path / 'sparse.gpx')
+    open(file_name, 'w').write(text)
+
+    segments = scanner.scan_segments(file_name)
+    assert np.isnan(segments[0][2][1])
+    assert segments[0][3][1] == NO_TIME
+    assert_same_columns(segments, GPX(file_name))
+
+
+@pytest.mark.parametrize('old, new', [
+    ('<trkpt lat="22.3491406" lon="114.1946828">', '<trkpt lon="114.1946828" lat="22.3491406">'),
+    ('<ele>122.4</ele>', '<ele>\n122.4</ele><!-- corrected -->'),
+    ('<time>2021-03-07T00:29:12Z</time>', '<name>stop</name><time>2021-03-07T00:29:12Z</time>'),
+    ('</trkseg>', '</trkseg >'),
+])
+def test_fall_back(tmp_path, old, new):
+    text = open('fixtures/multi_track.gpx').read()
+    assert old in text
+    file_name = str(tmp_path / 'odd.gpx')
+    open(file_name, 'w').write(text.replace(old, new, 1))
+
+    with pytest.raises(ValueError):
+        scanner.scan_segments(file_name)
+    assert_same_columns(scanner.read_segments(file_name), GPX(file_name))
+    assert scanner.read_summary(file_name) == GPX(file_name).summary()
+    meta_time, segments = scanner.read_file(file_name)
+    assert meta_time == GPX(file_name).meta_time
+    assert_same_columns(segments, GPX(file_name))
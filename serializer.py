@@ -0,0 +1,314 @@
+import gzip
+import operator
+import xml.etree.ElementTree as ET
+import numpy as np
+
+import profiling
+
+# placeholders written in place of the trkpts of every trkseg, a tag name
+# cannot show up anywhere else in the output
+MARKER = 'GPX_SERIALIZER_TRKPTS'
+
+TAG = operator.attrgetter('tag')
+
+# the private helpers of ElementTree the serializer builds on, they are not
+# part of its API: without them the tree is written by ElementTree.write
+INTERNALS = all(hasattr(ET, name) for name in ('_namespaces', '_serialize_xml'))
+
+
+################################################################################
+# Direct serializer
+#
+# Writes the same bytes as rounding every trkpt through the TrackPoint
+# setters then ElementTree.write(encoding='utf-8', xml_declaration=True),
+# without touching the tree or the store:
+#   - lat, lon, ele come from the store columns, rounded in bulk
+#   - time texts and the other children (extensions) are written as they
+#     are in the tree
+#   - everything around the trkseg is serialized by ElementTree itself
+#
+# Without the ElementTree internals it relies on (INTERNALS), the rounded
+# values are put in the tree for ElementTree.write and put back afterwards.
+###
+
+# segments: List[(trkseg element, TrackStore of its trkpts)]
+# compress: gzip the output, by default when file_path ends with .gz
+@profiling.timed
+def write_gpx(file_path, root, segments, lat_p, lon_p, ele_p, compress=None, chunk_size=65536):
+    if compress is None:
+        compress = str(file_path).endswith('.gz')
+    if not INTERNALS:
+        tree_write(file_path, root, segments, lat_p, lon_p, ele_p, compress)
+        return
+
+    # empty trksegs are written by ElementTree as they are
+    segments = [(trkseg, store) for trkseg, store in segments if len(trkseg)]
+
+    try:
+        qnames, namespaces = namespaces_of(root)
+        pieces = around_trkpts(root, [trkseg for trkseg, _ in segments], qnames, namespaces)
+    except TypeError:
+        # internals of another signature
+        tree_write(file_path, root, segments, lat_p, lon_p, ele_p, compress)
+        return
+
+    if compress:
+        out = gzip.open(file_path, 'wt', encoding='utf-8', compresslevel=6)
+    else:
+        out = open(file_path, 'w', encoding='utf-8')
+
+    with out:
+        out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        writer = TrkptWriter(qnames)
+        for piece, (_, store) in zip(pieces, segments):
+            out.write(piece)
+
+            lat = format_column(store.lat, lat_p, '%.7f')
+            lon = format_column(store.lon, lon_p, '%.7f')
+            ele = format_column(store.ele, ele_p, '%.1f')
+            for start in range(0, len(store), chunk_size):
+                rows = slice(start, start + chunk_size)
+                out.write(writer.trkpts_xml(store.elements[rows], lat[rows], lon[rows], ele[rows]))
+        out.write(pieces[-1])
+
+
+# ElementTree.write of the tree with the rounded values, the texts of the
+# tree are put back afterwards
+def tree_write(file_path, root, segments, lat_p, lon_p, ele_p, compress):
+    # (element, lat, lon, ele element, ele text) to put back
+    saved = []
+    try:
+        for trkseg, store in segments:
+            namespace = trkseg.tag[:-len('trkseg')]
+            lat = format_column(store.lat, lat_p, '%.7f')
+            lon = format_column(store.lon, lon_p, '%.7f')
+            ele = format_column(store.ele, ele_p, '%.1f')
+            for element, lat_text, lon_text, ele_text in zip(store.elements, lat, lon, ele):
+                ele_element = element.find(f'{namespace}ele')
+                saved.append((
+                    element, element.get('lat'), element.get('lon'),
+                    ele_element, None if ele_element is None else ele_element.text
+                ))
+                element.set('lat', lat_text)
+                element.set('lon', lon_text)
+                if ele_element is not None:
+                    ele_element.text = ele_text
+
+        if compress:
+            out = gzip.open(file_path, 'wb', compresslevel=6)
+        else:
+            out = open(file_path, 'wb')
+        with out:
+            ET.ElementTree(root).write(out, encoding='utf-8', xml_declaration=True)
+    finally:
+        for element, lat_text, lon_text, ele_element, ele_text in saved:
+            element.set('lat', lat_text)
+            element.set('lon', lon_text)
+            if ele_element is not None:
+                ele_element.text = ele_text
+
+
+# same as ET._namespaces(root), which walks the whole tree in Python: the
+# qualified names only depend on the tags and attribute names, in the
+# order they first show up
+def namespaces_of(root):
+    shapes = dict.fromkeys(zip(
+        map(TAG, root.iter()),
+        map(tuple, map(ET.Element.keys, root.iter()))
+    ))
+
+    skeleton = ET.Element(root.tag, root.attrib)
+    for tag, keys in list(shapes)[1:]:
+        ET.SubElement(skeleton, tag, dict.fromkeys(keys, ''))
+
+    return ET._namespaces(skeleton)
+
+
+# XML around the trkpts of the trksegs, len(trksegs) + 1 pieces
+def around_trkpts(root, trksegs, qnames, namespaces):
+    trkpts = [list(trkseg) for trkseg in trksegs]
+    marker = ET.Element(MARKER)
+    for trkseg in trksegs:
+        trkseg[:] = [marker]
+    qnames = dict(qnames, **{MARKER: MARKER})
+    try:
+        parts = []
+        ET._serialize_xml(parts.append, root, qnames, namespaces, short_empty_elements=True)
+    finally:
+        for trkseg, children in zip(trksegs, trkpts):
+            trkseg[:] = children
+
+    return ''.join(parts).split(f'<{MARKER} />')
+
+
+# values rounded to `precision` digits like round(), then formatted
+def format_column(values, precision, layout):
+    return [layout % value for value in round_column(values, precision).tolist()]
+
+
+# same as round() on every value
+def round_column(values, precision):
+    rounded = np.round(values, precision)
+
+    # np.round scales by 10 ** precision first, which may land the other way
+    # than round() on values close to a half; those are redone one by one
+    scaled = values * 10.0 ** precision
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for row in np.flatnonzero(near_half):
+        rounded[row] = round(float(values[row]), precision)
+
+    return rounded
+
+
+# same as ET._escape_cdata
+def escape(text):
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+# same as ET._escape_attrib
+def escape_attrib(text):
+    text = escape(text)
+    if '"' in text:
+        text = text.replace('"', '&quot;')
+    if '\r' in text:
+        text = text.replace('\r', '&#13;')
+    if '\n' in text:
+        text = text.replace('\n', '&#10;')
+    if '\t' in text:
+        text = text.replace('\t', '&#09;')
+    return text
+
+
+# Same output as ET._serialize_xml for trkpt elements, with lat, lon, ele
+# given as text.
+#
+# A plain trkpt (lat and lon attributes, an ele then a time child, nothing
+# else) is written through a %-template compiled once per tag names; the
+# rest (extensions, comments, other attributes) goes node by node.
+class TrkptWriter:
+    def __init__(self, qnames):
+        self.qnames = qnames
+        self.templates = {}
+
+    def trkpts_xml(self, elements, lat, lon, ele):
+        return ''.join(map(self.trkpt_xml, elements, lat, lon, ele))
+
+    def trkpt_xml(self, element, lat_text, lon_text, ele_text):
+        if len(element) != 2:
+            return self.generic_trkpt_xml(element, lat_text, lon_text, ele_text)
+        ele_element, time_element = element
+        keys = tuple(element.keys())
+        shape = (element.tag, ele_element.tag, time_element.tag, keys)
+
+        template = self.templates.get(shape)
+        if template is None:
+            template = self.templates[shape] = self.compile(shape)
+        if (
+            template is False or len(ele_element) or len(time_element)
+            or ele_element.keys() or time_element.keys() or not ele_element.text or not time_element.text
+        ):
+            return self.generic_trkpt_xml(element, lat_text, lon_text, ele_text)
+
+        texts = (element.text or '', ele_element.tail or '', time_element.text, time_element.tail or '', element.tail or '')
+        joined = ''.join(texts)
+        if '&' in joined or '<' in joined or '>' in joined:
+            texts = tuple(map(escape, texts))
+        if keys[0] == 'lat':
+            return template % (lat_text, lon_text, texts[0], ele_text, *texts[1:])
+        return template % (lon_text, lat_text, texts[0], ele_text, *texts[1:])
+
+    # template of a plain trkpt with these tag names, its values being the
+    # two attributes in the order of keys, the trkpt text, the ele text, the
+    # ele tail, the time text and tail, the trkpt tail; False when the names
+    # are not those of a plain trkpt
+    def compile(self, shape):
+        tag, ele_tag, time_tag, keys = shape
+        if (
+            not all(isinstance(name, str) for name in (tag, ele_tag, time_tag))
+            or ele_tag[-4:] != '}ele' or time_tag[-5:] != '}time' or sorted(keys) != ['lat', 'lon']
+        ):
+            return False
+
+        tag, ele_tag, time_tag = self.qnames[tag], self.qnames[ele_tag], self.qnames[time_tag]
+        first, second = (self.qnames[key] for key in keys)
+        return (
+            f'<{tag} {first}="%s" {second}="%s">%s<{ele_tag}>%s</{ele_tag}>%s'
+            f'<{time_tag}>%s</{time_tag}>%s</{tag}>%s'
+        )
+
+    # generic path, one node at a time
+    def generic_trkpt_xml(self, element, lat_text, lon_text, ele_text):
+        parts = []
+        append = parts.append
+        tag = self.qnames[element.tag]
+        append(f'<{tag}')
+        for key, value in element.items():
+            if key == 'lat':
+                value = lat_text
+            elif key == 'lon':
+                value = lon_text
+            else:
+                value = escape_attrib(value)
+            append(f' {self.qnames[key]}="{value}"')
+        append('>')
+        if element.text:
+            append(escape(element.text))
+
+        ele_found = False
+        for child in element:
+            is_ele = not ele_found and isinstance(child.tag, str) and child.tag[-4:] == '}ele'
+            ele_found = ele_found or is_ele
+            if is_ele and not len(child) and not child.keys() and child.text:
+                child_tag = self.qnames[child.tag]
+                append(f'<{child_tag}>{ele_text}</{child_tag}>')
+                if child.tail:
+                    append(escape(child.tail))
+            else:
+                self.serialize(append, child)
+
+        append(f'</{tag}>')
+        if element.tail:
+            append(escape(element.tail))
+        return ''.join(parts)
+
+    def serialize(self, append, element):
+        tag = element.tag
+        if not isinstance(tag, str):
+            if tag is ET.Comment:
+                append(f'<!--{element.text}-->')
+            elif tag is ET.ProcessingInstruction:
+                append(f'<?{element.text}?>')
+            else:
+                # no tag, only the content is written
+                if element.text:
+                    append(escape(element.text))
+                for child in element:
+                    self.serialize(append, child)
+            if element.tail:
+                append(escape(element.tail))
+            return
+
+        tag = self.qnames[tag]
+        append(f'<{tag}')
+        for key, value in element.items():
+            append(f' {self.qnames[key]}="{escape_attrib(value)}"')
+
+        text = element.text
+        if text or len(element):
+            append('>')
+            if text:
+                append(escape(text))
+            for child in element:
+                self.serialize(append, child)
+            append(f'</{tag}>')
+        else:
+            append(' />')
+
+        if element.tail:
+            append(escape(element.tail))
@@ -0,0 +1,137 @@
+import gzip
+from gpx import *
+import serializer
+
+
+# the bytes GPX.write used to produce: rounded through the setters, then tree.write
+def reference_bytes(gpx, tmp_path):
+    for trkpt in [trkpt for segment in gpx.segments for trkpt in segment.trkpts]:
+        trkpt.set_lat(format(round(trkpt.lat(), gpx.lat_p), '.7f'))
+        trkpt.set_lon(format(round(trkpt.lon(), gpx.lon_p), '.7f'))
+        trkpt.set_ele(format(round(trkpt.ele(), gpx.ele_p), '.1f'))
+
+    gpx.tree.write(str(tmp_path / 'reference.gpx'), encoding='utf-8', xml_declaration=True)
+    return (tmp_path / 'reference.gpx').read_bytes()
+
+
+def written_bytes(gpx, tmp_path):
+    gpx.write(str(tmp_path / 'written.gpx'))
+    return (tmp_path / 'written.gpx').read_bytes()
+
+
+def test_same_bytes_as_tree_write(tmp_path):
+    for precision in [(6, 6, 1), (-1, -1, -1), (7, 7, 2), (3, 5, 0)]:
+        gpx = GPX('fixtures/short_track.gpx', *precision, backend='etree')
+        written = written_bytes(gpx, tmp_path)
+        assert written == reference_bytes(gpx, tmp_path)
+
+
+def test_segments(tmp_path):
+    gpx = GPX('fixtures/multi_track.gpx', 6, 6, 1, backend='etree')
+    written = written_bytes(gpx, tmp_path)
+    assert written == reference_bytes(gpx, tmp_path)
+
+
+def test_track_is_left_as_it_is(tmp_path):
+    gpx = GPX('fixtures/short_track.gpx', 3, 3, 0, backend='etree')
+    before = [str(trkpt) for trkpt in gpx.trkpts]
+    gpx.write(str(tmp_path / 'written.gpx'))
+
+    assert [str(trkpt) for trkpt in gpx.trkpts] == before
+    assert gpx.trkpts[0].xml_element.attrib['lat'] == '22.3490950'
+
+
+def test_edited_track(tmp_path):
+    gpx = GPX('fixtures/short_track.gpx', 6, 6, 1, backend='etree')
+    set_by_speed(gpx, 5, gpx.trkpts[3].time(), gpx.trkpts[20].time(), rng=1)
+    gpx.trkpts[0].set_ele(1.25)
+    gpx.set_new_datetime(datetime.datetime(2022, 1, 1, 10, 0, 0))
+
+    written = written_bytes(gpx, tmp_path)
+    assert written == reference_bytes(gpx, tmp_path)
+
+
+def test_odd_trkpts(tmp_path):
+    gpx = GPX('fixtures/short_track.gpx', 6, 6, 1, backend='etree')
+    ns = gpx.namespace
+    trkpts = gpx.trkpts
+
+    trkpts[1].xml_element.find(f'{ns}extensions')[0][0].text = '<20 & "so">'
+    trkpts[2].xml_element.find(f'{ns}extensions').set('source', 'a&b')
+    trkpts[3].xml_element.set('src', 'x"y')
+    trkpts[4].xml_element.insert(0, ET.Comment(' paused '))
+    trkpts[5].xml_element.remove(trkpts[5].xml_element.find(f'{ns}extensions'))
+    trkpts[6].xml_element.find(f'{ns}extensions')[0][1].text = ''
+    trkpts[7].xml_element.tail = '50%'
+
+    written = written_bytes(gpx, tmp_path)
+    assert written == reference_bytes(gpx, tmp_path)
+
+
+def test_odd_trkpts_among_alike(tmp_path):
+    # odd values in trkpts laid out like the others
+    gpx = GPX('fixtures/short_track.gpx', 6, 6, 1, backend='etree')
+    ns = gpx.namespace
+    trkpts = gpx.trkpts
+
+    trkpts[1].xml_element.find(f'{ns}extensions')[0][0].text = '<20 & "so">'
+    trkpts[2].xml_element.find(f'{ns}extensions').set('source', 'a&b')
+    trkpts[3].xml_element.set('src', 'x"y\tz')
+    trkpts[6].xml_element.find(f'{ns}extensions')[0][1].text = ''
+    trkpts[7].xml_element.tail = None
+
+    written = written_bytes(gpx, tmp_path)
+    assert written == reference_bytes(gpx, tmp_path)
+
+
+def test_plain_trkpts(tmp_path):
+    # lat, lon, ele and time only, written through the template
+    gpx = GPX('fixtures/short_track.gpx', 6, 6, 1, backend='etree')
+    ns = gpx.namespace
+    trkpts = gpx.trkpts
+    for trkpt in trkpts:
+        trkpt.xml_element.remove(trkpt.xml_element.find(f'{ns}extensions'))
+
+    trkpts[1].xml_element.attrib = {'lon': trkpts[1].xml_element.get('lon'), 'lat': trkpts[1].xml_element.get('lat')}
+    trkpts[2].xml_element.find(f'{ns}time').tail = '<&>'
+    trkpts[3].xml_element.insert(0, trkpts[3].xml_element[1])
+    trkpts[4].xml_element.find(f'{ns}time').text = None
+    trkpts[5].xml_element.find(f'{ns}ele').set('src', 'baro')
+
+    written = written_bytes(gpx, tmp_path)
+    assert written == reference_bytes(gpx, tmp_path)
+
+
+def test_without_internals(tmp_path, monkeypatch):
+    monkeypatch.setattr(serializer, 'INTERNALS', False)
+    gpx = GPX('fixtures/short_track.gpx', 3, 3, 0, backend='etree')
+    gpx.trkpts[1].xml_element.set('src', 'x"y')
+    before = [str(trkpt) for trkpt in gpx.trkpts]
+
+    written = written_bytes(gpx, tmp_path)
+    assert [str(trkpt) for trkpt in gpx.trkpts] == before
+    assert gpx.trkpts[0].xml_element.attrib['lat'] == '22.3490950'
+    assert written == reference_bytes(gpx, tmp_path)
+
+
+def test_escape():
+    for text in ['', 'plain', '<a & "b">', "'\r\n\t'", '&amp;']:
+        assert serializer.escape(text) == ET._escape_cdata(text)
+        assert serializer.escape_attrib(text) == ET._escape_attrib(text)
+
+
+def test_gzip(tmp_path):
+    gpx = GPX('fixtures/short_track.gpx', 6, 6, 1, backend='etree')
+    gpx.write(str(tmp_path / 'written.gpx.gz'))
+    gpx.write(str(tmp_path / 'plain.gpx'), compress=False)
+
+    assert gzip.open(tmp_path / 'written.gpx.gz').read() == (tmp_path / 'plain.gpx').read_bytes()
+    assert GPX(str(tmp_path / 'plain.gpx'), backend='etree').trkpts[0].lat() == 22.349095
+
+
+def test_format_column():
+    values = np.array([0.5, 1.5, 2.675, 22.3490955, -0.125, 1e-9, np.nan])
+    for precision in [-1, 0, 1, 2, 6]:
+        assert serializer.format_column(values, precision, '%.7f') == [
+            format(round(value, precision), '.7f') for value in values.tolist()
+        ]
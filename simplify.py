@@ -0,0 +1,137 @@
+import collections
+import numpy as np
+
+import metrics
+
+# points, kept: number of trkpts before and after
+# distance, elevation: distance_of and elevation_of of the track, in meter
+# simplified_*: the same once simplified, *_error: simplified - original
+Report = collections.namedtuple('Report', [
+    'points',
+    'kept',
+    'distance',
+    'simplified_distance',
+    'distance_error',
+    'elevation',
+    'simplified_elevation',
+    'elevation_error',
+])
+
+
+################################################################################
+# Douglas-Peucker
+#
+# A point is kept when it is more than `tolerance` meters away from the
+# chord between the kept points around it (and, with ele_tolerance, when
+# its elevation is more than that away from the chord's).
+#
+# The recursion is run level by level: every pass measures all the points
+# of all the unfinished chords at once and splits each chord at its
+# farthest point, so the number of passes is the depth of the recursion
+# and nothing recurses in Python.
+#
+# Distances are measured on an equirectangular projection around the
+# middle latitude of each chord, close enough to haversine over the length
+# of a chord however far north or south the track goes.
+###
+
+EARTH_RADIUS = metrics.AVG_EARTH_RADIUS * 1000
+
+# bool array, True for the rows to keep; the first and last always are
+# tolerance, ele_tolerance: in meter, > 0
+def douglas_peucker(lat, lon, tolerance, ele=None, ele_tolerance=None):
+    if tolerance <= 0 or (ele_tolerance is not None and ele_tolerance <= 0):
+        raise ValueError('tolerances must be positive')
+
+    n = len(lat)
+    keep = np.zeros(n, dtype=bool)
+    if n:
+        keep[[0, -1]] = True
+    if n < 3:
+        return keep
+
+    x, y = planar(lat, lon)
+    # the unfinished points, with the ends of their chord
+    candidates = np.arange(1, n - 1)
+    first = np.zeros(n - 2, dtype=np.intp)
+    last = np.full(n - 2, n - 1, dtype=np.intp)
+    while len(candidates):
+        fraction, offset = offsets(x, y, candidates, first, last)
+        score = offset / (tolerance * tolerance)
+        if ele_tolerance is not None:
+            # a missing ele does not count
+            error = ele[candidates] - ele[first] - (ele[last] - ele[first]) * fraction
+            score = np.fmax(score, error * error / (ele_tolerance * ele_tolerance))
+
+        # candidates are sorted, so are the chords: one run per chord
+        starts = np.flatnonzero(np.concatenate(([True], first[1:] != first[:-1])))
+        run = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(first))))
+        worst = np.maximum.reduceat(score, starts)
+        farthest = np.flatnonzero(score == worst[run])
+        _, first_of_run = np.unique(run[farthest], return_index=True)
+        split = (worst > 1)[run]
+        at = candidates[farthest[first_of_run]][run]
+        keep[at[split]] = True
+
+        # a chord split at `at` becomes first -> at and at -> last
+        remaining = split & (candidates != at)
+        right = candidates > at
+        first = np.where(right, at, first)[remaining]
+        last = np.where(right, last, at)[remaining]
+        candidates = candidates[remaining]
+
+    return keep
+
+
+# x, y in meter along the equator and along a meridian; x is scaled by
+# the cosine of the latitude chord by chord, see offsets
+def planar(lat, lon):
+    return np.radians(lon) * EARTH_RADIUS, np.radians(lat) * EARTH_RADIUS
+
+
+# (fraction, offset) of the points to the chords first -> last: where
+# they project along the chord (0 to 1), their squared distance to it in
+# square meter
+def offsets(x, y, points, first, last):
+    scale = np.cos((y[first] + y[last]) / (2 * EARTH_RADIUS))
+    x0 = x[first]
+    y0 = y[first]
+    dx = (x[last] - x0) * scale
+    dy = y[last] - y0
+    px = (x[points] - x0) * scale
+    py = y[points] - y0
+    length = dx * dx + dy * dy
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(length > 0, np.clip((px * dx + py * dy) / length, 0, 1), 0)
+    px -= fraction * dx
+    py -= fraction * dy
+    return fraction, px * px + py * py
+
+
+################################################################################
+# Report
+###
+
+# segments: List[(lat, lon, ele, keep)], keep from douglas_peucker
+def report_of(segments, sample_rate=1):
+    points = kept = 0
+    distance = simplified_distance = elevation = simplified_elevation = 0
+    for lat, lon, ele, keep in segments:
+        points += len(lat)
+        kept += int(np.count_nonzero(keep))
+        distance += metrics.total(metrics.distances(lat, lon, sample_rate))
+        simplified_distance += metrics.total(metrics.distances(lat[keep], lon[keep], sample_rate))
+        elevation += metrics.ascent_of_diffs(metrics.elevation_diffs(ele, sample_rate))
+        simplified_elevation += metrics.ascent_of_diffs(metrics.elevation_diffs(ele[keep], sample_rate))
+
+    return Report(
+        points,
+        kept,
+        distance,
+        simplified_distance,
+        simplified_distance - distance,
+        elevation,
+        simplified_elevation,
+        simplified_elevation - elevation,
+    )
@@ -0,0 +1,100 @@
+import pytest
+from gpx import *
+import simplify
+
+
+# the textbook recursion, on the same projection
+def recursive(x, y, first, last, tolerance, keep):
+    if last - first < 2:
+        return
+    points = np.arange(first + 1, last)
+    _, offset = simplify.offsets(x, y, points, np.full(len(points), first), np.full(len(points), last))
+    farthest = int(points[np.argmax(offset)])
+    if offset.max() > tolerance * tolerance:
+        keep[farthest] = True
+        recursive(x, y, first, farthest, tolerance, keep)
+        recursive(x, y, farthest, last, tolerance, keep)
+
+
+@pytest.mark.parametrize('tolerance', [0.5, 2, 10])
+def test_same_as_recursive(tolerance):
+    rng = np.random.default_rng(0)
+    lat = 22.3 + np.cumsum(rng.normal(0, 0.00005, 2000))
+    lon = 114.1 + np.cumsum(rng.normal(0, 0.00005, 2000))
+
+    expected = np.zeros(len(lat), dtype=bool)
+    expected[[0, -1]] = True
+    recursive(*simplify.planar(lat, lon), 0, len(lat) - 1, tolerance, expected)
+    assert np.array_equal(simplify.douglas_peucker(lat, lon, tolerance), expected)
+
+
+def test_keep():
+    lat = np.linspace(22.3, 22.31, 1000)
+    lon = np.full(1000, 114.1)
+    ele = np.full(1000, 10.0)
+    ele[500] = 20
+    lon[300] += 0.001
+
+    assert np.flatnonzero(simplify.douglas_peucker(lat, lon, 5)).tolist() == [0, 299, 300, 301, 999]
+    assert np.flatnonzero(simplify.douglas_peucker(lat, lon, 5, ele, 5)).tolist() == [0, 299, 300, 301, 499, 500, 501, 999]
+    assert simplify.douglas_peucker(lat[:2], lon[:2], 5).tolist() == [True, True]
+    assert simplify.douglas_peucker(lat[:0], lon[:0], 5).tolist() == []
+    with pytest.raises(ValueError):
+        simplify.douglas_peucker(lat, lon, 0)
+
+
+def test_scale_of_each_chord():
+    # a track from the equator to 70N, a chord heading north at 60N
+    lat = np.array([0, 60, 60.001, 60.002, 70])
+    lon = np.array([0, 10, 10.001, 10, 10])
+    x, y = simplify.planar(lat, lon)
+    _, offset = simplify.offsets(x, y, np.array([2]), np.array([1]), np.array([3]))
+    expected = haversine((60.001, 10.001), (60.001, 10)) * 1000
+    assert np.sqrt(offset[0]) == pytest.approx(expected, rel=1e-3)
+
+
+def test_long_track():
+    rng = np.random.default_rng(1)
+    n = 1000000
+    lat = 22.3 + np.cumsum(rng.normal(0, 0.00005, n))
+    lon = 114.1 + np.cumsum(rng.normal(0, 0.00005, n))
+    keep = simplify.douglas_peucker(lat, lon, 20)
+    assert keep[0] and keep[-1] and np.count_nonzero(keep) < n / 10
+
+
+def test_deeper_than_recursion_limit():
+    # every pass only settles a few periods of the wave, over a thousand passes
+    n = 40000
+    lat = 22.3 + np.sin(np.arange(n) / 3) / 10000
+    lon = 114.1 + np.arange(n) / 100000
+    keep = simplify.douglas_peucker(lat, lon, 1)
+    assert keep[0] and keep[-1] and np.count_nonzero(keep) < n / 2
+
+    expected = np.zeros(n, dtype=bool)
+    with pytest.raises(RecursionError):
+        recursive(*simplify.planar(lat, lon), 0, n - 1, 1, expected)
+
+
+def test_simplify(tmp_path):
+    gpx = GPX('fixtures/multi_track.gpx')
+    distance = sum(distance_of(segment.trkpts) for segment in gpx.segments)
+    elevation = sum(elevation_of(segment.trkpts) for segment in gpx.segments)
+    first = gpx.trkpts[0]
+
+    assert gpx.simplify(2, dry_run=True).points == 30
+    assert sum(len(segment.store) for segment in gpx.segments) == 30
+    report = gpx.simplify(2)
+
+    assert report.points == 30
+    assert report.kept == sum(len(segment.store) for segment in gpx.segments) < 30
+    assert report.distance == pytest.approx(distance)
+    assert report.elevation == pytest.approx(elevation)
+    assert report.simplified_distance == pytest.approx(sum(distance_of(segment.trkpts) for segment in gpx.segments))
+    assert report.distance_error == pytest.approx(report.simplified_distance - distance)
+    assert gpx.trkpts[0] is first and first.row == 0
+    for segment in gpx.segments:
+        assert list(segment.element) == segment.store.elements
+
+    gpx.write(str(tmp_path / 'simplified.gpx'))
+    written = GPX(str(tmp_path / 'simplified.gpx'))
+    assert sum(len(segment.store) for segment in written.segments) == report.kept
@@ -0,0 +1,138 @@
+import numpy as np
+
+import metrics
+
+# cells are about that many steps of the track wide, in meter at least
+POINTS_PER_CELL = 16
+MIN_CELL = 1.0
+
+EARTH_RADIUS = metrics.AVG_EARTH_RADIUS * 1000
+
+
+################################################################################
+# Lookups by place over a TrackStore
+#
+# A grid of lat/lon cells, built on the first query after a change of the
+# store: the rows are sorted by cell, one key per cell, column after column
+# of cells, so the cells of a box are one range of keys per column, found
+# by binary search. Queries only look at the points of the cells they
+# cover, then check them exactly (haversine for distances).
+#
+# Cells are as tall as `cell` meters and at least as wide anywhere on the
+# track; by default `cell` is POINTS_PER_CELL median steps of the track.
+###
+
+class SpatialIndex:
+    def __init__(self, store, cell=None):
+        self.store = store
+        self.cell = cell
+        self.valid = False
+        store.listeners.append(self.invalidate)
+
+    def invalidate(self, row):
+        self.valid = False
+
+    def refresh(self):
+        if self.valid:
+            return
+
+        lat, lon = self.store.lat, self.store.lon
+        cell = self.cell
+        if cell is None:
+            steps = metrics.haversine_of(lat[:-1], lon[:-1], lat[1:], lon[1:])
+            cell = max(float(np.median(steps)) * POINTS_PER_CELL if len(steps) else 0, MIN_CELL)
+        self.cell_meters = cell
+
+        widest = np.radians(np.max(np.abs(lat))) if len(lat) else 0
+        self.cell_lat = np.degrees(cell / EARTH_RADIUS)
+        self.cell_lon = min(self.cell_lat / max(np.cos(widest), 1e-9), 360)
+
+        x = np.floor(lon / self.cell_lon).astype(np.int64)
+        y = np.floor(lat / self.cell_lat).astype(np.int64)
+        self.x0 = int(x.min()) if len(x) else 0
+        self.y0 = int(y.min()) if len(y) else 0
+        self.width = int(x.max()) - self.x0 + 1 if len(x) else 0
+        self.height = int(y.max()) - self.y0 + 1 if len(y) else 0
+
+        keys = (x - self.x0) * self.height + (y - self.y0)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+        self.valid = True
+
+    def __len__(self):
+        return len(self.store)
+
+    # rows of the points in the box, in track order
+    def in_box(self, min_lat, min_lon, max_lat, max_lon):
+        self.refresh()
+        x_first = max(int(np.floor(min_lon / self.cell_lon)) - self.x0, 0)
+        x_last = min(int(np.floor(max_lon / self.cell_lon)) - self.x0, self.width - 1)
+        y_first = max(int(np.floor(min_lat / self.cell_lat)) - self.y0, 0)
+        y_last = min(int(np.floor(max_lat / self.cell_lat)) - self.y0, self.height - 1)
+        if x_first > x_last or y_first > y_last:
+            return np.zeros(0, dtype=np.intp)
+
+        columns = np.arange(x_first, x_last + 1) * self.height
+        starts = np.searchsorted(self.keys, columns + y_first, side='left')
+        ends = np.searchsorted(self.keys, columns + y_last, side='right')
+        rows = self.order[ranges(starts, ends)]
+
+        lat = self.store.lat[rows]
+        lon = self.store.lon[rows]
+        inside = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        return np.sort(rows[inside])
+
+    # (rows, distances in meter) of the points within meters of lat, lon,
+    # in track order
+    def within(self, lat, lon, meters):
+        min_lat, min_lon, max_lat, max_lon = bounding_box(lat, lon, meters)
+        rows = self.in_box(min_lat, min_lon, max_lat, max_lon)
+        # the part of the box across the antimeridian
+        if min_lon < -180:
+            rows = np.union1d(rows, self.in_box(min_lat, min_lon + 360, max_lat, 180))
+        if max_lon > 180:
+            rows = np.union1d(rows, self.in_box(min_lat, -180, max_lat, max_lon - 360))
+        distances = metrics.haversine_of(lat, lon, self.store.lat[rows], self.store.lon[rows])
+        close = distances <= meters
+        return rows[close], distances[close]
+
+    # (rows, distances in meter) of the k points nearest to lat, lon,
+    # nearest first, the first row first among equal distances
+    def nearest(self, lat, lon, k=1):
+        self.refresh()
+        k = min(k, len(self))
+        if k <= 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0)
+
+        # the k nearest are within any radius that holds k points
+        meters = self.cell_meters
+        rows, distances = self.within(lat, lon, meters)
+        while len(rows) < k:
+            meters *= 2
+            rows, distances = self.within(lat, lon, meters)
+
+        nearest = np.lexsort((rows, distances))[:k]
+        return rows[nearest], distances[nearest]
+
+
+# (min_lat, min_lon, max_lat, max_lon) holding every point within meters
+# of lat, lon, the whole longitude range around a pole
+def bounding_box(lat, lon, meters):
+    angle = meters / EARTH_RADIUS
+    min_lat = lat - np.degrees(angle)
+    max_lat = lat + np.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90 or angle >= np.pi / 2:
+        return max(min_lat, -90), -180, min(max_lat, 90), 180
+
+    spread = np.sin(angle) / np.cos(np.radians(lat))
+    if spread >= 1:
+        return min_lat, -180, max_lat, 180
+    dlon = np.degrees(np.arcsin(spread))
+    return min_lat, lon - dlon, max_lat, lon + dlon
+
+
+# indices start:end of every range, one after the other
+def ranges(starts, ends):
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return offsets + np.arange(int(lengths.sum()))
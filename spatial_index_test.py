@@ -0,0 +1,96 @@
+import pytest
+from gpx import *
+import spatial_index
+from track_store import TrackStore
+
+
+def random_store(n, rng):
+    lat = 22.3 + np.cumsum(rng.normal(0, 0.0001, n))
+    lon = 114.1 + np.cumsum(rng.normal(0, 0.0001, n))
+    return TrackStore(lat, lon, np.zeros(n), np.full(n, NO_TIME), [None] * n)
+
+
+def brute_force_distances(store, lat, lon):
+    return np.array([
+        haversine((lat, lon), (store.lat[row], store.lon[row])) * 1000
+        for row in range(len(store))
+    ])
+
+
+@pytest.mark.parametrize('cell', [None, 5, 500])
+def test_same_as_brute_force(cell):
+    rng = np.random.default_rng(0)
+    store = random_store(3000, rng)
+    index = spatial_index.SpatialIndex(store, cell)
+
+    for lat, lon in zip(rng.uniform(22.28, 22.32, 20), rng.uniform(114.08, 114.12, 20)):
+        distances = brute_force_distances(store, lat, lon)
+
+        rows, found = index.nearest(lat, lon, 5)
+        assert rows.tolist() == np.lexsort((np.arange(len(store)), distances))[:5].tolist()
+        assert found == pytest.approx(distances[rows])
+
+        rows, found = index.within(lat, lon, 150)
+        assert rows.tolist() == np.flatnonzero(distances <= 150).tolist()
+
+        box = (lat - 0.002, lon - 0.003, lat + 0.002, lon + 0.003)
+        inside = (store.lat >= box[0]) & (store.lon >= box[1]) & (store.lat <= box[2]) & (store.lon <= box[3])
+        assert index.in_box(*box).tolist() == np.flatnonzero(inside).tolist()
+
+
+def test_far_and_few():
+    rng = np.random.default_rng(1)
+    store = random_store(100, rng)
+    index = spatial_index.SpatialIndex(store)
+
+    rows, distances = index.nearest(-40, -70, 3)
+    assert rows.tolist() == np.argsort(brute_force_distances(store, -40, -70))[:3].tolist()
+    assert len(index.nearest(22.3, 114.1, 1000)[0]) == 100
+    assert len(index.in_box(0, 0, 1, 1)) == 0
+
+    empty = spatial_index.SpatialIndex(TrackStore.empty())
+    assert len(empty.nearest(22.3, 114.1, 3)[0]) == 0
+    assert len(empty.within(22.3, 114.1, 100)[0]) == 0
+
+
+def test_antimeridian():
+    lat = np.array([10.0, 10.0, 10.0])
+    lon = np.array([179.9999, -179.9999, 0.0])
+    index = spatial_index.SpatialIndex(TrackStore(lat, lon, np.zeros(3), np.full(3, NO_TIME), [None] * 3))
+
+    assert index.within(10, 179.99995, 100)[0].tolist() == [0, 1]
+    assert index.nearest(10, -179.99995, 2)[0].tolist() == [1, 0]
+
+
+def test_gpx_lookups():
+    gpx = GPX('fixtures/short_track.gpx')
+    trkpt = gpx.trkpts[10]
+
+    assert gpx.nearest_trkpts(trkpt.lat(), trkpt.lon())[0] is trkpt
+    within = gpx.trkpts_within(trkpt.lat(), trkpt.lon(), 20)
+    assert within == [t for t in gpx.trkpts if distance_between(t, trkpt) <= 20]
+    assert trkpt in gpx.trkpts_in_box(trkpt.lat(), trkpt.lon(), trkpt.lat(), trkpt.lon())
+
+
+def test_kept_valid_across_edits():
+    gpx = GPX('fixtures/short_track.gpx')
+    trkpt = gpx.trkpts[10]
+    lat, lon = trkpt.lat(), trkpt.lon()
+    assert gpx.nearest_trkpts(lat, lon)[0] is trkpt
+
+    trkpt.set_lat(lat + 0.01)
+    assert gpx.nearest_trkpts(lat, lon)[0] is not trkpt
+    assert gpx.nearest_trkpts(lat + 0.01, lon)[0] is trkpt
+
+    gpx.remove_trkpts([trkpt])
+    assert trkpt not in gpx.trkpts_within(lat + 0.01, lon, 100)
+
+    gpx.insert_trkpts(0, [trkpt])
+    assert gpx.nearest_trkpts(lat + 0.01, lon)[0] is trkpt
+
+    gpx.randomize_lat_and_lon(rng=0)
+    assert gpx.nearest_trkpts(trkpt.lat(), trkpt.lon())[0] is trkpt
+
+    with gpx.batch():
+        gpx.trkpts = gpx.trkpts[1:]
+    assert gpx.nearest_trkpts(trkpt.lat(), trkpt.lon())[0] is not trkpt
@@ -0,0 +1,238 @@
+import collections
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+import numpy as np
+
+import metrics
+import timestamp
+from track_store import NO_TIME
+
+NAMESPACE = '{http://www.topografix.com/GPX/1/1}'
+
+Chunk = collections.namedtuple('Chunk', ['lat', 'lon', 'ele', 'time'])
+
+
+################################################################################
+# Streaming read
+#
+# Track points of the first trkseg are parsed with iterparse and dropped
+# from the tree as soon as their values are read, so memory is bounded
+# by chunk_size whatever the size of the file.
+###
+
+def iter_trkpts(file_name):
+    trkpt_tag = f'{NAMESPACE}trkpt'
+    trkseg_tag = f'{NAMESPACE}trkseg'
+    ele_tag = f'{NAMESPACE}ele'
+    time_tag = f'{NAMESPACE}time'
+
+    trkseg = None
+    for event, element in ET.iterparse(file_name, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == trkseg_tag and trkseg is None:
+                trkseg = element
+            continue
+
+        if element.tag == trkseg_tag and element is trkseg:
+            return
+
+        if element.tag != trkpt_tag or trkseg is None:
+            continue
+
+        ele = np.nan
+        time = NO_TIME
+        for child in element:
+            if child.tag == ele_tag:
+                ele = float(child.text)
+            elif child.tag == time_tag:
+                time = timestamp.parse_time(child.text)
+
+        yield float(element.attrib['lat']), float(element.attrib['lon']), ele, time
+        trkseg.remove(element)
+
+
+def iter_chunks(file_name, chunk_size=65536):
+    rows = []
+    for row in iter_trkpts(file_name):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield to_chunk(rows)
+            rows = []
+
+    if rows:
+        yield to_chunk(rows)
+
+
+def to_chunk(rows):
+    lat, lon, ele, time = zip(*rows)
+    return Chunk(
+        np.array(lat, dtype=np.float64),
+        np.array(lon, dtype=np.float64),
+        np.array(ele, dtype=np.float64),
+        np.array(time, dtype=np.int64)
+    )
+
+
+# metrics.Summary of the first trkseg, same as summary_of(GPX(file_name).trkpts)
+def stream_summary(file_name, chunk_size=65536, sample_rate=1):
+    distance = 0
+    elevation = 0
+    descent = 0
+    first_time = None
+    last_time = None
+
+    # last sampled point of the previous chunk, and the row count so far
+    carry = None
+    seen = 0
+    for chunk in iter_chunks(file_name, chunk_size=chunk_size):
+        if first_time is None:
+            first_time = chunk.time[0]
+        last_time = chunk.time[-1]
+
+        first = (-seen) % sample_rate
+        seen += len(chunk.lat)
+        lat = chunk.lat[first::sample_rate]
+        lon = chunk.lon[first::sample_rate]
+        ele = chunk.ele[first::sample_rate]
+        if len(lat) == 0:
+            continue
+
+        if carry is not None:
+            lat = np.concatenate(([carry[0]], lat))
+            lon = np.concatenate(([carry[1]], lon))
+            ele = np.concatenate(([carry[2]], ele))
+        carry = (lat[-1], lon[-1], ele[-1])
+
+        diffs = metrics.elevation_diffs(ele)
+        distance = metrics.total(np.concatenate(([distance], metrics.distances(lat, lon))))
+        elevation = metrics.total(np.concatenate(([elevation], np.where(diffs > 0, diffs, 0))))
+        descent = metrics.total(np.concatenate(([descent], np.where(diffs < 0, -diffs, 0))))
+
+    if first_time is None:
+        raise IndexError('no trkpt in the first trkseg')
+
+    time_spent = float(last_time - first_time) / timestamp.SECOND
+    return metrics.summary_from(distance, elevation, descent, time_spent)
+
+
+################################################################################
+# Streaming rewrite
+#
+# The file is copied event by event, elements are written out and dropped
+# as soon as they are complete. Empty elements are written as <a></a>,
+# comments and processing instructions are not kept.
+###
+
+def stream_shift_time(file_name, out_path, seconds):
+    time_tag = f'{NAMESPACE}time'
+
+    delta = round(seconds * timestamp.SECOND)
+
+    def rewrite(element, text):
+        if element.tag != time_tag or not text:
+            return text
+
+        text = text.strip()
+        ms = timestamp.has_ms(text)
+        epoch = timestamp.parse_time(text) + delta
+        if not ms:
+            epoch -= epoch % timestamp.SECOND
+        return timestamp.format_time(epoch, ms)
+
+    stream_rewrite(file_name, out_path, rewrite)
+
+
+# same as GPX.set_new_datetime, in bounded memory: every time of the file,
+# in every trkseg, moves so that the metadata time lands on new_datetime;
+# the first trkpt time does when there is no metadata time
+def stream_set_new_datetime(file_name, out_path, new_datetime):
+    reference = first_time(file_name)
+    if reference is None:
+        raise ValueError(f'{file_name}: no metadata or trkpt time to move from')
+
+    delta = timestamp.epoch_of(new_datetime) - reference
+    stream_shift_time(file_name, out_path, delta / timestamp.SECOND)
+
+
+# epoch of the metadata time, else of the first trkpt with a time, None
+# without either; the file is read no further than that
+def first_time(file_name):
+    tags = (f'{NAMESPACE}metadata', f'{NAMESPACE}trkpt')
+    time_tag = f'{NAMESPACE}time'
+
+    for _, element in ET.iterparse(file_name, events=('end',)):
+        if element.tag in tags:
+            time = element.find(time_tag)
+            if time is not None and time.text and time.text.strip():
+                return timestamp.parse_time(time.text.strip())
+            element.clear()
+    return None
+
+
+# rewrite(element, text) returns the text to write for a leaf element
+def stream_rewrite(file_name, out_path, rewrite):
+    prefixes = [{}]
+    declarations = []
+
+    # [element, text written, last child whose tail is pending]
+    stack = []
+
+    def qualified(name):
+        if name[0] != '{':
+            return name
+        uri, local = name[1:].split('}')
+        for scope in reversed(prefixes):
+            if uri in scope:
+                prefix = scope[uri]
+                return f'{prefix}:{local}' if prefix else local
+        raise ValueError(f'undeclared namespace {uri}')
+
+    with open(out_path, 'w', encoding='utf-8') as out:
+        out.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+
+        for event, item in ET.iterparse(file_name, events=('start-ns', 'start', 'end')):
+            if event == 'start-ns':
+                declarations.append(item)
+                continue
+
+            if event == 'start':
+                if stack:
+                    parent = stack[-1]
+                    if not parent[1]:
+                        out.write(escape(parent[0].text or ''))
+                        parent[1] = True
+                    flush_tail(out, parent)
+
+                prefixes.append({uri: prefix for prefix, uri in declarations})
+                attributes = ''.join(
+                    f' xmlns:{prefix}={quoteattr(uri)}' if prefix else f' xmlns={quoteattr(uri)}'
+                    for prefix, uri in declarations
+                )
+                declarations = []
+                attributes += ''.join(
+                    f' {qualified(name)}={quoteattr(value)}'
+                    for name, value in item.attrib.items()
+                )
+                out.write(f'<{qualified(item.tag)}{attributes}>')
+                stack.append([item, False, None])
+                continue
+
+            entry = stack.pop()
+            if not entry[1]:
+                out.write(escape(rewrite(item, item.text) or ''))
+            flush_tail(out, entry)
+            out.write(f'</{qualified(item.tag)}>')
+            prefixes.pop()
+
+            if stack:
+                stack[-1][2] = item
+
+        out.write('\n')
+
+
+def flush_tail(out, entry):
+    element, _, last_child = entry
+    if last_child is not None:
+        out.write(escape(last_child.tail or ''))
+        element.remove(last_child)
+        entry[2] = None
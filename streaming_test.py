@@ -0,0 +1,70 @@
+from streaming import *
+from gpx import GPX, summary_of
+import datetime
+import pytest
+
+
+def test_iter_chunks():
+    chunks = list(iter_chunks('fixtures/short_track.gpx', chunk_size=8))
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+
+    assert [len(chunk.lat) for chunk in chunks] == [8, 8, 8, 6]
+    assert list(np.concatenate([chunk.ele for chunk in chunks])) == list(gpx.store.ele)
+    assert list(np.concatenate([chunk.time for chunk in chunks])) == list(gpx.store.time)
+
+
+def test_stream_summary():
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+
+    assert stream_summary('fixtures/short_track.gpx', chunk_size=7) == summary_of(gpx.trkpts)
+    assert stream_summary('fixtures/short_track.gpx', chunk_size=7, sample_rate=3) == \
+        metrics.summarize(*gpx.store.columns(), sample_rate=3)
+
+
+def test_stream_set_new_datetime(tmp_path):
+    new_datetime = datetime.datetime(2021, 4, 10, 23, 45, 26)
+    out_path = str(tmp_path / 'shifted.gpx')
+    stream_set_new_datetime('fixtures/short_track.gpx', out_path, new_datetime)
+
+    gpx = GPX('fixtures/short_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    gpx.set_new_datetime(new_datetime)
+    shifted = GPX(out_path, lat_p=7, lon_p=7, ele_p=1)
+
+    assert shifted.get_meta_datetime() == new_datetime
+    assert [trkpt.raw_time() for trkpt in shifted.trkpts] == [trkpt.raw_time() for trkpt in gpx.trkpts]
+    assert list(shifted.store.lat) == list(gpx.store.lat)
+
+
+def test_stream_set_new_datetime_of_segments(tmp_path):
+    new_datetime = datetime.datetime(2021, 4, 10, 23, 45, 26)
+    out_path = str(tmp_path / 'shifted.gpx')
+    stream_set_new_datetime('fixtures/multi_track.gpx', out_path, new_datetime)
+
+    gpx = GPX('fixtures/multi_track.gpx', lat_p=7, lon_p=7, ele_p=1)
+    gpx.set_new_datetime(new_datetime)
+    shifted = GPX(out_path, lat_p=7, lon_p=7, ele_p=1)
+
+    assert len(shifted.segments) == len(gpx.segments) > 1
+    for segment, expected in zip(shifted.segments, gpx.segments):
+        assert [trkpt.raw_time() for trkpt in segment.trkpts] == [trkpt.raw_time() for trkpt in expected.trkpts]
+
+
+def test_stream_set_new_datetime_without_metadata_time(tmp_path):
+    text = open('fixtures/short_track.gpx', encoding='utf-8').read()
+    without = tmp_path / 'without.gpx'
+    without.write_text(text.replace('<time>2021-03-07T00:29:09Z</time>\n </metadata>', '</metadata>', 1))
+    assert '<metadata></metadata>' in without.read_text().replace('\n', '').replace(' ', '')
+
+    new_datetime = datetime.datetime(2021, 4, 10, 23, 45, 26)
+    out_path = tmp_path / 'shifted.gpx'
+    stream_set_new_datetime(str(without), str(out_path), new_datetime)
+    shifted = open(out_path, encoding='utf-8').read()
+    assert '<time>2021-04-10T23:45:26Z</time>' in shifted
+    assert shifted.count('<time>') == 30
+
+    (tmp_path / 'timeless.gpx').write_text(
+        '<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>'
+        '<trkpt lat="1" lon="2"></trkpt></trkseg></trk></gpx>'
+    )
+    with pytest.raises(ValueError):
+        stream_set_new_datetime(str(tmp_path / 'timeless.gpx'), str(out_path), new_datetime)
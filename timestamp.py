@@ -0,0 +1,162 @@
+import datetime
+import numpy as np
+
+# RFC 3339 timestamps of GPX files, in UTC:
+#   2021-03-07T00:29:09Z
+#   2021-03-07T00:29:09.000Z (the `ms` layout, any number of digits)
+#
+# Times are handled as int microsecond since epoch. Naive datetimes are
+# taken as UTC.
+
+EPOCH = datetime.datetime(1970, 1, 1)
+SECOND = 1000000
+DAY = 86400 * SECOND
+
+DIGITS = (0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18)
+SEPARATORS = ((4, '-'), (7, '-'), (10, 'T'), (13, ':'), (16, ':'))
+MONTH_DAYS = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def epoch_of(value):
+    return (value - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def datetime_of(epoch):
+    return EPOCH + datetime.timedelta(microseconds=int(epoch))
+
+
+def has_ms(text):
+    return len(text) > 20 and text[19] == '.'
+
+
+# days since epoch of a proleptic Gregorian date, works on ints and arrays
+def days_from_civil(year, month, day):
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+# whether the fields are those of a real date and time, as datetime takes
+# them; works on ints and arrays
+def in_range(year, month, day, hour, minute, second):
+    month_ok = (month >= 1) & (month <= 12)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    days = MONTH_DAYS[np.where(month_ok, month, 0)] + (leap & (month == 2))
+    return (
+        (year >= 1) & month_ok & (day >= 1) & (day <= days)
+        & (hour <= 23) & (minute <= 59) & (second <= 59)
+    )
+
+
+################################################################################
+# One timestamp
+###
+
+def parse_time(text):
+    if is_fixed_layout(text):
+        year, month, day = int(text[0:4]), int(text[5:7]), int(text[8:10])
+        hour, minute, second = int(text[11:13]), int(text[14:16]), int(text[17:19])
+        if in_range(year, month, day, hour, minute, second):
+            days = int(days_from_civil(year, month, day))
+            fraction = text[20:-1][:6].ljust(6, '0') if has_ms(text) else '0'
+            return days * DAY + (hour * 3600 + minute * 60 + second) * SECOND + int(fraction)
+
+    # other layouts, and fields out of range for fromisoformat to raise
+    value = datetime.datetime.fromisoformat(text.replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return epoch_of(value)
+
+
+# same layout as strftime('%Y-%m-%dT%H:%M:%S.%fZ').replace('000000Z', '000Z')
+# with ms, strftime('%Y-%m-%dT%H:%M:%SZ') without
+def format_time(epoch, ms):
+    value = datetime_of(epoch)
+    text = (
+        f'{value.year:04d}-{value.month:02d}-{value.day:02d}'
+        f'T{value.hour:02d}:{value.minute:02d}:{value.second:02d}'
+    )
+    if not ms:
+        return text + 'Z'
+    if value.microsecond == 0:
+        return text + '.000Z'
+    return f'{text}.{value.microsecond:06d}Z'
+
+
+def is_fixed_layout(text):
+    if len(text) < 20 or text[-1] != 'Z':
+        return False
+    if len(text) > 20 and (text[19] != '.' or not text[20:-1].isdigit()):
+        return False
+    return all(text[i] == c for i, c in SEPARATORS) and text[0:4].isdigit()
+
+
+################################################################################
+# Whole columns
+###
+
+# texts: List[str] -> int64 array of microsecond since epoch
+def parse_times(texts):
+    epochs = np.empty(len(texts), dtype=np.int64)
+    if len(texts) == 0:
+        return epochs
+
+    encoded = np.array(texts, dtype=np.bytes_)
+    lengths = np.char.str_len(encoded)
+    for length in np.unique(lengths):
+        rows = np.flatnonzero(lengths == length)
+        epochs[rows] = parse_fixed_length(encoded[rows], int(length), [texts[row] for row in rows])
+
+    return epochs
+
+
+def parse_fixed_length(encoded, length, texts):
+    chars = encoded.astype(f'S{length}').view(np.uint8).reshape(-1, length)
+    valid = length >= 20 and bool(np.all(chars[:, length - 1] == ord('Z')))
+    if valid and length > 20:
+        valid = bool(np.all(chars[:, 19] == ord('.')))
+        valid = valid and bool(np.all((chars[:, 20:-1] >= ord('0')) & (chars[:, 20:-1] <= ord('9'))))
+    if valid:
+        for i, c in SEPARATORS:
+            valid = valid and bool(np.all(chars[:, i] == ord(c)))
+        digits = chars[:, DIGITS]
+        valid = valid and bool(np.all((digits >= ord('0')) & (digits <= ord('9'))))
+    if not valid:
+        return np.array([parse_time(text) for text in texts], dtype=np.int64)
+
+    d = chars.astype(np.int64) - ord('0')
+    year = d[:, 0] * 1000 + d[:, 1] * 100 + d[:, 2] * 10 + d[:, 3]
+    month = d[:, 5] * 10 + d[:, 6]
+    day = d[:, 8] * 10 + d[:, 9]
+    hour = d[:, 11] * 10 + d[:, 12]
+    minute = d[:, 14] * 10 + d[:, 15]
+    second = d[:, 17] * 10 + d[:, 18]
+
+    fraction = np.zeros(len(chars), dtype=np.int64)
+    for i, column in enumerate(range(20, min(length - 1, 26))):
+        fraction += d[:, column] * 10 ** (5 - i)
+
+    epochs = days_from_civil(year, month, day) * DAY + (hour * 3600 + minute * 60 + second) * SECOND + fraction
+    # out of range rows go through parse_time, which raises
+    for row in np.flatnonzero(~in_range(year, month, day, hour, minute, second)).tolist():
+        epochs[row] = parse_time(texts[row])
+    return epochs
+
+
+# int64 array of microsecond since epoch -> List[str], same layout as format_time
+def format_times(epochs, ms):
+    values = np.asarray(epochs, dtype=np.int64).astype('datetime64[us]')
+    seconds = np.datetime_as_string(values, unit='s')
+    if not ms:
+        return np.char.add(seconds, 'Z').tolist()
+
+    whole = np.asarray(epochs) % SECOND == 0
+    texts = np.where(
+        whole,
+        np.char.add(seconds, '.000Z'),
+        np.char.add(np.datetime_as_string(values, unit='us'), 'Z')
+    )
+    return texts.tolist()
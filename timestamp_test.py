@@ -0,0 +1,51 @@
+from timestamp import *
+import datetime
+import pytest
+
+
+def test_parse_time():
+    assert datetime_of(parse_time('2021-03-29T23:06:15Z')) == datetime.datetime(2021, 3, 29, 23, 6, 15)
+    assert datetime_of(parse_time('2021-03-07T00:29:09.000Z')) == datetime.datetime(2021, 3, 7, 0, 29, 9)
+    assert datetime_of(parse_time('2021-03-07T00:29:09.25Z')) == datetime.datetime(2021, 3, 7, 0, 29, 9, 250000)
+    assert datetime_of(parse_time('2021-03-07T08:29:09+08:00')) == datetime.datetime(2021, 3, 7, 0, 29, 9)
+    assert datetime_of(parse_time('1969-12-31T23:59:59Z')) == datetime.datetime(1969, 12, 31, 23, 59, 59)
+
+
+def test_out_of_range():
+    for text in ['2021-13-45T25:61:61Z', '2021-02-29T00:00:00Z', '2021-04-31T00:00:00Z', '2021-03-07T24:00:00.000Z',
+                 '2021-03-07T00:60:00Z', '2021-03-07T00:00:60Z', '0000-01-01T00:00:00Z']:
+        with pytest.raises(ValueError):
+            parse_time(text)
+        with pytest.raises(ValueError):
+            parse_times(['2021-03-07T00:29:09Z', text])
+
+    assert parse_times(['2024-02-29T00:00:00Z', '2000-02-29T23:59:59Z']).tolist() == [
+        epoch_of(datetime.datetime(2024, 2, 29)), epoch_of(datetime.datetime(2000, 2, 29, 23, 59, 59))
+    ]
+
+
+def test_format_time():
+    epoch = epoch_of(datetime.datetime(2021, 3, 29, 23, 6, 10))
+
+    assert format_time(epoch, ms=False) == '2021-03-29T23:06:10Z'
+    assert format_time(epoch, ms=True) == '2021-03-29T23:06:10.000Z'
+    assert format_time(epoch + 123000, ms=True) == '2021-03-29T23:06:10.123000Z'
+
+
+def test_parse_and_format_times():
+    texts = [
+        '2021-03-07T00:29:09Z',
+        '2024-02-29T12:00:00Z',
+        '2021-03-07T00:29:09.123Z',
+        '2021-03-07T00:29:09.000Z',
+    ]
+    epochs = parse_times(texts)
+
+    assert list(epochs) == [parse_time(text) for text in texts]
+    assert format_times(epochs[:2], ms=False) == texts[:2]
+    assert format_times(epochs[2:], ms=True) == ['2021-03-07T00:29:09.123000Z', '2021-03-07T00:29:09.000Z']
+
+
+def test_has_ms():
+    assert has_ms('2021-03-07T00:29:09.000Z')
+    assert not has_ms('2021-03-07T00:29:09Z')
@@ -0,0 +1,182 @@
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+VERSION = 2
+SUFFIX = '.gpxc'
+
+# arrays start on a multiple of ALIGN bytes from the start of the file
+ALIGN = 64
+
+# meta_time: text of the metadata time, None when there is none
+# tracks[i][j]: (lat, lon, ele, time) arrays of the j-th trkseg of the i-th trk
+Entry = collections.namedtuple('Entry', ['meta_time', 'tracks'])
+
+
+################################################################################
+# Cache of parsed tracks
+#
+# Opt-in, GPX(file_name, cache=TrackCache(...)) reads the columns of a
+# cached file without parsing its XML; the tree is parsed on the first
+# edit or write only.
+#
+# An entry is one file: a JSON header line padded to ALIGN bytes, then the
+# lat, lon, ele (float64) and time (int64) columns of every trkseg one
+# after the other. The columns are memory-mapped copy-on-write, edits stay
+# in memory.
+#
+# An entry is valid while the source has the size and mtime it had when
+# cached, or the same content with hash=True (a copy of an archive keeps
+# its entries). Entries of a directory are evicted least recently used
+# first beyond max_bytes; a hit counts as a use.
+#
+# Worker processes may share a directory: entries are written to a
+# temporary file and renamed into place, an entry removed by another
+# process or cut short is a miss.
+###
+
+class TrackCache:
+    # directory: where entries go, next to their source file when None
+    #   (file_name + '.gpxc', never evicted)
+    # max_bytes: size of the entries kept in directory
+    # hash: check the content of the source rather than its mtime
+    def __init__(self, directory=None, max_bytes=1 << 30, hash=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash = hash
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def path_of(self, file_name):
+        if self.directory is None:
+            return f'{file_name}{SUFFIX}'
+
+        name = hashlib.sha1(os.path.abspath(file_name).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + SUFFIX)
+
+    # what an entry of file_name must match to be used
+    def key_of(self, file_name):
+        status = os.stat(file_name)
+        key = {
+            'version': VERSION,
+            'path': os.path.abspath(file_name),
+            'size': status.st_size,
+        }
+        if self.hash:
+            key['sha1'] = sha1_of(file_name)
+        else:
+            key['mtime_ns'] = status.st_mtime_ns
+        return key
+
+    # Entry of file_name, None when it is not cached, out of date or broken
+    def get(self, file_name):
+        path = self.path_of(file_name)
+        try:
+            with open(path, 'rb') as entry:
+                header = json.loads(entry.readline())
+            if header.get('key') != self.key_of(file_name):
+                return None
+
+            meta_time = header['meta_time']
+            n = sum(sum(track) for track in header['tracks'])
+            if n:
+                data = np.memmap(path, dtype=np.float64, mode='c', offset=header['offset'], shape=(4, n))
+                lat, lon, ele = data[0], data[1], data[2]
+                time = data[3].view(np.int64)
+            else:
+                lat = lon = ele = np.empty(0, dtype=np.float64)
+                time = np.empty(0, dtype=np.int64)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+        tracks = []
+        start = 0
+        for lengths in header['tracks']:
+            track = []
+            for length in lengths:
+                rows = slice(start, start + length)
+                track.append((lat[rows], lon[rows], ele[rows], time[rows]))
+                start += length
+            tracks.append(track)
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return Entry(meta_time, tracks)
+
+    # tracks[i][j]: TrackStore of the j-th trkseg of the i-th trk
+    def put(self, file_name, meta_time, tracks):
+        stores = [store for track in tracks for store in track]
+        header = {
+            'key': self.key_of(file_name),
+            'meta_time': meta_time,
+            'tracks': [[len(store) for store in track] for track in tracks],
+        }
+        # the offset is part of the header, room is left for its digits
+        header['offset'] = 0
+        size = len(json.dumps(header)) + 32
+        header['offset'] = offset = (size // ALIGN + 1) * ALIGN
+        line = json.dumps(header).encode('utf-8')
+
+        path = self.path_of(file_name)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as out:
+                out.write(line.ljust(offset - 1) + b'\n')
+                for column in ('lat', 'lon', 'ele', 'time'):
+                    for store in stores:
+                        out.write(np.ascontiguousarray(getattr(store, column)).tobytes())
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        self.evict()
+
+    # drop the least recently used entries of directory beyond max_bytes
+    def evict(self):
+        if self.directory is None:
+            return
+
+        # entries removed by another process meanwhile are skipped
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                try:
+                    status = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((status.st_mtime_ns, status.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        if self.directory is None:
+            return
+
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+def sha1_of(file_name, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as source:
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
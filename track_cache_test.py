@@ -0,0 +1,127 @@
+import os
+import shutil
+from gpx import *
+from track_cache import TrackCache
+
+
+def copy_fixture(tmp_path, name='multi_track.gpx'):
+    file_name = str(tmp_path / name)
+    shutil.copy(f'fixtures/{name}', file_name)
+    return file_name
+
+
+def test_hit_skips_xml(tmp_path):
+    file_name = copy_fixture(tmp_path)
+    cache = TrackCache(str(tmp_path / 'cache'))
+    expected = GPX(file_name, cache=cache)
+    assert cache.get(file_name) is not None
+
+    gpx = GPX(file_name, cache=cache)
+    assert [len(track) for track in gpx.tracks] == [len(track) for track in expected.tracks]
+    assert gpx.summary() == expected.summary()
+    assert summary_of(gpx.trkpts) == summary_of(expected.trkpts)
+    assert gpx.get_meta_datetime() == expected.get_meta_datetime()
+    assert gpx.ms == expected.ms
+    for segment, want in zip(gpx.segments, expected.segments):
+        for got, column in zip(segment.store.columns(), want.store.columns()):
+            assert np.array_equal(got, column)
+    assert gpx._tree is None
+
+
+def test_without_meta_time(tmp_path):
+    file_name = copy_fixture(tmp_path, 'no_meta_time.gpx')
+    cache = TrackCache(str(tmp_path / 'cache'))
+    GPX(file_name, cache=cache)
+    assert cache.get(file_name).meta_time is None
+
+    gpx = GPX(file_name, cache=cache)
+    assert gpx.meta_time is None and gpx.get_meta_datetime() is None and gpx.ms is False
+    assert len(gpx.trkpts) == 30
+
+    # the time element is added to the metadata
+    gpx.set_meta_datetime(datetime.datetime(2022, 1, 1, 10, 0, 0))
+    gpx.write(str(tmp_path / 'dated.gpx'))
+    assert GPX(str(tmp_path / 'dated.gpx')).get_meta_datetime() == datetime.datetime(2022, 1, 1, 10, 0, 0)
+
+
+def test_edit_after_hit(tmp_path):
+    file_name = copy_fixture(tmp_path)
+    cache = TrackCache()
+    GPX(file_name, cache=cache)
+    assert os.path.exists(file_name + '.gpxc')
+
+    expected = GPX(file_name)
+    gpx = GPX(file_name, cache=cache)
+    for track in (expected, gpx):
+        track.trkpts[3].set_ele(150)
+        track.set_new_datetime(datetime.datetime(2022, 1, 1, 10, 0, 0))
+    assert gpx.trkpts[3].xml_element.find(f'{gpx.namespace}ele').text == '150'
+
+    for track in (expected, gpx):
+        track.write(str(tmp_path / f'{id(track)}.gpx'))
+    assert (tmp_path / f'{id(gpx)}.gpx').read_bytes() == (tmp_path / f'{id(expected)}.gpx').read_bytes()
+
+    # edits stay in memory
+    assert GPX(file_name, cache=cache).trkpts[3].ele() != 150
+
+
+def test_out_of_date(tmp_path):
+    file_name = copy_fixture(tmp_path)
+    cache = TrackCache(str(tmp_path / 'cache'))
+    GPX(file_name, cache=cache)
+
+    os.utime(file_name, ns=(0, 0))
+    assert cache.get(file_name) is None
+
+    hashed = TrackCache(str(tmp_path / 'hashed'), hash=True)
+    GPX(file_name, cache=hashed)
+    os.utime(file_name, ns=(10 ** 9, 10 ** 9))
+    assert hashed.get(file_name) is not None
+
+    with open(file_name, 'a') as out:
+        out.write('\n')
+    assert hashed.get(file_name) is None
+
+
+def test_evict_least_recently_used(tmp_path):
+    names = [copy_fixture(tmp_path, name) for name in ('multi_track.gpx', 'short_track.gpx')]
+    cache = TrackCache(str(tmp_path / 'cache'))
+    for file_name in names:
+        GPX(file_name, cache=cache)
+    sizes = [os.path.getsize(cache.path_of(file_name)) for file_name in names]
+
+    os.utime(cache.path_of(names[0]), ns=(0, 0))
+    cache.get(names[0])
+    cache.max_bytes = sizes[0]
+    cache.evict()
+    assert cache.get(names[0]) is not None
+    assert cache.get(names[1]) is None
+
+
+def test_broken_or_missing_entries(tmp_path, monkeypatch):
+    file_name = copy_fixture(tmp_path)
+    cache = TrackCache(str(tmp_path / 'cache'))
+    expected = GPX(file_name).summary()
+    GPX(file_name, cache=cache)
+
+    # cut short by a process killed while writing, the entry is a miss and written again
+    path = cache.path_of(file_name)
+    with open(path, 'r+b') as entry:
+        entry.truncate(os.path.getsize(path) - 8)
+    assert cache.get(file_name) is None
+    assert GPX(file_name, cache=cache).summary() == expected
+    assert cache.get(file_name) is not None
+
+    with open(path, 'wb') as entry:
+        entry.write(b'{"key": [1]}\n')
+    assert cache.get(file_name) is None
+
+    # removed by another process
+    os.unlink(path)
+    assert cache.get(file_name) is None
+    listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda directory: listdir(directory) + ['gone.gpxc'])
+    cache.max_bytes = 0
+    cache.evict()
+    cache.clear()
+
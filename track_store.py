@@ -0,0 +1,217 @@
+import bisect
+import numpy as np
+
+import profiling
+from timestamp import epoch_of, datetime_of, parse_times
+
+NO_TIME = np.iinfo(np.int64).min
+
+
+# lat, lon, ele, time arrays of the given TrackPoints
+def columns_of(trkpts):
+    if not trkpts:
+        return TrackStore.empty().columns()
+
+    store = trkpts[0].store
+    if not all(trkpt.store is store for trkpt in trkpts):
+        return TrackStore.gather(trkpts).columns()
+
+    first_row = trkpts[0].row
+    rows = np.fromiter((trkpt.row for trkpt in trkpts), dtype=np.intp, count=len(trkpts))
+    if rows[-1] - first_row == len(rows) - 1 and np.all(np.diff(rows) == 1):
+        rows = slice(first_row, first_row + len(rows))
+
+    return store.lat[rows], store.lon[rows], store.ele[rows], store.time[rows]
+
+
+# Columnar storage of a track segment, one row per trkpt:
+#   lat, lon, ele: float64
+#   time: int64, microsecond since epoch (NO_TIME when missing)
+#   elements: the trkpt XML elements, in the same order; when None they
+#     come from load_elements() on first access (see track_cache)
+#
+# Indexes built on the columns register in `listeners`, they are called
+# with the first row which may have changed after every modification.
+class TrackStore:
+    def __init__(self, lat, lon, ele, time, elements, load_elements=None):
+        self.lat = lat
+        self.lon = lon
+        self.ele = ele
+        self.time = time
+        self._elements = elements
+        self.load_elements = load_elements
+        self.listeners = []
+
+    @property
+    def elements(self):
+        if self._elements is None:
+            self._elements = self.load_elements()
+        return self._elements
+
+    @elements.setter
+    def elements(self, elements):
+        self._elements = elements
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.int64),
+            []
+        )
+
+    @classmethod
+    def from_elements(cls, elements, namespace):
+        n = len(elements)
+        lat = np.empty(n, dtype=np.float64)
+        lon = np.empty(n, dtype=np.float64)
+        ele = np.full(n, np.nan, dtype=np.float64)
+        time = np.full(n, NO_TIME, dtype=np.int64)
+
+        ele_tag = f'{namespace}ele'
+        time_tag = f'{namespace}time'
+        time_rows = []
+        time_texts = []
+        for row, element in enumerate(elements):
+            lat[row] = float(element.attrib['lat'])
+            lon[row] = float(element.attrib['lon'])
+            for child in element:
+                if child.tag == ele_tag:
+                    ele[row] = float(child.text)
+                elif child.tag == time_tag:
+                    time_rows.append(row)
+                    time_texts.append(child.text)
+
+        # all the timestamps in one go, see timestamp.parse_times
+        with profiling.stage('parse_times'):
+            time[time_rows] = parse_times(time_texts)
+
+        return cls(lat, lon, ele, time, list(elements))
+
+    # new store holding the rows of the given TrackPoints
+    @classmethod
+    def gather(cls, trkpts):
+        if not trkpts:
+            return cls.empty()
+
+        store = trkpts[0].store
+        if all(trkpt.store is store for trkpt in trkpts):
+            return store.take([trkpt.row for trkpt in trkpts])
+
+        # one take per run of TrackPoints sharing a store
+        runs = []
+        for trkpt in trkpts:
+            if runs and runs[-1][0] is trkpt.store:
+                runs[-1][1].append(trkpt.row)
+            else:
+                runs.append((trkpt.store, [trkpt.row]))
+
+        return cls.concat([store.take(rows) for store, rows in runs])
+
+    @classmethod
+    def concat(cls, stores):
+        if not stores:
+            return cls.empty()
+
+        return cls(
+            np.concatenate([store.lat for store in stores]),
+            np.concatenate([store.lon for store in stores]),
+            np.concatenate([store.ele for store in stores]),
+            np.concatenate([store.time for store in stores]),
+            [element for store in stores for element in store.elements]
+        )
+
+    def __len__(self):
+        return len(self.lat)
+
+    def columns(self):
+        return self.lat, self.lon, self.ele, self.time
+
+    def changed(self, row):
+        for listener in self.listeners:
+            listener(row)
+
+    def take(self, rows, elements=None):
+        rows = np.asarray(rows, dtype=np.intp)
+        if elements is None:
+            elements = [self.elements[row] for row in rows]
+
+        return TrackStore(
+            self.lat[rows],
+            self.lon[rows],
+            self.ele[rows],
+            self.time[rows],
+            elements
+        )
+
+    def insert(self, idx, other):
+        self.lat = np.concatenate((self.lat[:idx], other.lat, self.lat[idx:]))
+        self.lon = np.concatenate((self.lon[:idx], other.lon, self.lon[idx:]))
+        self.ele = np.concatenate((self.ele[:idx], other.ele, self.ele[idx:]))
+        self.time = np.concatenate((self.time[:idx], other.time, self.time[idx:]))
+        self.elements[idx:idx] = other.elements
+        self.changed(idx)
+
+    # remove the given rows, return them as a new store
+    def delete(self, rows):
+        rows = np.unique(np.asarray(rows, dtype=np.intp))
+        removed = self.take(rows)
+
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+        self.lat = self.lat[keep]
+        self.lon = self.lon[keep]
+        self.ele = self.ele[keep]
+        self.time = self.time[keep]
+        self.elements = [e for e, k in zip(self.elements, keep) if k]
+        if len(rows):
+            self.changed(int(rows[0]))
+
+        return removed
+
+
+# Lookups by time over a TrackStore, binary search while the time column
+# is sorted, a linear scan of the column otherwise.
+class TimeIndex:
+    def __init__(self, store):
+        self.store = store
+        self.sorted = None
+        store.listeners.append(self.invalidate)
+
+    def invalidate(self, row):
+        self.sorted = None
+
+    def is_sorted(self):
+        if self.sorted is None:
+            time = self.store.time
+            self.sorted = bool(np.all(time[1:] >= time[:-1])) and not np.any(time == NO_TIME)
+        return self.sorted
+
+    # first row with time >= epoch, len(store) when there is none
+    def first_at_or_after(self, epoch):
+        time = self.store.time
+        if self.is_sorted():
+            return bisect.bisect_left(time, epoch)
+
+        rows = np.flatnonzero(time >= epoch)
+        return int(rows[0]) if len(rows) else len(time)
+
+    # last row with time < epoch, -1 when there is none
+    def last_before(self, epoch):
+        time = self.store.time
+        if self.is_sorted():
+            return bisect.bisect_left(time, epoch) - 1
+
+        rows = np.flatnonzero((time < epoch) & (time != NO_TIME))
+        return int(rows[-1]) if len(rows) else -1
+
+    # first_at_or_after for every epoch of the array
+    def first_at_or_after_many(self, epochs):
+        epochs = np.asarray(epochs, dtype=np.int64)
+        time = self.store.time
+        if self.is_sorted():
+            return np.searchsorted(time, epochs, side='left')
+
+        return np.array([self.first_at_or_after(epoch) for epoch in epochs], dtype=np.intp)
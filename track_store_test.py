@@ -0,0 +1,60 @@
+from track_store import *
+import xml.etree.ElementTree as ET
+import datetime
+
+NAMESPACE = '{http://www.topografix.com/GPX/1/1}'
+
+
+def load_store(file_name='fixtures/short_track.gpx'):
+    root = ET.parse(file_name).getroot()
+    trkseg = root.find(f'{NAMESPACE}trk').find(f'{NAMESPACE}trkseg')
+    return TrackStore.from_elements(list(trkseg), NAMESPACE)
+
+
+def test_from_elements():
+    store = load_store()
+
+    assert len(store) == 30
+    assert store.lat[0] == 22.349095
+    assert store.lon[0] == 114.194624
+    assert store.ele[0] == 122.9
+    assert datetime_of(store.time[0]) == datetime.datetime(2021, 3, 7, 0, 29, 9)
+
+
+def test_epoch_of():
+    value = datetime.datetime(2021, 3, 7, 0, 29, 9, 123000)
+    assert epoch_of(value) == 1615076949123000
+    assert datetime_of(epoch_of(value)) == value
+
+
+def test_insert_and_delete():
+    store = load_store()
+    other = store.take([0, 1])
+
+    store.insert(5, other)
+    assert len(store) == 32
+    assert store.lat[5] == store.lat[0]
+    assert store.elements[6] is store.elements[1]
+
+    removed = store.delete([6, 5])
+    assert len(store) == 30
+    assert len(removed) == 2
+    assert removed.elements[0] is store.elements[0]
+
+
+def test_time_index():
+    store = load_store()
+    index = TimeIndex(store)
+    at = epoch_of(datetime.datetime(2021, 3, 7, 0, 29, 12))
+
+    assert index.first_at_or_after(at) == 1
+    assert index.last_before(at) == 0
+    assert index.first_at_or_after(store.time[-1] + 1) == 30
+    assert list(index.first_at_or_after_many([at, store.time[0]])) == [1, 0]
+
+    # not sorted any more, scan the column instead
+    store.time[0] = store.time[-1]
+    store.changed(0)
+    assert not index.is_sorted()
+    assert index.first_at_or_after(at) == 0
+    assert index.last_before(at) == -1
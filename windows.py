@@ -0,0 +1,134 @@
+import collections
+import numpy as np
+
+import metrics
+import timestamp
+from track_store import NO_TIME, columns_of, datetime_of
+
+# start_idx, end_idx: rows of the first and last point, inclusive
+# start_time, end_time: datetime of those points
+# value: of the metric over the window
+Window = collections.namedtuple('Window', ['start_idx', 'end_idx', 'start_time', 'end_time', 'value'])
+
+# metric: whether larger values are better
+METRICS = {
+    'distance': True,
+    'time_spent': False,
+    'elevation': True,
+    'speed': True,
+    'pace': False,
+    'eph': True,
+}
+BY = ('distance', 'duration')
+
+
+################################################################################
+# Rolling windows
+#
+# Best and worst stretches of a track, "best 1 km" or "best 10 minutes":
+# from every start, the window runs to the first point at least `length`
+# meters (by='distance') or seconds (by='duration') away, and the metric
+# of every such window comes from differences of cumulative arrays. Both
+# the window ends and the metrics take a pass over the track, whatever
+# the length.
+#
+# Metrics are those of metrics.Summary, over every pair of the window
+# (no sample_rate): distance, elevation gain, time spent, then speed
+# (km/h), pace (min/km) and eph from them.
+###
+
+class RollingWindows:
+    def __init__(self, lat, lon, ele, time):
+        n = len(lat)
+        self.distance = metrics.cumulative_distances(lat, lon)[:n]
+        diffs = metrics.elevation_diffs(ele)
+        self.ascent = np.concatenate(([0], np.cumsum(np.where(diffs > 0, diffs, 0))))[:n]
+        self.time = time
+
+    # of a list of TrackPoints
+    @classmethod
+    def of(cls, trkpts):
+        return cls(*columns_of(trkpts))
+
+    def __len__(self):
+        return len(self.distance)
+
+    # (starts, ends) int arrays: the shortest window from every start that
+    # is `length` long, starts without one are left out
+    def spans(self, by, length):
+        if by == 'distance':
+            cumulated = self.distance
+        elif by == 'duration':
+            cumulated = self.checked_time()
+            length = round(length * timestamp.SECOND)
+        else:
+            raise ValueError(f'unknown window kind {by!r}, expected one of {BY}')
+
+        # first row at least `length` past every start, len(cumulated) when none
+        ends = np.searchsorted(cumulated, cumulated + length, side='left')
+        starts = np.flatnonzero(ends < len(cumulated))
+        return starts, ends[starts]
+
+    # float64 value of metric over every window, NaN where it is undefined
+    # (speed of a window without time span, ...)
+    def values(self, metric, starts, ends):
+        if metric not in METRICS:
+            raise ValueError(f'unknown metric {metric!r}, expected one of {tuple(METRICS)}')
+
+        distance = self.distance[ends] - self.distance[starts]
+        if metric == 'distance':
+            return distance
+        elevation = self.ascent[ends] - self.ascent[starts]
+        if metric == 'elevation':
+            return elevation
+
+        time = self.checked_time()
+        time_spent = (time[ends] - time[starts]) / timestamp.SECOND
+        with np.errstate(divide='ignore', invalid='ignore'):
+            hours = np.where(time_spent != 0, time_spent / 60 / 60, np.nan)
+            if metric == 'time_spent':
+                return time_spent
+            if metric == 'speed':
+                return (distance / 1000) / hours
+            if metric == 'pace':
+                return time_spent / np.where(distance != 0, distance / 1000, np.nan) / 60
+            return ((distance / 1000) + (elevation / 100)) / hours
+
+    # best Window of the metric among the windows of `length`, the worst
+    # one with worst=True; None when there is no such window
+    def best(self, metric, by, length, worst=False):
+        starts, ends = self.spans(by, length)
+        values = self.values(metric, starts, ends)
+        defined = np.flatnonzero(~np.isnan(values))
+        if not len(defined):
+            return None
+
+        larger = METRICS[metric] != worst
+        candidates = values[defined]
+        found = defined[np.argmax(candidates) if larger else np.argmin(candidates)]
+        return self.window(int(starts[found]), int(ends[found]), float(values[found]))
+
+    def worst(self, metric, by, length):
+        return self.best(metric, by, length, worst=True)
+
+    def window(self, start_idx, end_idx, value):
+        time = self.time
+        return Window(
+            start_idx,
+            end_idx,
+            None if time[start_idx] == NO_TIME else datetime_of(time[start_idx]),
+            None if time[end_idx] == NO_TIME else datetime_of(time[end_idx]),
+            value
+        )
+
+    # windows by duration and time metrics need every time, in order
+    def checked_time(self):
+        time = self.time
+        if np.any(time == NO_TIME) or np.any(time[1:] < time[:-1]):
+            raise ValueError('windows over time need a time on every trkpt, in order')
+        return time
+
+
+# Window of the trkpts, see RollingWindows.best
+def best_window(trkpts, metric, by, length, worst=False):
+    return RollingWindows.of(trkpts).best(metric, by, length, worst=worst)
@@ -0,0 +1,62 @@
+import pytest
+from gpx import *
+import windows
+
+SUMMARY_OF = {
+    'distance': lambda summary: summary.distance,
+    'time_spent': lambda summary: summary.time_spent,
+    'elevation': lambda summary: summary.elevation,
+    'speed': lambda summary: summary.speed,
+    'pace': lambda summary: summary.pace,
+    'eph': lambda summary: summary.eph,
+}
+
+
+# (value, start_idx, end_idx) of every window, through summary_of
+def brute_force(trkpts, metric, by, length):
+    found = []
+    for start in range(len(trkpts)):
+        for end in range(start, len(trkpts)):
+            summary = summary_of(trkpts[start:end + 1])
+            span = summary.distance if by == 'distance' else summary.time_spent
+            if span >= length - 1e-9:
+                value = SUMMARY_OF[metric](summary)
+                if value is not None:
+                    found.append((value, start, end))
+                break
+    return found
+
+
+@pytest.mark.parametrize('by, length', [('distance', 50), ('distance', 120), ('duration', 10), ('duration', 30)])
+@pytest.mark.parametrize('metric', list(windows.METRICS))
+def test_same_as_brute_force(metric, by, length):
+    trkpts = GPX('fixtures/short_track.gpx').trkpts
+    rolling = windows.RollingWindows.of(trkpts)
+    found = brute_force(trkpts, metric, by, length)
+    larger = windows.METRICS[metric]
+
+    best = rolling.best(metric, by, length)
+    assert best.value == pytest.approx((max if larger else min)(found)[0])
+    assert best.start_time == trkpts[best.start_idx].time()
+    assert best.end_time == trkpts[best.end_idx].time()
+    assert rolling.worst(metric, by, length).value == pytest.approx((min if larger else max)(found)[0])
+
+
+def test_no_window():
+    trkpts = GPX('fixtures/short_track.gpx').trkpts
+    assert windows.best_window(trkpts, 'speed', 'distance', 10 ** 6) is None
+    assert windows.best_window([], 'speed', 'duration', 60) is None
+
+
+def test_time_needed():
+    gpx = GPX('fixtures/short_track.gpx')
+    gpx.store.time[5] = NO_TIME
+    rolling = windows.RollingWindows(*gpx.store.columns())
+
+    assert rolling.best('distance', 'distance', 100).value >= 100
+    with pytest.raises(ValueError):
+        rolling.best('speed', 'distance', 100)
+    with pytest.raises(ValueError):
+        rolling.best('distance', 'duration', 10)
+    with pytest.raises(ValueError):
+        rolling.best('power', 'distance', 100)
@@ -0,0 +1,230 @@
+import copy
+import gzip
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+
+import profiling
+import serializer
+import timestamp
+from track_store import TrackStore
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+
+################################################################################
+# XML backends
+#
+# A backend parses GPX files, builds the store of a trkseg and writes the
+# tree back. Both read and edit the same kind of tree (find, attrib, text,
+# slicing), GPX code only goes through the backend for the rest.
+#
+# The backend of GPX(backend=None) is the one named by the GPX_BACKEND
+# environment variable, else etree: lxml parses faster, etree writes and
+# edits faster, see README.
+###
+
+def get_backend(name=None):
+    if name is None:
+        name = os.environ.get('GPX_BACKEND') or 'etree'
+
+    if name == 'etree':
+        return ELEMENT_TREE
+    if name == 'lxml':
+        if etree is None:
+            raise ImportError('the lxml backend needs lxml, see requirements.txt')
+        return LXML
+    raise ValueError(f'unknown XML backend {name!r}, expected etree or lxml')
+
+
+# backend of an element of a parsed tree
+def backend_of(element):
+    if isinstance(element, ET.Element):
+        return ELEMENT_TREE
+    return LXML
+
+
+class ElementTreeBackend:
+    name = 'etree'
+
+    def parse(self, file_name):
+        return ET.parse(file_name)
+
+    # same as copy.deepcopy, which is a few times slower on ElementTree
+    def copy_element(self, element):
+        copied = element.makeelement(element.tag, element.attrib)
+        copied.text = element.text
+        copied.tail = element.tail
+        copied.extend(map(self.copy_element, element))
+        return copied
+
+    def load_store(self, trkseg, namespace):
+        return TrackStore.from_elements(list(trkseg), namespace)
+
+    def load_extensions(self, trkseg, namespace, tags):
+        return extension_columns(list(trkseg.iter()), namespace, tags, len(trkseg))
+
+    # tags: children of the TrackPointExtension elements to remove
+    def strip_extensions(self, trkseg, parent_tag, tags):
+        for parent in trkseg.iter(parent_tag):
+            for child in [child for child in parent if child.tag in tags]:
+                parent.remove(child)
+
+    # segments: List[(trkseg element, TrackStore of its trkpts)]
+    def write(self, file_path, root, segments, lat_p, lon_p, ele_p, compress=None):
+        serializer.write_gpx(file_path, root, segments, lat_p, lon_p, ele_p, compress=compress)
+
+
+# Parsing, extraction and serialization in C. Comments and processing
+# instructions are dropped like ElementTree does, the output keeps the
+# namespace prefixes of the input file.
+class LxmlBackend:
+    name = 'lxml'
+
+    def __init__(self):
+        self.xpaths = {}
+
+    # namespace: of the g: prefix, extension: of the x: prefix
+    def xpath(self, path, namespace, extension=None):
+        key = (path, namespace, extension)
+        if key not in self.xpaths:
+            namespaces = {'g': namespace[1:-1]}
+            if extension is not None:
+                namespaces['x'] = extension[1:-1]
+            self.xpaths[key] = etree.XPath(path, namespaces=namespaces, smart_strings=False)
+        return self.xpaths[key]
+
+    def parse(self, file_name):
+        parser = etree.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True)
+        return etree.parse(file_name, parser)
+
+    def copy_element(self, element):
+        return copy.deepcopy(element)
+
+    # columns in bulk through XPath when every trkpt has an ele and a time,
+    # one element at a time like ElementTree otherwise
+    def load_store(self, trkseg, namespace):
+        elements = list(trkseg)
+        n = len(elements)
+        lat = self.xpath('g:trkpt/@lat', namespace)(trkseg)
+        lon = self.xpath('g:trkpt/@lon', namespace)(trkseg)
+        ele = self.xpath('g:trkpt/g:ele[1]/text()', namespace)(trkseg)
+        time = self.xpath('g:trkpt/g:time[1]/text()', namespace)(trkseg)
+        if not (len(lat) == len(lon) == len(ele) == len(time) == n):
+            return TrackStore.from_elements(elements, namespace)
+
+        with profiling.stage('parse_times'):
+            time = timestamp.parse_times(time)
+
+        return TrackStore(
+            np.array(lat, dtype=np.float64),
+            np.array(lon, dtype=np.float64),
+            np.array(ele, dtype=np.float64),
+            time,
+            elements
+        )
+
+    # lxml filters the trkpts and the tags in C
+    def load_extensions(self, trkseg, namespace, tags):
+        return extension_columns(list(trkseg.iter(f'{namespace}trkpt', *tags)), namespace, tags, len(trkseg))
+
+    # one XPath per tag, libxml2 sorts the nodes of a union slowly
+    def strip_extensions(self, trkseg, parent_tag, tags):
+        namespace = trkseg.tag[:-len('trkseg')]
+        extension, parent = parent_tag[1:].split('}')
+        for tag in tags:
+            path = f'g:trkpt/g:extensions/x:{parent}/x:{tag.split("}")[1]}'
+            for element in self.xpath(path, namespace, f'{{{extension}}}')(trkseg):
+                element.getparent().remove(element)
+
+    # The rounded values are put in the tree for tree.write and the texts
+    # of the tree are put back afterwards, the tree and the store are left
+    # as they are. Same bytes as serializer.write_gpx.
+    @profiling.timed
+    def write(self, file_path, root, segments, lat_p, lon_p, ele_p, compress=None):
+        if compress is None:
+            compress = str(file_path).endswith('.gz')
+
+        # (elements, lat texts, lon texts) and (ele elements, texts) to put back
+        attributes = []
+        texts = []
+        try:
+            for trkseg, store in segments:
+                namespace = trkseg.tag[:-len('trkseg')]
+                elements = store.elements
+                attributes.append((
+                    elements,
+                    self.xpath('g:trkpt/@lat', namespace)(trkseg),
+                    self.xpath('g:trkpt/@lon', namespace)(trkseg)
+                ))
+                eles = self.xpath('g:trkpt/g:ele[1]', namespace)(trkseg)
+                if len(eles) != len(store):
+                    eles = [element.find(f'{namespace}ele') for element in elements]
+                ele_texts = self.xpath('g:trkpt/g:ele[1]/text()', namespace)(trkseg)
+                if len(ele_texts) != len(eles):
+                    # an ele without text, or a trkpt without ele
+                    ele_texts = [None if element is None else element.text for element in eles]
+                texts.append((eles, ele_texts))
+
+                lat = serializer.format_column(store.lat, lat_p, '%.7f')
+                lon = serializer.format_column(store.lon, lon_p, '%.7f')
+                ele = serializer.format_column(store.ele, ele_p, '%.1f')
+                for element, lat_text, lon_text in zip(elements, lat, lon):
+                    element.set('lat', lat_text)
+                    element.set('lon', lon_text)
+                for element, ele_text in zip(eles, ele):
+                    if element is not None:
+                        element.text = ele_text
+
+            if compress:
+                out = gzip.open(file_path, 'wb', compresslevel=6)
+            else:
+                out = open(file_path, 'wb')
+            with out:
+                out.write(b"<?xml version='1.0' encoding='utf-8'?>\n")
+                root.getroottree().write(out, encoding='utf-8', xml_declaration=False)
+        finally:
+            for elements, lat, lon in attributes:
+                for element, lat_text, lon_text in zip(elements, lat, lon):
+                    element.set('lat', lat_text)
+                    element.set('lon', lon_text)
+            for eles, ele in texts:
+                for element, ele_text in zip(eles, ele):
+                    if element is not None:
+                        element.text = ele_text
+
+
+# float64 column per tag, the first element of the tag in every trkpt, NaN
+# without; nodes: the trkpts of a trkseg and their descendants in document
+# order, at least those of the tags
+def extension_columns(nodes, namespace, tags, n):
+    node_tags = np.array([node.tag for node in nodes], dtype=object)
+    rows = np.cumsum(node_tags == f'{namespace}trkpt') - 1
+
+    columns = []
+    for tag in tags:
+        found = np.flatnonzero(node_tags == tag)
+        found_rows, first = np.unique(rows[found], return_index=True)
+        column = np.full(n, np.nan, dtype=np.float64)
+        column[found_rows] = np.array([nodes[i].text for i in found[first].tolist()], dtype=np.float64)
+        columns.append(column)
+    return columns
+
+
+# element of the same kind and document as model
+def make_element(model, tag, attrib=None):
+    return model.makeelement(tag, attrib or {})
+
+
+# copies of the children of a template, to put in a new element
+def copied_children(children):
+    if not children:
+        return []
+    return list(map(backend_of(children[0]).copy_element, children))
+
+
+ELEMENT_TREE = ElementTreeBackend()
+LXML = LxmlBackend() if etree is not None else None
@@ -0,0 +1,110 @@
+import gzip
+import pytest
+from gpx import *
+import xml_backend
+
+BACKENDS = ['etree'] + (['lxml'] if xml_backend.etree is not None else [])
+
+
+def test_get_backend(monkeypatch):
+    monkeypatch.setenv('GPX_BACKEND', 'etree')
+    assert xml_backend.get_backend() is xml_backend.ELEMENT_TREE
+    assert GPX('fixtures/short_track.gpx').backend.name == 'etree'
+
+    monkeypatch.delenv('GPX_BACKEND')
+    assert xml_backend.get_backend().name == 'etree'
+
+    with pytest.raises(ValueError):
+        xml_backend.get_backend('minidom')
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_load_store(backend):
+    reference = GPX('fixtures/multi_track.gpx', backend='etree')
+    gpx = GPX('fixtures/multi_track.gpx', backend=backend)
+
+    for segment, expected in zip(gpx.segments, reference.segments):
+        for got, want in zip(segment.store.columns(), expected.store.columns()):
+            assert np.array_equal(got, want)
+        assert [element.get('lat') for element in segment.store.elements] == \
+            [element.get('lat') for element in expected.store.elements]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_load_store_without_ele(backend):
+    gpx = GPX('fixtures/short_track.gpx', backend=backend)
+    trkpt = gpx.trkseg[3]
+    trkpt.remove(trkpt.find(f'{gpx.namespace}ele'))
+
+    gpx.segments[0].load_store()
+    store = gpx.store
+    assert np.isnan(store.ele[3])
+    assert store.ele[4] == GPX('fixtures/short_track.gpx', backend='etree').trkpts[4].ele()
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_same_track_written(backend, tmp_path):
+    written = []
+    for name in ['etree', backend]:
+        gpx = GPX('fixtures/multi_track.gpx', lat_p=6, lon_p=6, ele_p=0, backend=name)
+        set_by_speed(gpx, 5, gpx.trkpts[2].time(), gpx.trkpts[8].time(), rng=3)
+        gpx.write(str(tmp_path / f'{name}.gpx'))
+        gpx.write(str(tmp_path / f'{name}.gpx.gz'))
+        assert gzip.open(tmp_path / f'{name}.gpx.gz').read() == (tmp_path / f'{name}.gpx').read_bytes()
+        written.append(GPX(str(tmp_path / f'{name}.gpx'), backend='etree'))
+
+    hr_tag = '{http://www.garmin.com/xmlschemas/TrackPointExtension/v1}hr'
+    for segment, expected in zip(*(gpx.segments for gpx in written)):
+        for got, want in zip(segment.store.columns(), expected.store.columns()):
+            assert np.array_equal(got, want)
+        assert [element.find(f'.//{hr_tag}').text for element in segment.store.elements] == \
+            [element.find(f'.//{hr_tag}').text for element in expected.store.elements]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_write_leaves_tree_as_is(backend, tmp_path):
+    gpx = GPX('fixtures/multi_track.gpx', backend=backend)
+    before = [segment.store.columns() for segment in gpx.segments]
+    gpx.write(str(tmp_path / 'out.gpx'))
+
+    # same bytes from both backends, the tree still holds the values of the store
+    reference = GPX('fixtures/multi_track.gpx', backend='etree')
+    reference.write(str(tmp_path / 'etree.gpx'))
+    assert (tmp_path / 'out.gpx').read_bytes() == (tmp_path / 'etree.gpx').read_bytes()
+    for segment, columns in zip(gpx.segments, before):
+        segment.load_store()
+        for got, want in zip(segment.store.columns(), columns):
+            assert np.array_equal(got, want, equal_nan=True)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_extensions(backend):
+    gpx = GPX('fixtures/multi_track.gpx', backend=backend)
+    trkpt = gpx.trkseg[3]
+    trkpt.remove(trkpt.find(f'{gpx.namespace}extensions'))
+
+    columns = gpx.extensions()
+    assert list(columns) == ['hr', 'atemp', 'cad']
+    assert columns['hr'][:3].tolist() == [165, 150, 160]
+    assert np.isnan(columns['hr'][3]) and np.isnan(columns['cad'][3])
+    for name, column in columns.items():
+        assert len(column) == len(gpx.store)
+        tag = f'{TRACK_POINT_EXTENSION}{name}'
+        assert column[4] == float(gpx.trkseg[4].find(f'.//{tag}').text)
+
+    assert gpx.segments[2].extensions(['cad'])['cad'].tolist() == \
+        [float(element.find(f'.//{TRACK_POINT_EXTENSION}cad').text) for element in gpx.segments[2].element]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_remove_extension(backend, tmp_path):
+    gpx = GPX('fixtures/multi_track.gpx', backend=backend)
+    cad = [segment.extensions(['cad'])['cad'] for segment in gpx.segments]
+    gpx.remove_extension()
+    gpx.write(str(tmp_path / 'stripped.gpx'))
+
+    stripped = GPX(str(tmp_path / 'stripped.gpx'), backend='etree')
+    for segment, expected in zip(stripped.segments, cad):
+        columns = segment.extensions()
+        assert np.all(np.isnan(columns['hr'])) and np.all(np.isnan(columns['atemp']))
+        assert np.array_equal(columns['cad'], expected)